@@ -0,0 +1,92 @@
+"""
+Микробенчмарк получения деталей услуги на каталоге из 10k услуг.
+
+Сравнивает прежний get_service_details (json.load файла + линейный поиск
+на каждый вызов) с индексом ServiceCatalogue (поиск в dict).
+
+Запуск:
+    python -m benchmarks.catalogue_lookup --services 10000
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Dict, Optional
+
+# Настройки приложения валидируются при импорте, для бенчмарка хватит заглушек
+for _name in ("TELEGRAM_BOT_TOKEN", "OPENROUTER_API_KEY", "ONEC_API_URL",
+              "ONEC_CLIENT_ID", "ONEC_CLIENT_SECRET"):
+    os.environ.setdefault(_name, "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from src.knowledge.catalogue import ServiceCatalogue  # noqa: E402
+
+
+def make_catalogue(path: str, count: int):
+    """Генерирует синтетический каталог в формате services_knowledge_base.json"""
+    services = [
+        {
+            "id": f"service_{i}",
+            "category": "Обучающие курсы и программы",
+            "sub_category": "Основные курсы",
+            "name": f"Курс пилотирования №{i}",
+            "courseCode": f"COURSE_{i}",
+            "details": {"Цена": f"{10000 + i} ₽", "Длительность": "4 месяца"},
+            "full_description": "Обучение полетам на FPV-дронах для начинающих. " * 4,
+        }
+        for i in range(count)
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"services": services}, f, ensure_ascii=False)
+
+
+def legacy_get_service_details(services_file: str, service_id: str) -> Optional[Dict]:
+    """Прежняя реализация: перечитывание файла и линейный поиск"""
+    with open(services_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    for service in data.get('services', []):
+        if service["id"] == service_id:
+            return service
+    return None
+
+
+def measure(label: str, func, ids, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for service_id in ids:
+            func(service_id)
+    elapsed = time.perf_counter() - started
+    calls = repeat * len(ids)
+    print(f"{label:<24} {elapsed / calls * 1e6:12.2f} мкс/вызов  ({calls} вызовов)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск деталей услуги по ID")
+    parser.add_argument("--services", type=int, default=10000, help="Размер каталога")
+    parser.add_argument("--lookups", type=int, default=20, help="Запросов для прежней реализации")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "services.json")
+        make_catalogue(path, args.services)
+        ids = [f"service_{random.randrange(args.services)}" for _ in range(args.lookups)]
+
+        print(f"Каталог: {args.services} услуг, {os.path.getsize(path) / 1e6:.1f} МБ")
+        measure("до (json.load + скан)", lambda i: legacy_get_service_details(path, i), ids, 1)
+
+        started = time.perf_counter()
+        catalogue = ServiceCatalogue(path, check_interval=5.0)
+        print(f"{'загрузка индекса':<24} {(time.perf_counter() - started) * 1000:12.2f} мс (один раз)")
+
+        def indexed(service_id: str):
+            catalogue.refresh_if_changed()
+            return catalogue.get(service_id)
+
+        measure("после (dict-индекс)", indexed, ids, 10000)
+
+
+if __name__ == "__main__":
+    main()
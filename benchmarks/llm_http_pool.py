@@ -0,0 +1,97 @@
+"""
+Бенчмарк HTTP клиента OpenRouter: клиент на каждый запрос против общего пула.
+
+Запросы идут в локальную заглушку (benchmarks/openrouter_stub.py), поэтому
+измеряется только накладной расход клиента: создание AsyncClient (SSL
+контекст) и установка соединения. Реальный TLS-хендшейк до openrouter.ai
+добавляет к "до" еще сотни миллисекунд.
+
+Запуск:
+    python -m benchmarks.llm_http_pool --requests 2000 --concurrency 20
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from typing import List
+
+import httpx
+
+# Настройки приложения валидируются при импорте, для бенчмарка хватит заглушек
+for _name in ("TELEGRAM_BOT_TOKEN", "OPENROUTER_API_KEY", "ONEC_API_URL",
+              "ONEC_CLIENT_ID", "ONEC_CLIENT_SECRET"):
+    os.environ.setdefault(_name, "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from benchmarks.openrouter_stub import OpenRouterStub  # noqa: E402
+from src.llm.client import LLMClient  # noqa: E402
+
+PAYLOAD = {
+    "model": "qwen/qwen3-14b:free",
+    "messages": [{"role": "user", "content": "Сколько стоит курс?"}],
+    "max_tokens": 800,
+}
+
+
+async def run(label: str, send, requests: int, concurrency: int):
+    latencies: List[float] = []
+    queue = iter(range(requests))
+
+    async def worker():
+        for _ in queue:
+            started = time.perf_counter()
+            await send()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(
+        f"{label:<26} {requests / elapsed:8.0f} req/s  "
+        f"p50={latencies[len(latencies) // 2]:7.2f}мс  "
+        f"p99={latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]:7.2f}мс"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Клиент на запрос против пула соединений")
+    parser.add_argument("--requests", type=int, default=2000, help="Всего запросов")
+    parser.add_argument("--concurrency", type=int, default=20, help="Одновременных запросов")
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="Задержка ответа заглушки, мс")
+    args = parser.parse_args()
+
+    stub = OpenRouterStub(delay_ms=args.delay_ms)
+    await stub.start()
+
+    async def per_call_client():
+        # Как было: новый AsyncClient (и новое соединение) на каждый запрос
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            response = await client.post(stub.url, json=PAYLOAD)
+            response.raise_for_status()
+
+    llm = LLMClient()
+    await llm.start()
+    pooled = await llm._get_http_client()
+
+    async def pooled_client():
+        response = await pooled.post(stub.url, json=PAYLOAD)
+        response.raise_for_status()
+
+    print(f"Запросов: {args.requests}, одновременно: {args.concurrency}")
+    connections = stub.connections
+    await run("до (клиент на запрос)", per_call_client, args.requests, args.concurrency)
+    print(f"{'':<26} соединений: {stub.connections - connections}")
+
+    connections = stub.connections
+    await run("после (общий пул)", pooled_client, args.requests, args.concurrency)
+    print(f"{'':<26} соединений: {stub.connections - connections}")
+
+    await llm.close()
+    await stub.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+"""
+Бенчмарк статистики LLM запросов для /stats.
+
+Заполняет корзины LLMLogger (минутные и часовые) запросами за неделю и меряет
+стоимость записи одного запроса и get_statistics за 1ч/24ч/7д. Для
+сравнения приведена нижняя граница прежней реализации: только фильтр
+всех записей по времени с разбором ISO-строк (без остальных проходов).
+
+Запуск:
+    python -m benchmarks.llm_stats --requests 200000 --users 5000
+"""
+
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+# Настройки приложения валидируются при импорте, для бенчмарка хватит заглушек
+for _name in ("TELEGRAM_BOT_TOKEN", "OPENROUTER_API_KEY", "ONEC_API_URL",
+              "ONEC_CLIENT_ID", "ONEC_CLIENT_SECRET"):
+    os.environ.setdefault(_name, "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from src.llm.logger import LLMLogger, LLMRequestMetrics  # noqa: E402
+
+WEEK_MINUTES = 7 * 24 * 60
+
+
+def make_metrics(rng: random.Random, users: int, timestamp: str) -> LLMRequestMetrics:
+    success = rng.random() < 0.95
+    return LLMRequestMetrics(
+        timestamp=timestamp, user_id=str(100000000 + rng.randrange(users)), model="qwen/qwen3-14b:free",
+        request_size_chars=2500, messages_count=4, has_context=True, has_history=rng.random() < 0.6,
+        response_time_ms=rng.uniform(800, 4000), success=success,
+        prompt_tokens=900 if success else 0, completion_tokens=250 if success else 0,
+        total_tokens=1150 if success else 0, cached_tokens=512 if success and rng.random() < 0.5 else 0,
+        error_type=None if success else "timeout", outcome="success" if success else "error",
+        token_breakdown={"system": 400, "user": 30, "services": 350, "history": 120, "total": 900, "dropped": 0}
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Статистика LLM запросов")
+    parser.add_argument("--requests", type=int, default=200000, help="Запросов за неделю")
+    parser.add_argument("--users", type=int, default=5000, help="Уникальных пользователей")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    now = datetime.now()
+    current_minute = int(time.time() // 60)
+    stats_logger = LLMLogger()
+
+    # Запросы равномерно за неделю: корзины заполняются напрямую по минутам
+    records = []
+    started = time.perf_counter()
+    for i in range(args.requests):
+        minutes_ago = WEEK_MINUTES - 1 - i * WEEK_MINUTES // args.requests
+        metrics = make_metrics(rng, args.users, (now - timedelta(minutes=minutes_ago)).isoformat())
+        stats_logger._bucket(current_minute - minutes_ago).add(metrics)
+        records.append(metrics)
+    record_us = (time.perf_counter() - started) / args.requests * 1e6
+
+    print(f"Запросов: {args.requests} за 7 дней, пользователей: {args.users}, "
+          f"корзин: {len(stats_logger._minutes)} минутных + {len(stats_logger._hours)} часовых")
+    print(f"{'запись запроса (с генерацией)':<34} {record_us:8.2f} мкс")
+
+    for hours in (1, 24, 168):
+        started = time.perf_counter()
+        stats = stats_logger.get_statistics(hours)
+        stats_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        cutoff = now.timestamp() - hours * 3600
+        legacy = [m for m in records if datetime.fromisoformat(m.timestamp).timestamp() > cutoff]
+        legacy_ms = (time.perf_counter() - started) * 1000
+        exact_users = len({m.user_id for m in legacy})
+
+        print(
+            f"{f'get_statistics({hours}ч)':<34} {stats_ms:8.1f} мс  "
+            f"(прежний фильтр {legacy_ms:8.1f} мс), запросов {stats['total_requests']}/{len(legacy)}, "
+            f"пользователей {stats['unique_users']}/{exact_users}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Локальная заглушка OpenRouter для бенчмарков.
+
+Минимальный HTTP/1.1 сервер на asyncio с keep-alive: на любой POST отвечает
+JSON в формате chat/completions после заданной задержки, а на запрос
+со "stream": true - потоком SSE по одному слову.
+"""
+
+import asyncio
+import json
+from typing import Optional
+
+
+class OpenRouterStub:
+    """HTTP сервер-заглушка chat/completions"""
+
+    def __init__(self, delay_ms: float = 0.0, content: str = "Ответ заглушки"):
+        self.delay_seconds = delay_ms / 1000
+        self.content = content
+        self.connections = 0
+        self.requests = 0
+        self._server: Optional[asyncio.base_events.Server] = None
+        self.port = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/api/v1/chat/completions"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _completion_body(self) -> bytes:
+        return json.dumps({
+            "choices": [{"message": {"role": "assistant", "content": self.content}}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+        }, ensure_ascii=False).encode("utf-8")
+
+    async def _write_stream(self, writer: asyncio.StreamWriter):
+        """Ответ в формате SSE с chunked transfer encoding"""
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"Connection: keep-alive\r\n\r\n"
+        )
+
+        events = [": OPENROUTER PROCESSING"]
+        for word in self.content.split(" "):
+            events.append("data: " + json.dumps(
+                {"choices": [{"delta": {"content": word + " "}}]}, ensure_ascii=False
+            ))
+        events.append("data: " + json.dumps({
+            "choices": [{"delta": {}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+        }))
+        events.append("data: [DONE]")
+
+        for event in events:
+            data = (event + "\n\n").encode("utf-8")
+            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                headers = {}
+                for line in head.decode("latin-1").split("\r\n")[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                request = await reader.readexactly(int(headers.get("content-length", "0")))
+                self.requests += 1
+
+                if self.delay_seconds:
+                    await asyncio.sleep(self.delay_seconds)
+
+                if json.loads(request or b"{}").get("stream"):
+                    await self._write_stream(writer)
+                    continue
+
+                body = self._completion_body()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                    b"Connection: keep-alive\r\n\r\n" + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,107 @@
+"""
+Бенчмарк задержки RAG-обработчика при одновременных пользователях.
+
+Сравнивает синхронный поиск прямо в event loop (как было) с asearch(),
+который выполняется в ограниченном пуле потоков. Обработчик моделируется
+так же, как smart_consultation_handler: поиск + детали услуг + ожидание LLM.
+
+Запуск:
+    python -m benchmarks.search_latency --users 50
+    python -m benchmarks.search_latency --users 50 --real   # настоящая модель и ChromaDB
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from typing import Dict, List, Optional
+
+# Настройки приложения валидируются при импорте, для бенчмарка хватит заглушек
+for _name in ("TELEGRAM_BOT_TOKEN", "OPENROUTER_API_KEY", "ONEC_API_URL",
+              "ONEC_CLIENT_ID", "ONEC_CLIENT_SECRET"):
+    os.environ.setdefault(_name, "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from src.knowledge.search import KnowledgeSearcher  # noqa: E402
+
+
+class StubSearcher(KnowledgeSearcher):
+    """Поисковик без модели: имитирует CPU-работу эмбеддинга и ChromaDB"""
+
+    def __init__(self, search_ms: float):
+        # Модель и ChromaDB не загружаем, поиск имитируется блокирующим ожиданием
+        self.search_seconds = search_ms / 1000
+
+    def search(self, query: str, limit: int = 3) -> List[Dict]:
+        time.sleep(self.search_seconds)
+        return [{"id": f"service_{i}", "name": query, "relevance_score": 50.0} for i in range(limit)]
+
+    def get_service_details(self, service_id: str) -> Optional[Dict]:
+        return {"id": service_id, "full_description": "", "details": {}}
+
+
+async def handler_blocking(searcher: KnowledgeSearcher, query: str, llm_ms: float):
+    """Обработчик как до изменений: поиск блокирует event loop"""
+    results = searcher.search(query, limit=3)
+    for service in results:
+        searcher.get_service_details(service["id"])
+    await asyncio.sleep(llm_ms / 1000)
+
+
+async def handler_pooled(searcher: KnowledgeSearcher, query: str, llm_ms: float):
+    """Обработчик после изменений: поиск в пуле потоков через asearch()"""
+    results = await searcher.asearch(query, limit=3)
+    for service in results:
+        await searcher.aget_service_details(service["id"])
+    await asyncio.sleep(llm_ms / 1000)
+
+
+async def run_scenario(handler, searcher: KnowledgeSearcher, users: int, llm_ms: float) -> List[float]:
+    """Запускает users одновременных обработчиков и возвращает задержки в мс"""
+    latencies: List[float] = []
+
+    async def one_user(i: int):
+        started = time.perf_counter()
+        await handler(searcher, f"сколько стоит курс {i}", llm_ms)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(one_user(i) for i in range(users)))
+    return latencies
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Процентиль по методу ближайшего ранга"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def report(title: str, latencies: List[float]):
+    print(
+        f"{title:<28} p50={percentile(latencies, 50):8.1f}мс  "
+        f"p99={percentile(latencies, 99):8.1f}мс  "
+        f"mean={statistics.mean(latencies):8.1f}мс"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Задержка обработчика при одновременных пользователях")
+    parser.add_argument("--users", type=int, default=50, help="Количество одновременных пользователей")
+    parser.add_argument("--search-ms", type=float, default=30.0, help="Имитируемое время поиска, мс")
+    parser.add_argument("--llm-ms", type=float, default=0.0, help="Имитируемое ожидание LLM, мс")
+    parser.add_argument("--real", action="store_true", help="Использовать настоящий KnowledgeSearcher")
+    args = parser.parse_args()
+
+    searcher = KnowledgeSearcher() if args.real else StubSearcher(args.search_ms)
+
+    # Прогрев (загрузка модели, создание пула)
+    await handler_pooled(searcher, "прогрев", 0)
+
+    print(f"Пользователей: {args.users}, поиск: {'реальный' if args.real else f'{args.search_ms}мс'}")
+    report("до (поиск в event loop)", await run_scenario(handler_blocking, searcher, args.users, args.llm_ms))
+    report("после (asearch, пул)", await run_scenario(handler_pooled, searcher, args.users, args.llm_ms))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,137 @@
+"""
+Бенчмарк памяти сессий диалогов на 100k пользователей.
+
+Сравнивает прежнее представление (dict сессии, dict на сообщение с
+ISO-строками времени, пересборка списка после 20 сообщений) с
+InMemorySessionStore (slotted dataclass, float-время, deque(maxlen)).
+Тексты сообщений берутся из общего пула, поэтому в объем входят только
+структуры сессий, а не сами тексты.
+
+Запуск:
+    python -m benchmarks.session_memory --sessions 100000 --messages 10
+"""
+
+import argparse
+import gc
+import os
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict
+
+# Настройки приложения валидируются при импорте, для бенчмарка хватит заглушек
+for _name in ("TELEGRAM_BOT_TOKEN", "OPENROUTER_API_KEY", "ONEC_API_URL",
+              "ONEC_CLIENT_ID", "ONEC_CLIENT_SECRET"):
+    os.environ.setdefault(_name, "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from src.bot.session_store import InMemorySessionStore  # noqa: E402
+from src.bot.states import MAX_MESSAGES  # noqa: E402
+
+CONTENTS = [f"Сообщение пользователя о курсах пилотирования №{i}" for i in range(64)]
+
+
+class LegacySessions:
+    """Прежняя структура DialogStateManager.sessions"""
+
+    def __init__(self):
+        self.sessions: Dict[str, Dict] = {}
+
+    def touch(self, user_id: str):
+        if user_id not in self.sessions:
+            self.sessions[user_id] = {
+                "messages": [],
+                "state": "consultation",
+                "selected_course": None,
+                "contact_name": None,
+                "phone": None,
+                "created_at": datetime.now().isoformat(),
+                "last_activity": datetime.now().isoformat()
+            }
+        else:
+            self.sessions[user_id]["last_activity"] = datetime.now().isoformat()
+        return self.sessions[user_id]
+
+    def add_message(self, user_id: str, role: str, content: str):
+        session = self.touch(user_id)
+        session["messages"].append({"role": role, "content": content, "timestamp": datetime.now().isoformat()})
+        if len(session["messages"]) > MAX_MESSAGES:
+            session["messages"] = session["messages"][-MAX_MESSAGES:]
+
+    def history(self, user_id: str, limit: int):
+        messages = self.touch(user_id)["messages"][-limit:]
+        return [{"role": m["role"], "content": m["content"]} for m in messages]
+
+
+class CompactSessions:
+    """InMemorySessionStore с теми же вызовами, что делает DialogStateManager"""
+
+    def __init__(self):
+        self.store = InMemorySessionStore(MAX_MESSAGES)
+
+    def touch(self, user_id: str):
+        now = time.time()
+        if self.store.touch(user_id, now) is None:
+            self.store.save_fields(user_id, {
+                "state": "consultation", "selected_course": None, "contact_name": None,
+                "phone": None, "created_at": now, "last_activity": now
+            })
+
+    def add_message(self, user_id: str, role: str, content: str):
+        self.touch(user_id)
+        self.store.append_message(user_id, role, content, time.time())
+
+    def history(self, user_id: str, limit: int):
+        self.touch(user_id)
+        return self.store.get_messages(user_id, limit)
+
+
+def fill(sessions, count: int, messages: int):
+    for i in range(count):
+        user_id = str(100000000 + i)
+        for j in range(messages):
+            role = "user" if j % 2 == 0 else "assistant"
+            sessions.add_message(user_id, role, CONTENTS[(i + j) % len(CONTENTS)])
+
+
+def run(label: str, factory, count: int, messages: int):
+    gc.collect()
+    tracemalloc.start()
+    sessions = factory()
+    fill(sessions, count, messages)
+    gc.collect()
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Время без tracemalloc: заполнение и чтение истории (5 сообщений, как в обработчике)
+    sessions = factory()
+    started = time.perf_counter()
+    fill(sessions, count, messages)
+    add_us = (time.perf_counter() - started) / (count * messages) * 1e6
+
+    history_us = []
+    for _ in range(2):  # второй проход - повторное чтение без новых сообщений
+        started = time.perf_counter()
+        for i in range(count):
+            sessions.history(str(100000000 + i), 5)
+        history_us.append((time.perf_counter() - started) / count * 1e6)
+
+    print(
+        f"{label:<10} {used / 1e6:8.1f} МБ  {used / count:8.0f} Б/сессию  "
+        f"add_message {add_us:6.2f} мкс  история {history_us[0]:6.2f} / {history_us[1]:6.2f} мкс"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Память сессий диалогов")
+    parser.add_argument("--sessions", type=int, default=100000, help="Количество сессий")
+    parser.add_argument("--messages", type=int, default=10, help="Сообщений в сессии")
+    args = parser.parse_args()
+
+    print(f"Сессий: {args.sessions}, сообщений в сессии: {args.messages} (хранится до {MAX_MESSAGES})")
+    run("до", LegacySessions, args.sessions, args.messages)
+    run("после", CompactSessions, args.sessions, args.messages)
+
+
+if __name__ == "__main__":
+    main()
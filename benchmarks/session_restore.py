@@ -0,0 +1,97 @@
+"""
+Бенчмарк снимков и журнала сессий диалогов.
+
+Заполняет InMemorySessionStore синтетическими сессиями, сохраняет снимок,
+добавляет записи журнала и восстанавливает сессии в новое хранилище.
+Меряются: сколько снимок блокирует event loop (копирование ссылок),
+время записи снимка в потоке, время восстановления при старте и
+усиление записи (байт на диске на байт изменений в журнале).
+
+Запуск:
+    python -m benchmarks.session_restore --sessions 100000 --messages 10 --journal 50000
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+# Настройки приложения валидируются при импорте, для бенчмарка хватит заглушек
+for _name in ("TELEGRAM_BOT_TOKEN", "OPENROUTER_API_KEY", "ONEC_API_URL",
+              "ONEC_CLIENT_ID", "ONEC_CLIENT_SECRET"):
+    os.environ.setdefault(_name, "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from src.bot.session_persistence import SNAPSHOT_FILE, SessionPersistence  # noqa: E402
+from src.bot.session_store import InMemorySessionStore  # noqa: E402
+from src.bot.states import MAX_MESSAGES  # noqa: E402
+
+CONTENT = "Расскажите подробнее про курс пилотирования FPV-дронов и стоимость обучения"
+
+
+def content(i: int, j: int) -> str:
+    """Разные строки, как в реальных диалогах (одинаковые pickle сжал бы в ссылки)"""
+    return f"{CONTENT} ({i}-{j})"
+
+
+def add_session(store: InMemorySessionStore, index: int, messages: int):
+    user_id = str(100000000 + index)
+    now = time.time()
+    store.save_fields(user_id, {
+        "state": "consultation", "selected_course": None, "contact_name": None,
+        "phone": None, "created_at": now, "last_activity": now
+    })
+    for j in range(messages):
+        store.append_message(user_id, "user" if j % 2 == 0 else "assistant", content(index, j), now)
+
+
+async def run(directory: str, sessions: int, messages: int, journal: int):
+    store = InMemorySessionStore(MAX_MESSAGES)
+    persistence = SessionPersistence(store, directory, snapshot_interval=3600, flush_interval=3600)
+    persistence.restore()
+
+    for i in range(sessions):
+        add_session(store, i, messages)
+    await persistence.flush()  # В работе журнал дописывается каждую секунду небольшими пачками
+
+    started = time.perf_counter()
+    await persistence.snapshot()
+    snapshot_ms = (time.perf_counter() - started) * 1000 - persistence.snapshot_pause_ms
+    snapshot_mb = os.path.getsize(os.path.join(directory, SNAPSHOT_FILE)) / 1e6
+
+    # Изменения после снимка: новые сообщения в существующих сессиях
+    for i in range(journal):
+        store.append_message(str(100000000 + i % sessions), "user", content(i, messages), time.time())
+    started = time.perf_counter()
+    await persistence.flush()
+    flush_ms = (time.perf_counter() - started) * 1000
+
+    print(f"Сессий: {sessions}, сообщений: {messages}, записей журнала после снимка: {journal}")
+    print(f"{'снимок: пауза event loop':<26} {persistence.snapshot_pause_ms:10.1f} мс")
+    print(f"{'снимок: запись в потоке':<26} {snapshot_ms:10.1f} мс  ({snapshot_mb:.1f} МБ)")
+    print(f"{'журнал: запись пачки':<26} {flush_ms:10.1f} мс")
+
+    restored = InMemorySessionStore(MAX_MESSAGES)
+    restore_stats = SessionPersistence(restored, directory, 3600, 3600).restore()
+    print(f"{'восстановление при старте':<26} {restore_stats['restore_ms']:10.1f} мс  "
+          f"({restore_stats['sessions']} сессий, {restore_stats['replayed']} записей журнала)")
+
+    stats = persistence.get_stats()
+    print(f"{'усиление записи':<26} {stats['write_amplification']:10.2f} x  "
+          f"(журнал {stats['journal_bytes'] / 1e6:.1f} МБ, снимки {stats['snapshot_bytes'] / 1e6:.1f} МБ)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Снимки и журнал сессий")
+    parser.add_argument("--sessions", type=int, default=100000, help="Количество сессий")
+    parser.add_argument("--messages", type=int, default=10, help="Сообщений в сессии")
+    parser.add_argument("--journal", type=int, default=50000, help="Записей журнала после снимка")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(directory, args.sessions, args.messages, args.journal))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Бенчмарк времени старта и памяти поисковика знаний.
+
+Каждый сценарий запускается в отдельном процессе, чтобы честно измерить
+время загрузки и пиковый RSS:
+- before: импорт handlers + два независимых KnowledgeSearcher
+  (как было: по экземпляру в search.py и handlers.py)
+- after: импорт handlers + общий поисковик из реестра (get_knowledge_searcher)
+
+Запуск:
+    python -m benchmarks.startup
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+SCENARIOS = {
+    "before": (
+        "import src.bot.handlers\n"
+        "from src.knowledge.search import KnowledgeSearcher\n"
+        "KnowledgeSearcher()\n"
+        "KnowledgeSearcher()\n"
+    ),
+    "after": (
+        "import src.bot.handlers\n"
+        "from src.knowledge.search import get_knowledge_searcher\n"
+        "get_knowledge_searcher()\n"
+        "get_knowledge_searcher()\n"
+    ),
+}
+
+RUNNER = """
+import json, resource, time
+started = time.perf_counter()
+{code}
+print(json.dumps({{
+    "seconds": time.perf_counter() - started,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}}))
+"""
+
+
+def run_scenario(code: str) -> dict:
+    """Запускает сценарий в отдельном процессе и возвращает время и пиковый RSS"""
+    env = dict(os.environ)
+    for name in ("TELEGRAM_BOT_TOKEN", "OPENROUTER_API_KEY", "ONEC_API_URL",
+                 "ONEC_CLIENT_ID", "ONEC_CLIENT_SECRET"):
+        env.setdefault(name, "benchmark")
+    env.setdefault("LOG_LEVEL", "WARNING")
+
+    result = subprocess.run(
+        [sys.executable, "-c", RUNNER.format(code=code)],
+        env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    for name, code in SCENARIOS.items():
+        metrics = run_scenario(code)
+        print(f"{name:<8} старт={metrics['seconds']:6.2f}с  RSS={metrics['rss_mb']:7.1f}МБ")
+
+
+if __name__ == "__main__":
+    main()
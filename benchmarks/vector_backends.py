@@ -0,0 +1,134 @@
+"""
+Бенчмарк хранилищ векторного индекса: ChromaDB против NumPy.
+
+Каждое хранилище измеряется в отдельном процессе на одинаковых синтетических
+нормализованных векторах (размерность all-MiniLM-L6-v2). Меряются время
+открытия уже построенного индекса, задержка запроса top-k и пиковый RSS.
+
+Запуск:
+    python -m benchmarks.vector_backends --vectors 2000 --queries 500
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Настройки приложения валидируются при импорте, для бенчмарка хватит заглушек
+for _name in ("TELEGRAM_BOT_TOKEN", "OPENROUTER_API_KEY", "ONEC_API_URL",
+              "ONEC_CLIENT_ID", "ONEC_CLIENT_SECRET"):
+    os.environ.setdefault(_name, "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+DIMENSION = 384
+
+
+def random_unit_vectors(count: int, seed: int) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((count, DIMENSION)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def open_backend(backend: str, path: str):
+    from src.knowledge.backends import ChromaBackend, NumpyBackend
+
+    if backend == "chroma":
+        return ChromaBackend(path)
+    return NumpyBackend(path)
+
+
+def import_backend(backend: str):
+    """Импорт зависимостей хранилища до замера времени открытия"""
+    import src.knowledge.backends  # noqa: F401
+
+    if backend == "chroma":
+        import chromadb  # noqa: F401
+
+
+def run_child(backend: str, vectors: int, queries: int, limit: int) -> dict:
+    """Измерения внутри дочернего процесса"""
+    with tempfile.TemporaryDirectory() as path:
+        # Построение индекса (в отдельном процессе, чтобы не влиять на RSS замера)
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.vector_backends", "--build", backend,
+             "--path", path, "--vectors", str(vectors)],
+            check=True
+        )
+
+        import_backend(backend)
+        started = time.perf_counter()
+        index = open_backend(backend, path)
+        open_seconds = time.perf_counter() - started
+
+        query_vectors = random_unit_vectors(queries, seed=2)
+        latencies = []
+        for vector in query_vectors:
+            started = time.perf_counter()
+            index.query(vector[np.newaxis, :], limit)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        latencies.sort()
+        return {
+            "open_ms": open_seconds * 1000,
+            "p50_ms": latencies[len(latencies) // 2],
+            "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+
+
+def build(backend: str, path: str, vectors: int):
+    """Строит индекс из синтетических векторов"""
+    index = open_backend(backend, path)
+    ids = [f"service_{i}" for i in range(vectors)]
+    metadatas = [
+        {"id": service_id, "name": service_id, "category": "", "courseCode": "", "price": ""}
+        for service_id in ids
+    ]
+    index.upsert(ids, random_unit_vectors(vectors, seed=1), metadatas, ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ChromaDB против NumPy индекса")
+    parser.add_argument("--vectors", type=int, default=2000, help="Количество векторов в индексе")
+    parser.add_argument("--queries", type=int, default=500, help="Количество запросов")
+    parser.add_argument("--limit", type=int, default=3, help="top-k")
+    parser.add_argument("--backends", default="chroma,numpy", help="Хранилища через запятую")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--build", help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.build:
+        build(args.build, args.path, args.vectors)
+        return
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.vectors, args.queries, args.limit)))
+        return
+
+    print(f"Векторов: {args.vectors}, запросов: {args.queries}, top-{args.limit}")
+    for backend in args.backends.split(","):
+        result = subprocess.run(
+            [sys.executable, "-m", "benchmarks.vector_backends", "--child", backend,
+             "--vectors", str(args.vectors), "--queries", str(args.queries), "--limit", str(args.limit)],
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            print(f"{backend:<8} ошибка: {result.stderr.strip().splitlines()[-1]}")
+            continue
+
+        metrics = json.loads(result.stdout.strip().splitlines()[-1])
+        print(
+            f"{backend:<8} открытие={metrics['open_ms']:8.1f}мс  "
+            f"p50={metrics['p50_ms']:7.3f}мс  p99={metrics['p99_ms']:7.3f}мс  "
+            f"RSS={metrics['rss_mb']:6.1f}МБ"
+        )
+
+
+if __name__ == "__main__":
+    main()
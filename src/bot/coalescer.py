@@ -0,0 +1,151 @@
+"""
+Последовательная обработка сообщений одного пользователя.
+
+Первое сообщение обрабатывается сразу. Если новое сообщение приходит, пока
+предыдущее еще обрабатывается, устаревшая генерация отменяется, а ее
+вопросы переходят в следующий запрос, который ждет окно COALESCE_WINDOW_MS:
+сообщения, пришедшие подряд, объединяются в один запрос к LLM. Так
+пользователь получает один ответ на все сообщения, а история диалога
+не перемешивается. Обработчик
+вызывает mark_answered, когда ответ готов к отправке: после этого отмена
+уже не вернет вопросы в очередь и они не получат второй ответ.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Generic, List, Optional, TypeVar
+from src.config.settings import settings, logger
+
+T = TypeVar("T")
+
+
+class _UserQueue(Generic[T]):
+    """Неотвеченные сообщения пользователя и текущая задача их обработки"""
+
+    __slots__ = ("pending", "task")
+
+    def __init__(self):
+        self.pending: List[T] = []
+        self.task: Optional[asyncio.Task] = None
+
+
+def _remove(queue: _UserQueue[T], items: List[T]):
+    """Удаляет сообщения из очереди (по идентичности объектов, повторный вызов безопасен)"""
+    answered = {id(item) for item in items}
+    queue.pending[:] = [item for item in queue.pending if id(item) not in answered]
+
+
+def history_before(history: List[Dict], questions: List[str]) -> List[Dict]:
+    """
+    История без текущих вопросов (они уже сохранены и передаются в LLM отдельно)
+
+    Вопросы ищутся с конца истории по порядку, а не только в хвосте: пока
+    отправлялся прошлый ответ, новый вопрос мог записаться в историю раньше него.
+    """
+    remaining = list(questions)
+    result = list(history)
+    for index in range(len(result) - 1, -1, -1):
+        if not remaining:
+            break
+        message = result[index]
+        if message.get("role") == "user" and message.get("content") == remaining[-1]:
+            del result[index]
+            remaining.pop()
+    return result
+
+
+class RequestCoalescer(Generic[T]):
+    """Объединяет быстрые сообщения пользователя и отменяет устаревшие ответы"""
+
+    def __init__(self, window_ms: float):
+        """
+        Args:
+            window_ms: Сколько ждать следующее сообщение, если предыдущее еще обрабатывается, мс
+        """
+        self.window_seconds = window_ms / 1000
+        self._queues: Dict[str, _UserQueue[T]] = {}
+        self.merged_messages = 0
+        self.cancelled_tasks = 0
+
+    async def submit(self, user_id: str, item: T, process: Callable[[List[T]], Awaitable[None]]):
+        """
+        Ставит сообщение в очередь пользователя и ждет завершения обработки
+
+        Если до окончания обработки придет следующее сообщение, текущая
+        задача отменяется и метод просто возвращается: ответ на все
+        сообщения отправит обработчик последнего.
+
+        Args:
+            user_id: Идентификатор пользователя
+            item: Сообщение
+            process: Обработчик всех неотвеченных сообщений пользователя
+        """
+        queue = self._queues.setdefault(user_id, _UserQueue())
+        queue.pending.append(item)
+
+        # Пользователь пишет подряд: ждем окно, чтобы ответить на все сообщения разом
+        debounce = queue.task is not None and not queue.task.done()
+        if debounce:
+            queue.task.cancel()
+            self.cancelled_tasks += 1
+            logger.info(f"⏭️ Новое сообщение от {user_id}: предыдущий ответ отменен")
+
+        task = asyncio.ensure_future(self._run(user_id, queue, process, debounce))
+        queue.task = task
+
+        # asyncio.wait не пробрасывает отмену задачи в этот обработчик
+        await asyncio.wait([task])
+
+        if queue.task is task and not queue.pending and self._queues.get(user_id) is queue:
+            del self._queues[user_id]
+
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+
+    async def _run(self, user_id: str, queue: _UserQueue[T], process: Callable[[List[T]], Awaitable[None]],
+                   debounce: bool):
+        """Обрабатывает накопленные сообщения (при debounce - после окна объединения)"""
+        if debounce and self.window_seconds > 0:
+            await asyncio.sleep(self.window_seconds)
+
+        batch = list(queue.pending)
+        if len(batch) > 1:
+            logger.info(f"🧩 Объединено {len(batch)} сообщений пользователя {user_id}")
+
+        try:
+            await process(batch)
+        except asyncio.CancelledError:
+            # Вопросы остаются в очереди и войдут в следующий запрос
+            raise
+        except Exception:
+            _remove(queue, batch)
+            raise
+
+        _remove(queue, batch)
+        self.merged_messages += len(batch) - 1
+
+    def mark_answered(self, user_id: str, items: List[T]):
+        """
+        Убирает вопросы из очереди до отправки ответа на них
+
+        Вызывается, когда ответ готов: если обработку отменит новое
+        сообщение, эти вопросы не войдут в следующий запрос.
+
+        Args:
+            user_id: Идентификатор пользователя
+            items: Сообщения, на которые отправляется ответ
+        """
+        queue = self._queues.get(user_id)
+        if queue is not None:
+            _remove(queue, items)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Статистика объединения и отмен"""
+        return {
+            "active_users": len(self._queues),
+            "merged_messages": self.merged_messages,
+            "cancelled_tasks": self.cancelled_tasks
+        }
+
+
+# Глобальный экземпляр для обработчиков сообщений
+request_coalescer: RequestCoalescer = RequestCoalescer(settings.coalesce_window_ms)
@@ -1,17 +1,21 @@
+import asyncio
+from typing import List
 from aiogram import Router, types
 from aiogram.filters import Command
-from src.config.settings import logger
-from src.knowledge.search import KnowledgeSearcher
+from src.config.settings import settings, logger
+from src.knowledge.search import get_knowledge_searcher
 from src.llm.client import llm_client
+from src.llm.errors import LLMUnavailableError
+from src.llm.prompt_builder import ContextBlock, render_services
 from src.llm.logger import llm_logger
+from .coalescer import history_before, request_coalescer
 from .states import dialog_manager
+from .streaming import stream_answer
+from .summarizer import conversation_summarizer
 
 # Создаем роутер для обработки сообщений
 router = Router()
 
-# Инициализируем поисковик знаний один раз при загрузке модуля
-knowledge_searcher = KnowledgeSearcher()
-
 
 @router.message(Command("start"))
 async def start_handler(message: types.Message):
@@ -68,11 +72,17 @@ async def stats_handler(message: types.Message):
             f"🔢 Всего запросов: <b>{stats['total_requests']}</b>\n"
             f"✅ Успешных: <b>{stats['successful_requests']}</b>\n"
             f"❌ Ошибок: <b>{stats['failed_requests']}</b>\n"
-            f"📈 Успешность: <b>{stats['success_rate_percent']}%</b>\n\n"
+            f"🚦 Отклонено лимитами: <b>{stats['rejected_requests']}</b>\n"
+            f"📈 Успешность (без отклоненных): <b>{stats['success_rate_percent']}%</b>\n\n"
             f"👥 Уникальных пользователей: <b>{stats['unique_users']}</b>\n"
             f"⏱️ Среднее время ответа: <b>{stats['avg_response_time_ms']}мс</b>\n"
+            f"⚡ Первый токен (стриминг): <b>{stats['avg_time_to_first_token_ms']}мс</b>\n"
+            f"💾 Ответов из кэша: <b>{stats['cache_hits']}</b>\n"
+            f"🔁 С повторами / страховкой: <b>{stats['retried_requests']}</b> / <b>{stats['hedged_requests']}</b>\n"
+            f"🔌 Circuit breaker: <b>{llm_client.circuit_breaker.state}</b>\n"
             f"🎯 Токенов на запрос: <b>{stats['avg_tokens_per_request']}</b>\n"
-            f"🔥 Всего токенов: <b>{stats['total_tokens_used']}</b>\n\n"
+            f"🔥 Всего токенов: <b>{stats['total_tokens_used']}</b>\n"
+            f"♻️ Из кэша промпта: <b>{stats['cached_prompt_tokens_percent']}%</b> токенов\n\n"
             f"🎯 С контекстом услуг: <b>{stats['requests_with_context']}</b>\n"
             f"📚 С историей диалога: <b>{stats['requests_with_history']}</b>"
         )
@@ -83,6 +93,35 @@ async def stats_handler(message: types.Message):
             for error_type, count in stats['error_breakdown'].items():
                 stats_text += f"• {error_type}: {count}\n"
         
+        if stats['rejection_breakdown']:
+            stats_text += "\n🚦 <b>Причины отказов:</b>\n"
+            for reason, count in stats['rejection_breakdown'].items():
+                stats_text += f"• {reason}: {count}\n"
+        
+        # Эффективность кэшей поиска
+        cache_stats = get_knowledge_searcher().get_cache_stats()
+        stats_text += "\n\n⚡ <b>Кэш поиска:</b>\n"
+        for cache_name, title in (("results", "Результаты"), ("embeddings", "Эмбеддинги")):
+            cache = cache_stats[cache_name]
+            stats_text += (
+                f"• {title}: <b>{cache['hit_rate_percent']}%</b> попаданий "
+                f"({cache['hits']}/{cache['hits'] + cache['misses']}, в кэше {cache['size']})\n"
+            )
+        
+        # Сессии диалогов
+        session_stats = dialog_manager.get_session_stats()
+        session_memory = session_stats.get("estimated_bytes")
+        stats_text += (
+            f"\n💬 Активных сессий: <b>{session_stats['total_sessions']}</b>"
+            + (f" (~{session_memory / 1024:.0f} КБ)" if session_memory is not None else "")
+        )
+        summary_stats = conversation_summarizer.get_stats()
+        if summary_stats["turns"]:
+            stats_text += (
+                f"\n🗜️ Сводок диалогов: <b>{summary_stats['summaries']}</b>, "
+                f"история короче на <b>{summary_stats['saved_percent']}%</b> токенов"
+            )
+        
         await message.answer(stats_text, parse_mode="HTML")
         
         # Сохраняем команду в историю диалога
@@ -110,77 +149,137 @@ async def smart_consultation_handler(message: types.Message):
         await message.answer("🤔 Пожалуйста, напишите текстовый запрос для консультации.")
         return
     
-    # Сохраняем сообщение пользователя в историю диалога
+    # Сохраняем сообщение пользователя в историю диалога сразу, в порядке поступления
     dialog_manager.add_message(user_id, "user", query)
     
+    # Быстрые сообщения подряд объединяются в один ответ, устаревший ответ отменяется
+    await request_coalescer.submit(user_id, message, _answer_consultation)
+
+
+async def _answer_consultation(messages: List[types.Message]):
+    """Отвечает на все неотвеченные сообщения пользователя одним запросом"""
+    message = messages[-1]
+    user_id = str(message.from_user.id)
+    questions = [m.text for m in messages]
+    query = "\n".join(questions)
+    
+    # Общий поисковик процесса (модель загружается один раз, обычно при старте в main)
+    knowledge_searcher = get_knowledge_searcher()
+    
+    # API недоступен (цепь разомкнута): сразу отвечаем поиском, не собирая контекст для LLM
+    if not llm_client.is_available():
+        logger.warning(f"🔴 LLM недоступна, ответ поиском для пользователя {user_id}")
+        await _answer_with_search(message, knowledge_searcher, query, user_id)
+        return
+    
     try:
         # Шаг 1: Поиск релевантных услуг в базе знаний
-        search_results = knowledge_searcher.search(query, limit=3)
+        # (версию каталога берем до поиска: ответ по каталогу, перезагруженному во время
+        # генерации, попадет в кэш под старой версией и не будет выдан)
+        catalogue_version = knowledge_searcher.catalogue.version
+        search_results = await knowledge_searcher.asearch(query, limit=3)
         logger.info(f"🔍 Найдено услуг: {len(search_results)}")
         
         # Шаг 2: Форматируем найденную информацию для LLM контекста
+        # (блоки по убыванию релевантности: при нехватке бюджета токенов обрезаются до заголовка)
         if search_results:
-            services_context_parts = []
+            services_context = []
             for service in search_results:
-                # Получаем детальную информацию об услуге
-                details = knowledge_searcher.get_service_details(service['id'])
-                
-                service_info = f"Услуга: {service['name']}\n"
-                service_info += f"Категория: {service['category']}\n"
-                service_info += f"Цена: {service['price']}\n"
-                service_info += f"Код курса: {service['courseCode']}\n"
-                
-                if details and details.get('full_description'):
-                    service_info += f"Описание: {details['full_description']}\n"
-                
-                if details and details.get('details'):
-                    service_info += f"Детали: {details['details']}\n"
-                
-                service_info += f"Релевантность: {service['relevance_score']}%"
-                services_context_parts.append(service_info)
-            
-            services_context = "\n\n".join(services_context_parts)
+                # Текст услуги собран заранее при загрузке каталога
+                renderings = knowledge_searcher.get_service_renderings(service['id'])
+                if renderings is None:
+                    continue
+                services_context.append(ContextBlock(
+                    f"{renderings.llm_context}Релевантность: {service['relevance_score']}%",
+                    renderings.llm_header
+                ))
         else:
             services_context = "Подходящие услуги не найдены в базе знаний."
         
-        logger.info(f"📄 Контекст для LLM: {len(services_context)} символов")
+        logger.info(f"📄 Контекст для LLM: {len(render_services(services_context))} символов")
         
-        # Получаем историю диалога для контекста
-        conversation_history = dialog_manager.get_conversation_history(user_id, limit=5)
-        
-        # Шаг 3: Генерируем умный ответ через LLM с RAG контекстом и историей
-        response = await llm_client.generate_response(
-            user_message=query,
-            found_services=services_context,
-            conversation_history=conversation_history,
-            user_id=user_id
+        # Получаем историю диалога для контекста: сводка старой части и последние сообщения
+        full_history = dialog_manager.get_conversation_history(user_id, limit=5 + len(questions))
+        earlier_history = history_before(full_history, questions)
+        conversation_history = conversation_summarizer.build_history(
+            user_id, earlier_history, len(full_history) - len(earlier_history)
         )
         
-        # Шаг 4: Отправляем персонализированный ответ пользователю
-        await message.answer(response, parse_mode="HTML")
+        # Кэш ответов LLM: ключ - вопрос + найденные услуги + версия каталога (+ эмбеддинг для похожих вопросов)
+        service_ids = [service['id'] for service in search_results]
+        query_embedding = None
+        if llm_client.needs_query_embedding(query, conversation_history):
+            query_embedding = await knowledge_searcher.aembed_query(query)
         
-        # Сохраняем ответ бота в историю диалога
-        dialog_manager.add_message(user_id, "assistant", response)
+        if settings.llm_streaming:
+            # Шаги 3-4: Потоковая генерация с постепенным обновлением сообщения
+            response = await stream_answer(
+                message,
+                llm_client.stream_response(
+                    user_message=query,
+                    found_services=services_context,
+                    conversation_history=conversation_history,
+                    user_id=user_id,
+                    service_ids=service_ids,
+                    query_embedding=query_embedding,
+                    catalogue_version=catalogue_version
+                )
+            )
+        else:
+            # Шаг 3: Генерируем умный ответ через LLM с RAG контекстом и историей
+            response = await llm_client.generate_response(
+                user_message=query,
+                found_services=services_context,
+                conversation_history=conversation_history,
+                user_id=user_id,
+                service_ids=service_ids,
+                query_embedding=query_embedding,
+                catalogue_version=catalogue_version
+            )
+        
+        # Шаг 4: Ответ готов - вопросы отвечены. Отправка и запись в историю доводятся
+        # до конца, даже если новое сообщение отменит обработку
+        request_coalescer.mark_answered(user_id, messages)
+        await asyncio.shield(_deliver_answer(message, user_id, response, send=not settings.llm_streaming))
         
-        logger.info(f"✅ RAG-ответ успешно отправлен пользователю {user_id}")
+    except LLMUnavailableError as e:
+        # LLM перегружена: сразу отвечаем поиском, не дожидаясь таймаута
+        logger.warning(f"🚦 LLM недоступна для пользователя {user_id} ({e.reason}), ответ поиском")
+        await _answer_with_search(message, knowledge_searcher, query, user_id)
         
     except Exception as e:
         logger.error(f"❌ Ошибка RAG-консультации для пользователя {user_id}: {e}")
+        await _answer_with_search(message, knowledge_searcher, query, user_id)
+
+
+async def _deliver_answer(message: types.Message, user_id: str, response: str, send: bool):
+    """Отправляет ответ (если он еще не показан потоком) и сохраняет его в историю диалога"""
+    if send:
+        # Отправляем персонализированный ответ пользователю
+        await message.answer(response, parse_mode="HTML")
+    
+    # Сохраняем ответ бота в историю диалога
+    dialog_manager.add_message(user_id, "assistant", response)
+    conversation_summarizer.schedule(user_id)
+    
+    logger.info(f"✅ RAG-ответ успешно отправлен пользователю {user_id}")
+
+
+async def _answer_with_search(message: types.Message, knowledge_searcher, query: str, user_id: str):
+    """Fallback: простой поиск без LLM"""
+    try:
+        logger.info(f"🔄 Fallback: простой поиск для пользователя {user_id}")
+        fallback_response = await knowledge_searcher.asearch_and_format_for_telegram(query)
+        await message.answer(fallback_response, parse_mode="HTML")
         
-        # Fallback: используем простой поиск без LLM
-        try:
-            logger.info(f"🔄 Fallback: простой поиск для пользователя {user_id}")
-            fallback_response = knowledge_searcher.search_and_format_for_telegram(query)
-            await message.answer(fallback_response, parse_mode="HTML")
-            
-        except Exception as fallback_error:
-            logger.error(f"❌ Fallback тоже failed для пользователя {user_id}: {fallback_error}")
-            
-            error_response = (
-                "😔 Извините, сейчас у меня технические проблемы.\n"
-                "Обратитесь к нашему менеджеру для персональной консультации."
-            )
-            await message.answer(error_response)
+    except Exception as fallback_error:
+        logger.error(f"❌ Fallback тоже failed для пользователя {user_id}: {fallback_error}")
+        
+        error_response = (
+            "😔 Извините, сейчас у меня технические проблемы.\n"
+            "Обратитесь к нашему менеджеру для персональной консультации."
+        )
+        await message.answer(error_response)
 
 
 def register_handlers(dp):
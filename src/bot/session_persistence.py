@@ -0,0 +1,276 @@
+"""
+Снимки и журнал сессий диалогов для перезапуска без потерь.
+
+Для хранилища в памяти (SESSION_BACKEND=memory) изменения сессий
+(поля, сообщения, удаление) пишутся в журнал, который дописывается
+пачками раз в SESSION_JOURNAL_FLUSH_INTERVAL секунд. Раз в
+SESSION_SNAPSHOT_INTERVAL секунд все сессии сохраняются снимком, после чего
+журнал начинается заново. Каждая запись журнала имеет номер, а снимок
+хранит номер последней вошедшей в него записи, поэтому при старте
+загружается снимок и повторяются только более поздние записи.
+
+Файлы в SESSION_PERSISTENCE_DIR:
+- sessions.snapshot.pickle - снимок {"version", "seq", "sessions": [строки]}
+  в pickle: вдвое быстрее и компактнее JSON на сотнях тысяч сессий;
+  читается без импорта классов (только встроенные типы)
+- sessions.journal.<первый номер>.jsonl - записи [seq, op, user_id, ...]
+
+Запись на диск и сериализация снимка выполняются в отдельном потоке,
+event loop только копирует ссылки на сессии.
+"""
+
+import asyncio
+import gc
+import glob
+import io
+import json
+import os
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from src.config.settings import logger
+
+SNAPSHOT_FILE = "sessions.snapshot.pickle"
+JOURNAL_PATTERN = "sessions.journal.*.jsonl"
+SNAPSHOT_VERSION = 2
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    """Снимок состоит только из встроенных типов: импорт любых классов запрещен"""
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"Недопустимый тип в снимке сессий: {module}.{name}")
+
+
+def _encode_rows(rows: List[list]) -> List[list]:
+    """Строки снимка со списками [role, content, timestamp] вместо Message"""
+    return [row[:-1] + [[(m.role, m.content, m.timestamp) for m in row[-1]]] for row in rows]
+
+
+class SessionPersistence:
+    """Снимки и журнал изменений InMemorySessionStore"""
+
+    def __init__(self, store, directory: str, snapshot_interval: float, flush_interval: float):
+        """
+        Args:
+            store: Хранилище сессий в памяти
+            directory: Папка для снимка и журнала
+            snapshot_interval: Как часто (сек) сохранять снимок
+            flush_interval: Как часто (сек) дописывать журнал на диск
+        """
+        self.store = store
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self.flush_interval = flush_interval
+
+        self.seq = 0  # Номер последней записи журнала
+        self._snapshot_seq = 0  # Номер последней записи, вошедшей в снимок на диске
+        self._pending: List[str] = []
+        self._journal_path: Optional[str] = None
+        self._last_snapshot = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        # Один поток: записи журнала и снимки попадают на диск строго по порядку
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sessions-io")
+
+        self.journal_records = 0
+        self.journal_bytes = 0
+        self.snapshots = 0
+        self.snapshot_bytes = 0
+        self.restore_ms = 0.0
+        self.snapshot_pause_ms = 0.0  # Сколько последний снимок занимал event loop
+
+    def _journal_file(self, first_seq: int) -> str:
+        return os.path.join(self.directory, f"sessions.journal.{first_seq:012d}.jsonl")
+
+    def _journal_files(self) -> List[str]:
+        """Файлы журнала по возрастанию номера первой записи"""
+        return sorted(glob.glob(os.path.join(self.directory, JOURNAL_PATTERN)))
+
+    @staticmethod
+    def _first_seq(path: str) -> int:
+        return int(os.path.basename(path).split(".")[2])
+
+    def record(self, op: str, user_id: str, *args):
+        """Добавляет изменение в журнал (вызывается хранилищем)"""
+        self.seq += 1
+        self._pending.append(
+            json.dumps([self.seq, op, user_id, *args], ensure_ascii=False, separators=(",", ":"))
+        )
+
+    def restore(self) -> Dict[str, float]:
+        """
+        Загружает снимок и повторяет журнал, затем включает журналирование
+
+        Вызывается при старте до начала polling.
+
+        Returns:
+            Количество сессий, повторенных записей и время восстановления
+        """
+        started = time.perf_counter()
+        os.makedirs(self.directory, exist_ok=True)
+        self.store.journal = None
+
+        seq = 0
+        loaded = 0
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            # Сборщик мусора не нужен при создании миллионов объектов, которые все останутся жить
+            gc.disable()
+            try:
+                with open(snapshot_path, "rb") as f:
+                    snapshot = _SnapshotUnpickler(io.BufferedReader(f)).load()
+                if snapshot.get("version") == SNAPSHOT_VERSION:
+                    seq = snapshot["seq"]
+                    loaded = self.store.load_rows(snapshot["sessions"])
+                else:
+                    logger.warning(f"⚠️ Снимок сессий версии {snapshot.get('version')} не поддерживается, пропускаем")
+                del snapshot
+            finally:
+                gc.enable()
+        self._snapshot_seq = seq
+
+        replayed = 0
+        for path in self._journal_files():
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record_seq, op, user_id, *args = json.loads(line)
+                    except ValueError:
+                        # Оборванная последняя запись при аварийной остановке
+                        logger.warning(f"⚠️ Поврежденная запись журнала сессий в {path}, пропускаем остаток файла")
+                        break
+                    if record_seq <= seq:
+                        continue
+                    self.store.apply(op, user_id, *args)
+                    seq = record_seq
+                    replayed += 1
+
+        self.seq = seq
+        self._journal_path = self._journal_file(seq + 1)
+        self.store.journal = self
+        self.restore_ms = (time.perf_counter() - started) * 1000
+
+        logger.info(
+            f"♻️ Сессии восстановлены за {self.restore_ms:.0f}мс: {len(self.store)} сессий "
+            f"(из снимка {loaded}, записей журнала {replayed})"
+        )
+        return {"sessions": len(self.store), "replayed": replayed, "restore_ms": self.restore_ms}
+
+    def _append_journal(self, path: str, lines: List[str]):
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        with open(path, "ab") as f:
+            f.write(data)
+        self.journal_records += len(lines)
+        self.journal_bytes += len(data)
+
+    def _write_snapshot(self, rows: List[list], seq: int):
+        data = pickle.dumps(
+            {"version": SNAPSHOT_VERSION, "seq": seq, "sessions": _encode_rows(rows)},
+            protocol=pickle.HIGHEST_PROTOCOL
+        )
+
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_FILE)
+        tmp_path = snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, snapshot_path)
+
+        # Все записи старых файлов журнала (номера <= seq) вошли в снимок
+        for path in self._journal_files():
+            if self._first_seq(path) <= seq:
+                os.remove(path)
+
+        self.snapshots += 1
+        self.snapshot_bytes += len(data)
+
+    def _submit_flush(self) -> Optional[asyncio.Future]:
+        if not self._pending:
+            return None
+        lines, self._pending = self._pending, []
+        return asyncio.get_running_loop().run_in_executor(
+            self._executor, self._append_journal, self._journal_path, lines
+        )
+
+    async def flush(self):
+        """Дописывает накопленные записи журнала на диск"""
+        future = self._submit_flush()
+        if future is not None:
+            await future
+
+    async def snapshot(self):
+        """Сохраняет снимок всех сессий и начинает новый файл журнала"""
+        self._last_snapshot = time.monotonic()
+        if self.seq == self._snapshot_seq:
+            return  # Изменений с прошлого снимка не было
+
+        # Без await между шагами: снимок и номер seq согласованы
+        flushed = self._submit_flush()
+        started = time.perf_counter()
+        gc.disable()  # Копирование ссылок на сотни тысяч сессий без пауз сборщика мусора
+        try:
+            rows = self.store.snapshot_rows()
+        finally:
+            gc.enable()
+        self.snapshot_pause_ms = (time.perf_counter() - started) * 1000
+        seq = self.seq
+        self._journal_path = self._journal_file(seq + 1)
+
+        if flushed is not None:
+            await flushed
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._write_snapshot, rows, seq)
+        self._snapshot_seq = seq
+        logger.info(
+            f"💾 Снимок сессий: {len(rows)} сессий, запись №{seq}, "
+            f"пауза event loop {self.snapshot_pause_ms:.0f}мс, "
+            f"усиление записи x{self.get_stats()['write_amplification']}"
+        )
+
+    def start(self):
+        """Запускает фоновую запись журнала и снимков"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновую запись и сохраняет финальный снимок"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.snapshot()
+        self._executor.shutdown(wait=True)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                if time.monotonic() - self._last_snapshot >= self.snapshot_interval:
+                    await self.snapshot()
+                else:
+                    await self.flush()
+            except Exception as e:
+                logger.error(f"❌ Ошибка сохранения сессий: {e}")
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        Статистика записи
+
+        write_amplification - сколько байт записано на диск (журнал + снимки)
+        на байт самих изменений в журнале.
+        """
+        written = self.journal_bytes + self.snapshot_bytes
+        return {
+            "seq": self.seq,
+            "journal_records": self.journal_records,
+            "journal_bytes": self.journal_bytes,
+            "snapshots": self.snapshots,
+            "snapshot_bytes": self.snapshot_bytes,
+            "write_amplification": round(written / self.journal_bytes, 2) if self.journal_bytes else 0.0,
+            "snapshot_pause_ms": round(self.snapshot_pause_ms, 1),
+            "restore_ms": round(self.restore_ms, 1)
+        }
@@ -0,0 +1,490 @@
+"""
+Хранилища сессий диалогов.
+
+DialogStateManager работает с сессиями через одинаковый набор методов
+(touch, save_fields, append_message, get_messages, delete, evict_idle, stats),
+поэтому хранилище выбирается настройкой SESSION_BACKEND:
+- memory: словарь в памяти процесса (один процесс бота)
+- redis: Redis или совместимый сервер (REDIS_URL) - состояние общее для
+  нескольких процессов polling/webhook и переживает перезапуск бота
+
+Сессия - это поля (state, selected_course, contact_name, phone, created_at,
+last_activity; время - в секундах Unix) и отдельный список сообщений
+ограниченной длины.
+
+Сессия, неактивная дольше SESSION_IDLE_TTL, удаляется: в памяти - при
+обращении и фоновой очисткой, в Redis - по EXPIRE ключей. В памяти число
+сессий также ограничено SESSION_MAX_COUNT с вытеснением давно неактивных.
+"""
+
+import json
+import sys
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Deque, Dict, List, Optional
+from src.config.settings import logger
+
+# Сколько сессий Redis проверять MEMORY USAGE для оценки объема в /stats
+STATS_SAMPLE_SIZE = 20
+
+
+@dataclass(slots=True)
+class Message:
+    """Сообщение диалога; role интернирована, timestamp - время Unix"""
+    role: str
+    content: str
+    timestamp: float
+
+
+@dataclass(slots=True)
+class Session:
+    """Сессия в памяти: поля, кольцевой буфер сообщений и кэш истории для LLM"""
+    messages: Deque[Message]
+    state: str = "consultation"
+    selected_course: Optional[Dict] = None
+    contact_name: Optional[str] = None
+    phone: Optional[str] = None
+    created_at: float = 0.0
+    last_activity: float = 0.0
+    # Сводка старой части диалога: покрывает первые summary_count из message_count сообщений
+    summary: str = ""
+    summary_count: int = 0
+    message_count: int = 0
+    # Последние сообщения в формате LLM; сбрасывается при добавлении сообщения
+    history_view: Optional[List[Dict[str, str]]] = field(default=None, repr=False)
+
+    def to_fields(self) -> Dict:
+        return {
+            "state": self.state,
+            "selected_course": self.selected_course,
+            "contact_name": self.contact_name,
+            "phone": self.phone,
+            "created_at": self.created_at,
+            "last_activity": self.last_activity,
+            "summary": self.summary,
+            "summary_count": self.summary_count,
+            "message_count": self.message_count
+        }
+
+    def get_history_view(self, limit: int) -> List[Dict[str, str]]:
+        """Последние limit сообщений в формате LLM; строится только при изменении истории"""
+        view = self.history_view
+        if view is None or (len(view) < limit and len(view) < len(self.messages)):
+            start = max(0, len(self.messages) - limit)
+            view = [{"role": m.role, "content": m.content} for m in islice(self.messages, start, None)]
+            self.history_view = view
+        return view[-limit:]
+
+
+def _estimate_bytes(value: Any) -> int:
+    """Примерный размер значения в памяти вместе с вложенными объектами"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_estimate_bytes(k) + _estimate_bytes(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, deque)):
+        size += sum(_estimate_bytes(item) for item in value)
+    elif hasattr(value, "__slots__"):
+        size += sum(_estimate_bytes(getattr(value, name)) for name in value.__slots__)
+    return size
+
+
+class InMemorySessionStore:
+    """Сессии в словаре процесса с TTL неактивности и LRU-ограничением"""
+
+    def __init__(self, max_messages: int = 20, max_sessions: int = 0, idle_ttl: float = 0.0):
+        """
+        Args:
+            max_messages: Сколько последних сообщений хранить в сессии
+            max_sessions: Максимум сессий (0 - без ограничения)
+            idle_ttl: Сколько секунд неактивности хранить сессию (0 - бессрочно)
+        """
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+
+        # user_id → сессия в порядке активности (давно неактивные первыми)
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        # Журнал изменений (session_persistence.SessionPersistence) или None
+        self.journal = None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _is_idle(self, session: Session, now: float) -> bool:
+        return self.idle_ttl > 0 and now - session.last_activity > self.idle_ttl
+
+    def touch(self, user_id: str, now: float) -> Optional[Dict]:
+        """Обновляет время активности и возвращает поля сессии (None - сессии нет)"""
+        session = self._sessions.get(user_id)
+        if session is None:
+            return None
+
+        if self._is_idle(session, now):
+            # Сессия истекла, но фоновая очистка до нее еще не дошла
+            self.delete(user_id)
+            self.evicted_idle += 1
+            return None
+
+        session.last_activity = now
+        self._sessions.move_to_end(user_id)
+        return session.to_fields()
+
+    def save_fields(self, user_id: str, fields: Dict):
+        """Создает сессию или обновляет переданные поля"""
+        if self.journal is not None:
+            self.journal.record("f", user_id, fields)
+
+        session = self._sessions.get(user_id)
+        if session is None:
+            session = Session(deque(maxlen=self.max_messages))
+            self._sessions[user_id] = session
+            if self.max_sessions > 0:
+                while len(self._sessions) > self.max_sessions:
+                    self.delete(next(iter(self._sessions)))
+                    self.evicted_lru += 1
+
+        for name, value in fields.items():
+            setattr(session, name, value)
+
+    def append_message(self, user_id: str, role: str, content: str, timestamp: float) -> int:
+        """
+        Добавляет сообщение, оставляя последние max_messages
+
+        Returns:
+            Длина истории до обрезки
+        """
+        session = self._sessions.get(user_id)
+        if session is None:
+            return 0
+        if self.journal is not None:
+            self.journal.record("m", user_id, role, content, timestamp)
+
+        messages = session.messages
+        trimmed = len(messages) == messages.maxlen
+        messages.append(Message(sys.intern(role), content, timestamp))
+        session.message_count += 1
+        session.history_view = None
+        return len(messages) + trimmed
+
+    def get_messages(self, user_id: str, limit: int) -> List[Dict[str, str]]:
+        """
+        Последние limit сообщений в формате LLM (role, content), старые первыми
+
+        Словари сообщений общие для всех вызовов до следующего добавления,
+        их нельзя изменять.
+        """
+        session = self._sessions.get(user_id)
+        if session is None or limit <= 0:
+            return []
+        return session.get_history_view(limit)
+
+    def delete(self, user_id: str) -> bool:
+        """Удаляет сессию; True если она была"""
+        if self._sessions.pop(user_id, None) is None:
+            return False
+        if self.journal is not None:
+            self.journal.record("d", user_id)
+        return True
+
+    def snapshot_rows(self) -> List[list]:
+        """
+        Сессии в виде строк для снимка (в порядке активности)
+
+        Строка: user_id, поля сессии, кортеж Message последним. Копируются только
+        ссылки (сообщения после создания не меняются), поэтому снимок быстро
+        берется в event loop, а сериализуется в отдельном потоке.
+        """
+        return [
+            [
+                user_id, session.state, session.selected_course, session.contact_name,
+                session.phone, session.created_at, session.last_activity, session.summary,
+                session.summary_count, session.message_count, tuple(session.messages)
+            ]
+            for user_id, session in self._sessions.items()
+        ]
+
+    def load_rows(self, rows: List[list]) -> int:
+        """
+        Заменяет сессии строками снимка, пропуская истекшие
+
+        Сообщения в строке - списки [role, content, timestamp].
+
+        Returns:
+            Количество загруженных сессий
+        """
+        now = time.time()
+        if self.max_sessions > 0:
+            rows = rows[-self.max_sessions:]
+
+        sessions: "OrderedDict[str, Session]" = OrderedDict()
+        for (user_id, state, course, name, phone, created_at, last_activity,
+             summary, summary_count, message_count, messages) in rows:
+            if self.idle_ttl > 0 and now - last_activity > self.idle_ttl:
+                continue
+            sessions[user_id] = Session(
+                deque(
+                    (Message(sys.intern(role), content, timestamp) for role, content, timestamp in messages),
+                    maxlen=self.max_messages
+                ),
+                sys.intern(state), course, name, phone, created_at, last_activity,
+                summary, summary_count, message_count
+            )
+
+        self._sessions = sessions
+        return len(sessions)
+
+    def apply(self, op: str, user_id: str, *args):
+        """Повторяет запись журнала (см. session_persistence)"""
+        if op == "f":
+            self.save_fields(user_id, *args)
+        elif op == "m":
+            self.append_message(user_id, *args)
+            # Обращения без сообщений не журналируются: активность - по времени сообщения
+            session = self._sessions.get(user_id)
+            timestamp = args[2]
+            if session is not None and timestamp > session.last_activity:
+                session.last_activity = timestamp
+                self._sessions.move_to_end(user_id)
+        elif op == "d":
+            self.delete(user_id)
+
+    def evict_idle(self) -> int:
+        """
+        Удаляет сессии, неактивные дольше idle_ttl
+
+        Сессии упорядочены по активности, поэтому просматриваются только
+        истекшие и первая живая.
+
+        Returns:
+            Количество удаленных сессий
+        """
+        if self.idle_ttl <= 0:
+            return 0
+
+        now = time.time()
+        evicted = 0
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if not self._is_idle(oldest, now):
+                break
+            self.delete(oldest_id)
+            evicted += 1
+
+        self.evicted_idle += evicted
+        return evicted
+
+    def stats(self) -> Dict:
+        """Состояния сессий, примерный объем памяти и счетчики вытеснения"""
+        states: Dict[str, int] = {}
+        estimated_bytes = 0
+        for user_id, session in self._sessions.items():
+            states[session.state] = states.get(session.state, 0) + 1
+            estimated_bytes += _estimate_bytes(user_id) + _estimate_bytes(session)
+        return {
+            "states": states,
+            "estimated_bytes": estimated_bytes,
+            "evicted_idle": self.evicted_idle,
+            "evicted_lru": self.evicted_lru
+        }
+
+
+class RedisSessionStore:
+    """
+    Сессии в Redis: поля в хэше, сообщения в списке
+
+    Значения полей и сообщения хранятся в JSON. Добавление сообщения
+    выполняется одним конвейером RPUSH + LTRIM, поэтому список не растет
+    больше max_messages и занимает один сетевой запрос. Подходит любой
+    клиент с интерфейсом redis-py, например fakeredis для локальной проверки.
+
+    Неактивные сессии удаляет сам Redis по EXPIRE, который продлевается
+    при каждом обращении. Общий лимит памяти задается на сервере
+    (maxmemory + maxmemory-policy allkeys-lru).
+
+    Для статистики сессии индексируются по состоянию: sorted set на каждое
+    состояние (user_id → last_activity) и множество названий состояний.
+    stats() не обходит ключи, а считает ZCARD и выбрасывает из индекса
+    сессии старше idle_ttl; объем памяти оценивается по выборке.
+    """
+
+    def __init__(self, client, max_messages: int = 20, idle_ttl: float = 0.0,
+                 key_prefix: str = "help_bot_ai:session:"):
+        """
+        Args:
+            client: Клиент redis.Redis (decode_responses=True) или совместимый
+            max_messages: Сколько последних сообщений хранить в сессии
+            idle_ttl: Сколько секунд неактивности хранить сессию (0 - бессрочно)
+            key_prefix: Префикс ключей сессий
+        """
+        self.client = client
+        self.max_messages = max_messages
+        self.idle_ttl = idle_ttl
+        self.key_prefix = key_prefix
+
+    def _expire(self, pipe, *keys: str):
+        """Продлевает срок жизни ключей сессии в конвейере"""
+        if self.idle_ttl > 0:
+            for key in keys:
+                pipe.expire(key, int(self.idle_ttl))
+
+    def _fields_key(self, user_id: str) -> str:
+        return f"{self.key_prefix}{user_id}"
+
+    def _messages_key(self, user_id: str) -> str:
+        return f"{self.key_prefix}{user_id}:messages"
+
+    # user_id в Telegram - число, поэтому ключи индекса не пересекаются с сессиями
+    def _states_key(self) -> str:
+        return f"{self.key_prefix}index:states"
+
+    def _state_index_key(self, state: str) -> str:
+        return f"{self.key_prefix}index:state:{state}"
+
+    def _index(self, pipe, user_id: str, state: str, last_activity: float, old_state: Optional[str] = None):
+        """Записывает сессию в индекс состояния, убирая из индекса прежнего"""
+        if old_state is not None and old_state != state:
+            pipe.zrem(self._state_index_key(old_state), user_id)
+        pipe.sadd(self._states_key(), state)
+        pipe.zadd(self._state_index_key(state), {user_id: last_activity})
+
+    def touch(self, user_id: str, now: float) -> Optional[Dict]:
+        """Обновляет время активности и возвращает поля сессии (None - сессии нет)"""
+        key = self._fields_key(user_id)
+        raw = self.client.hgetall(key)
+        # Без "state" хэш неполный (например, истек между командами): сессии нет,
+        # а HSET в несуществующий ключ создал бы такую заготовку
+        if "state" not in raw:
+            return None
+
+        fields = {name: json.loads(value) for name, value in raw.items()}
+        fields["last_activity"] = now
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hset(key, "last_activity", json.dumps(now))
+        self._expire(pipe, key, self._messages_key(user_id))
+        self._index(pipe, user_id, fields["state"], now)
+        pipe.execute()
+        return fields
+
+    def save_fields(self, user_id: str, fields: Dict):
+        """Создает сессию или обновляет переданные поля"""
+        key = self._fields_key(user_id)
+        old_state = None
+        if "state" in fields:
+            raw_state = self.client.hget(key, "state")
+            old_state = json.loads(raw_state) if raw_state is not None else None
+
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hset(key, mapping={name: json.dumps(value, ensure_ascii=False) for name, value in fields.items()})
+        self._expire(pipe, key)
+        if "state" in fields:
+            self._index(pipe, user_id, fields["state"], fields.get("last_activity", time.time()), old_state)
+        pipe.execute()
+
+    def append_message(self, user_id: str, role: str, content: str, timestamp: float) -> int:
+        """
+        Добавляет сообщение, оставляя последние max_messages
+
+        Returns:
+            Длина истории до обрезки
+        """
+        key = self._messages_key(user_id)
+        message = {"role": role, "content": content, "timestamp": timestamp}
+        pipe = self.client.pipeline(transaction=False)
+        pipe.rpush(key, json.dumps(message, ensure_ascii=False))
+        pipe.ltrim(key, -self.max_messages, -1)
+        pipe.hincrby(self._fields_key(user_id), "message_count", 1)
+        self._expire(pipe, key)
+        return pipe.execute()[0]
+
+    def get_messages(self, user_id: str, limit: int) -> List[Dict[str, str]]:
+        """Последние limit сообщений в формате LLM (role, content), старые первыми"""
+        if limit <= 0:
+            return []
+        raw = self.client.lrange(self._messages_key(user_id), -limit, -1)
+        messages = [json.loads(item) for item in raw]
+        return [{"role": m["role"], "content": m["content"]} for m in messages]
+
+    def delete(self, user_id: str) -> bool:
+        """Удаляет сессию; True если она была"""
+        raw_state = self.client.hget(self._fields_key(user_id), "state")
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(self._fields_key(user_id), self._messages_key(user_id))
+        if raw_state is not None:
+            pipe.zrem(self._state_index_key(json.loads(raw_state)), user_id)
+        return pipe.execute()[0] > 0
+
+    def evict_idle(self) -> int:
+        """Неактивные сессии удаляет Redis по EXPIRE"""
+        return 0
+
+    def stats(self) -> Dict:
+        """
+        Состояния сессий по индексу и оценка объема их ключей
+
+        Стоимость не зависит от числа сессий: по два запроса на состояние
+        и MEMORY USAGE для выборки из STATS_SAMPLE_SIZE сессий.
+        """
+        states_list = sorted(self.client.smembers(self._states_key()))
+        states: Dict[str, int] = {}
+        if not states_list:
+            return {"states": states, "estimated_bytes": 0}
+
+        # Ключи истекших сессий удалил Redis, а записи индекса - здесь
+        pipe = self.client.pipeline(transaction=False)
+        for state in states_list:
+            if self.idle_ttl > 0:
+                pipe.zremrangebyscore(self._state_index_key(state), "-inf", time.time() - self.idle_ttl)
+            pipe.zcard(self._state_index_key(state))
+        counts = pipe.execute()
+        if self.idle_ttl > 0:
+            counts = counts[1::2]
+        for state, count in zip(states_list, counts):
+            if count:
+                states[state] = count
+        total = sum(states.values())
+        if not total:
+            return {"states": states, "estimated_bytes": 0}
+
+        # Выборка сессий пропорционально состояниям
+        pipe = self.client.pipeline(transaction=False)
+        for state, count in states.items():
+            pipe.zrandmember(self._state_index_key(state), max(1, STATS_SAMPLE_SIZE * count // total))
+        sample = [user_id for members in pipe.execute() for user_id in members]
+
+        # MEMORY USAGE есть не у всех совместимых серверов
+        pipe = self.client.pipeline(transaction=False)
+        for user_id in sample:
+            pipe.memory_usage(self._fields_key(user_id))
+            pipe.memory_usage(self._messages_key(user_id))
+        usage = pipe.execute(raise_on_error=False)
+        estimated_bytes = None
+        if sample and not any(isinstance(value, Exception) for value in usage):
+            estimated_bytes = sum(value or 0 for value in usage) * total // len(sample)
+
+        return {"states": states, "estimated_bytes": estimated_bytes}
+
+def create_session_store(backend: str, redis_url: str = "", max_messages: int = 20,
+                         max_sessions: int = 0, idle_ttl: float = 0.0):
+    """
+    Создает хранилище сессий по названию из настроек
+
+    Args:
+        backend: "memory" или "redis"
+        redis_url: Адрес сервера для redis (redis://host:port/db)
+        max_messages: Сколько последних сообщений хранить в сессии
+        max_sessions: Максимум сессий в памяти (0 - без ограничения)
+        idle_ttl: Сколько секунд неактивности хранить сессию (0 - бессрочно)
+    """
+    if backend == "memory":
+        return InMemorySessionStore(max_messages, max_sessions, idle_ttl)
+    if backend == "redis":
+        import redis  # Импортируем только если выбрано это хранилище
+
+        client = redis.Redis.from_url(redis_url, decode_responses=True)
+        logger.info(f"✅ Сессии диалогов хранятся в Redis: {redis_url}")
+        return RedisSessionStore(client, max_messages, idle_ttl)
+    raise ValueError(f"Неизвестное хранилище сессий: {backend} (ожидается memory или redis)")
@@ -1,27 +1,52 @@
 """
-Управление состояниями диалогов в памяти.
+Управление состояниями диалогов.
 
 Реализует простую систему состояний согласно vision.md:
 - consultation: обычная консультация
 - payment_request: сбор данных для оплаты  
 - manager_request: передача менеджеру
+
+Сессии хранятся в хранилище из session_store.py (память процесса или Redis).
 """
 
-from datetime import datetime
+import asyncio
+import time
 from typing import Dict, List, Optional, Literal
-from src.config.settings import logger
+from src.config.settings import settings, logger
+from .session_persistence import SessionPersistence
+from .session_store import InMemorySessionStore, create_session_store
 
 # Типы состояний диалога
 DialogState = Literal["consultation", "payment_request", "manager_request", "error"]
 
+# Сколько последних сообщений хранить в сессии
+MAX_MESSAGES = 20
+
 
 class DialogStateManager:
-    """Управление состояниями диалогов в памяти согласно принципам KISS"""
+    """Управление состояниями диалогов согласно принципам KISS"""
     
-    def __init__(self):
-        """Инициализация с пустым хранилищем сессий"""
-        self.sessions: Dict[str, Dict] = {}
-        logger.info("💬 DialogStateManager инициализирован")
+    def __init__(self, store=None):
+        """
+        Инициализация с хранилищем сессий
+        
+        Args:
+            store: Хранилище сессий (по умолчанию - из настройки SESSION_BACKEND)
+        """
+        self.store = store if store is not None else create_session_store(
+            settings.session_backend, settings.redis_url, MAX_MESSAGES,
+            settings.session_max_count, settings.session_idle_ttl
+        )
+        self._sweeper_task: Optional[asyncio.Task] = None
+        
+        # Снимки и журнал нужны только хранилищу в памяти: Redis хранит сессии сам
+        self.persistence: Optional[SessionPersistence] = None
+        if isinstance(self.store, InMemorySessionStore) and settings.session_persistence_dir:
+            self.persistence = SessionPersistence(
+                self.store, settings.session_persistence_dir,
+                settings.session_snapshot_interval, settings.session_journal_flush_interval
+            )
+        logger.info(f"💬 DialogStateManager инициализирован (хранилище: {type(self.store).__name__})")
     
     def get_session(self, user_id: str) -> Dict:
         """
@@ -31,24 +56,28 @@ class DialogStateManager:
             user_id: Идентификатор пользователя
             
         Returns:
-            Словарь с данными сессии
+            Копия полей сессии (без сообщений); изменения сохраняются
+            только через методы менеджера
         """
-        if user_id not in self.sessions:
-            self.sessions[user_id] = {
-                "messages": [],
+        now = time.time()
+        session = self.store.touch(user_id, now)
+        
+        if session is None:
+            session = {
                 "state": "consultation",
                 "selected_course": None,
                 "contact_name": None,
                 "phone": None,
-                "created_at": datetime.now().isoformat(),
-                "last_activity": datetime.now().isoformat()
+                "created_at": now,
+                "last_activity": now,
+                "summary": "",
+                "summary_count": 0,
+                "message_count": 0
             }
+            self.store.save_fields(user_id, session)
             logger.info(f"👤 Создана новая сессия для пользователя {user_id}")
-        else:
-            # Обновляем время последней активности
-            self.sessions[user_id]["last_activity"] = datetime.now().isoformat()
             
-        return self.sessions[user_id]
+        return session
     
     def add_message(self, user_id: str, role: str, content: str):
         """
@@ -59,19 +88,11 @@ class DialogStateManager:
             role: Роль отправителя (user, assistant)
             content: Содержимое сообщения
         """
-        session = self.get_session(user_id)
-        
-        message = {
-            "role": role,
-            "content": content,
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        session["messages"].append(message)
+        self.get_session(user_id)
         
-        # Ограничиваем историю последними 20 сообщениями для экономии памяти
-        if len(session["messages"]) > 20:
-            session["messages"] = session["messages"][-20:]
+        # В сессии остаются последние MAX_MESSAGES сообщений (кольцевой буфер)
+        length = self.store.append_message(user_id, role, content, time.time())
+        if length > MAX_MESSAGES:
             logger.info(f"📝 История сообщений обрезана для пользователя {user_id}")
         
         logger.info(f"💬 Добавлено сообщение {role} для пользователя {user_id}")
@@ -85,20 +106,41 @@ class DialogStateManager:
             limit: Количество последних сообщений
             
         Returns:
-            Список сообщений в формате для LLM (role, content)
+            Список сообщений в формате для LLM (role, content);
+            словари сообщений могут быть общими - их нельзя изменять
         """
-        session = self.get_session(user_id)
-        messages = session["messages"][-limit:] if session["messages"] else []
-        
-        # Преобразуем в формат для LLM (убираем timestamp)
-        llm_messages = [
-            {"role": msg["role"], "content": msg["content"]} 
-            for msg in messages
-        ]
+        self.get_session(user_id)
+        llm_messages = self.store.get_messages(user_id, limit)
         
         logger.info(f"📖 Возвращена история из {len(llm_messages)} сообщений для пользователя {user_id}")
         return llm_messages
     
+    def find_session(self, user_id: str) -> Optional[Dict]:
+        """
+        Поля существующей сессии без создания новой
+        
+        Args:
+            user_id: Идентификатор пользователя
+            
+        Returns:
+            Копия полей сессии или None, если сессии нет
+        """
+        return self.store.touch(user_id, time.time())
+    
+    def set_summary(self, user_id: str, summary: str, summary_count: int):
+        """
+        Сохраняет сводку старой части диалога, если сессия еще существует
+        
+        Args:
+            user_id: Идентификатор пользователя
+            summary: Текст сводки
+            summary_count: Сколько первых сообщений диалога она покрывает
+        """
+        if self.find_session(user_id) is None:
+            return
+        self.store.save_fields(user_id, {"summary": summary, "summary_count": summary_count})
+        logger.info(f"🗜️ Сводка диалога пользователя {user_id} обновлена ({summary_count} сообщений)")
+    
     def set_state(self, user_id: str, state: DialogState):
         """
         Устанавливает состояние диалога
@@ -109,7 +151,7 @@ class DialogStateManager:
         """
         session = self.get_session(user_id)
         old_state = session["state"]
-        session["state"] = state
+        self.store.save_fields(user_id, {"state": state})
         
         logger.info(f"🔄 Состояние пользователя {user_id}: {old_state} → {state}")
     
@@ -134,8 +176,8 @@ class DialogStateManager:
             user_id: Идентификатор пользователя
             course_info: Информация о выбранном курсе
         """
-        session = self.get_session(user_id)
-        session["selected_course"] = course_info
+        self.get_session(user_id)
+        self.store.save_fields(user_id, {"selected_course": course_info})
         
         logger.info(f"📚 Выбранный курс для пользователя {user_id}: {course_info.get('name', 'Unknown')}")
     
@@ -148,14 +190,14 @@ class DialogStateManager:
             name: ФИО клиента
             phone: Номер телефона
         """
-        session = self.get_session(user_id)
+        self.get_session(user_id)
         
         if name is not None:
-            session["contact_name"] = name
+            self.store.save_fields(user_id, {"contact_name": name})
             logger.info(f"👤 Имя для пользователя {user_id}: {name}")
             
         if phone is not None:
-            session["phone"] = phone
+            self.store.save_fields(user_id, {"phone": phone})
             logger.info(f"📞 Телефон для пользователя {user_id}: {phone}")
     
     def get_contact_info(self, user_id: str) -> Dict[str, Optional[str]]:
@@ -181,8 +223,7 @@ class DialogStateManager:
         Args:
             user_id: Идентификатор пользователя
         """
-        if user_id in self.sessions:
-            del self.sessions[user_id]
+        if self.store.delete(user_id):
             logger.info(f"🗑️ Сессия пользователя {user_id} очищена")
     
     def get_session_stats(self) -> Dict:
@@ -192,20 +233,69 @@ class DialogStateManager:
         Returns:
             Словарь со статистикой
         """
-        total_sessions = len(self.sessions)
-        states_count = {}
-        
-        for session in self.sessions.values():
-            state = session["state"]
-            states_count[state] = states_count.get(state, 0) + 1
+        store_stats = self.store.stats()
+        states_count = store_stats.pop("states")
+        total_sessions = sum(states_count.values())
         
         stats = {
             "total_sessions": total_sessions,
-            "states_distribution": states_count
+            "states_distribution": states_count,
+            **store_stats
         }
+        if self.persistence is not None:
+            stats["persistence"] = self.persistence.get_stats()
         
         logger.info(f"📊 Статистика сессий: {stats}")
         return stats
+    
+    def evict_idle_sessions(self) -> int:
+        """
+        Удаляет сессии, неактивные дольше SESSION_IDLE_TTL
+        
+        Returns:
+            Количество удаленных сессий
+        """
+        evicted = self.store.evict_idle()
+        if evicted:
+            logger.info(f"🧹 Удалено неактивных сессий: {evicted}")
+        return evicted
+    
+    async def start(self, sweep_interval: Optional[float] = None):
+        """
+        Восстанавливает сессии с диска и запускает фоновые задачи (вызывается из main до polling)
+        
+        Args:
+            sweep_interval: Период очистки неактивных сессий (по умолчанию SESSION_SWEEP_INTERVAL)
+        """
+        if self.persistence is not None:
+            self.persistence.restore()
+            self.persistence.start()
+        
+        interval = settings.session_sweep_interval if sweep_interval is None else sweep_interval
+        if interval > 0 and self._sweeper_task is None:
+            self._sweeper_task = asyncio.create_task(self._sweep_loop(interval))
+            logger.info(f"🧹 Фоновая очистка сессий запущена (каждые {interval:.0f}с)")
+    
+    async def stop(self):
+        """Останавливает фоновые задачи и сохраняет финальный снимок сессий"""
+        if self._sweeper_task is not None:
+            self._sweeper_task.cancel()
+            try:
+                await self._sweeper_task
+            except asyncio.CancelledError:
+                pass
+            self._sweeper_task = None
+        
+        if self.persistence is not None:
+            await self.persistence.stop()
+    
+    async def _sweep_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.evict_idle_sessions()
+            except Exception as e:
+                logger.error(f"❌ Ошибка очистки сессий: {e}")
 
 
 # Глобальный экземпляр для использования в приложении
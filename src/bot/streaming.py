@@ -0,0 +1,126 @@
+"""
+Потоковая отправка ответа LLM в Telegram.
+
+Сначала отправляется сообщение-заглушка, затем оно редактируется по мере
+генерации не чаще TELEGRAM_EDIT_INTERVAL секунд (лимиты Telegram на
+редактирование). Промежуточный текст приводится к валидному HTML,
+финальный - отправляется как есть с fallback на текст без разметки.
+"""
+
+import asyncio
+import re
+import time
+from contextlib import aclosing
+from typing import AsyncIterator, List
+from aiogram import types
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramRetryAfter
+from src.config.settings import settings, logger
+
+_TAG_RE = re.compile(r"<(/?)([a-zA-Z][a-zA-Z0-9-]*)[^>]*>")
+_PARTIAL_ENTITY_RE = re.compile(r"&[a-zA-Z0-9#]*$")
+
+PLACEHOLDER_TEXT = "⏳ Подбираю для вас ответ..."
+CURSOR = " ▌"
+
+
+def balance_html(text: str) -> str:
+    """
+    Приводит обрезанный HTML к валидному виду для промежуточного показа
+
+    Отбрасывает недописанный тег или сущность в конце и закрывает
+    открытые теги в обратном порядке.
+    """
+    last_open = text.rfind("<")
+    if last_open > text.rfind(">"):
+        text = text[:last_open]
+    text = _PARTIAL_ENTITY_RE.sub("", text)
+
+    open_tags: List[str] = []
+    for match in _TAG_RE.finditer(text):
+        closing, name = match.group(1), match.group(2).lower()
+        if not closing:
+            open_tags.append(name)
+        elif name in open_tags:
+            # Закрываем тег и все, что было открыто внутри него
+            while open_tags and open_tags.pop() != name:
+                pass
+
+    return text + "".join(f"</{name}>" for name in reversed(open_tags))
+
+
+def strip_html(text: str) -> str:
+    """Убирает HTML теги (fallback при невалидной разметке)"""
+    return _TAG_RE.sub("", text)
+
+
+async def stream_answer(message: types.Message, chunks: AsyncIterator[str]) -> str:
+    """
+    Отправляет ответ по мере генерации, редактируя одно сообщение
+
+    Args:
+        message: Сообщение пользователя, на которое отвечаем
+        chunks: Фрагменты ответа от LLMClient.stream_response
+
+    Returns:
+        Итоговый текст ответа
+    """
+    placeholder = await message.answer(PLACEHOLDER_TEXT)
+
+    try:
+        return await _stream_into(placeholder, chunks)
+    except (Exception, asyncio.CancelledError):
+        # Ответ устарел (пришло новое сообщение) или LLM недоступна и обработчик
+        # ответит поиском: убираем заглушку с недописанным текстом
+        try:
+            await placeholder.delete()
+        except TelegramAPIError as e:
+            logger.debug(f"Не удалось удалить недописанный ответ: {e}")
+        raise
+
+
+async def _stream_into(placeholder: types.Message, chunks: AsyncIterator[str]) -> str:
+    """Редактирует сообщение-заглушку по мере прихода фрагментов ответа"""
+    text = ""
+    shown = PLACEHOLDER_TEXT
+    next_edit_at = time.monotonic() + settings.telegram_edit_interval
+
+    # aclosing закрывает генератор (и HTTP поток) сразу, в том числе при отмене
+    async with aclosing(chunks):
+        async for chunk in chunks:
+            text += chunk
+
+            if time.monotonic() < next_edit_at or not text.strip():
+                continue
+
+            preview = balance_html(text.strip()) + CURSOR
+            next_edit_at = time.monotonic() + settings.telegram_edit_interval
+            if preview == shown:
+                continue
+
+            try:
+                await placeholder.edit_text(preview, parse_mode="HTML")
+                shown = preview
+            except TelegramRetryAfter as e:
+                # Telegram просит подождать: следующее редактирование не раньше retry_after
+                next_edit_at = time.monotonic() + e.retry_after
+                logger.warning(f"🚦 Лимит редактирования сообщений, пауза {e.retry_after}с")
+            except TelegramBadRequest as e:
+                # Промежуточная разметка может не пройти - покажем следующий фрагмент
+                logger.debug(f"Пропущено промежуточное обновление ответа: {e}")
+
+    final_text = text.strip()
+    if not final_text:
+        final_text = "😔 Извините, не удалось сформировать ответ. Попробуйте еще раз."
+
+    try:
+        try:
+            await placeholder.edit_text(final_text, parse_mode="HTML")
+        except TelegramRetryAfter as e:
+            # Финальный текст обязательно должен дойти: ждем и повторяем
+            await asyncio.sleep(e.retry_after)
+            await placeholder.edit_text(final_text, parse_mode="HTML")
+    except TelegramBadRequest as e:
+        logger.warning(f"⚠️ Невалидный HTML в ответе LLM, отправляем без разметки: {e}")
+        await placeholder.edit_text(strip_html(final_text))
+
+    return final_text
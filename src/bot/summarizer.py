@@ -0,0 +1,157 @@
+"""
+Скользящая сводка диалога.
+
+После ответа ассистента старая часть диалога в фоне сворачивается LLM в
+краткую сводку, которая хранится в сессии. В промпт вместо длинной истории
+уходят сводка и HISTORY_RECENT_MESSAGES последних сообщений дословно,
+поэтому размер истории в токенах не растет с каждым ходом, а ранний
+контекст (выбранный курс, бюджет, возраст ребенка) не теряется.
+"""
+
+import asyncio
+from typing import Dict, List, Set
+from src.config.settings import settings, logger
+from src.llm.client import llm_client
+from src.llm.prompt_builder import MESSAGE_OVERHEAD_TOKENS
+from .states import dialog_manager
+
+# Сводка идет первым сообщением истории с role=system; LLMClient переносит ее
+# в системный промпт или в контекст хода, не добавляя второе системное сообщение
+SUMMARY_PREFIX = "Краткое содержание предыдущего диалога:\n"
+
+
+class ConversationSummarizer:
+    """Обновляет сводки диалогов и собирает историю для LLM"""
+
+    def __init__(self, enabled: bool, recent_messages: int, max_tokens: int):
+        """
+        Args:
+            enabled: Включено ли сворачивание истории
+            recent_messages: Сколько последних сообщений остается дословно
+            max_tokens: Максимальная длина сводки в токенах
+        """
+        self.enabled = enabled
+        self.recent_messages = recent_messages
+        self.max_tokens = max_tokens
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._rerun: Set[str] = set()
+
+        self.summaries = 0
+        self.turns = 0  # Ходов, в которых история ушла в LLM со сводкой
+        self.raw_tokens = 0  # Токены полной истории в этих ходах
+        self.sent_tokens = 0  # Токены сводки и последних сообщений
+
+    def _history_tokens(self, history: List[Dict]) -> int:
+        return sum(llm_client.token_counter.count(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in history)
+
+    def build_history(self, user_id: str, history: List[Dict], pending: int, limit: int = 5) -> List[Dict]:
+        """
+        История для LLM: сводка старой части диалога и последние сообщения
+
+        Args:
+            user_id: Идентификатор пользователя
+            history: Последние сообщения до текущих вопросов (старые первыми)
+            pending: Сколько сообщений сохранено после history (текущие вопросы)
+            limit: Максимум сообщений истории в промпте
+
+        Returns:
+            Список сообщений с role/content
+        """
+        raw = history[-limit:]
+        session = dialog_manager.find_session(user_id) if self.enabled else None
+        if not session or not session["summary"]:
+            return raw
+
+        # Сообщения до текущих вопросов, которые еще не вошли в сводку
+        unsummarized = session["message_count"] - pending - session["summary_count"]
+        # Место под сводку: LLMClient передает в промпт не больше limit сообщений истории
+        recent = history[-min(unsummarized, limit - 1):] if unsummarized > 0 else []
+        result = [{"role": "system", "content": SUMMARY_PREFIX + session["summary"]}] + recent
+
+        raw_tokens = self._history_tokens(raw)
+        sent_tokens = self._history_tokens(result)
+        self.turns += 1
+        self.raw_tokens += raw_tokens
+        self.sent_tokens += sent_tokens
+        if raw_tokens:
+            logger.info(
+                f"🗜️ История для {user_id}: {sent_tokens} ток. вместо {raw_tokens} "
+                f"({(sent_tokens - raw_tokens) / raw_tokens * 100:+.0f}%)"
+            )
+        return result
+
+    def schedule(self, user_id: str):
+        """Запускает фоновое обновление сводки после ответа ассистента"""
+        if not self.enabled:
+            return
+        task = self._tasks.get(user_id)
+        if task is not None and not task.done():
+            # Обновление уже идет: повторим его с новыми сообщениями
+            self._rerun.add(user_id)
+            return
+        self._tasks[user_id] = asyncio.create_task(self._run(user_id))
+
+    async def _run(self, user_id: str):
+        try:
+            while True:
+                await self._update(user_id)
+                if user_id not in self._rerun:
+                    break
+                self._rerun.discard(user_id)
+        except Exception as e:
+            logger.error(f"❌ Ошибка обновления сводки диалога {user_id}: {e}")
+        finally:
+            self._rerun.discard(user_id)
+            self._tasks.pop(user_id, None)
+
+    async def _update(self, user_id: str):
+        """Сворачивает в сводку сообщения, которые вышли за последние recent_messages"""
+        session = dialog_manager.find_session(user_id)
+        if session is None:
+            return
+
+        covered = session["summary_count"]
+        fold_until = session["message_count"] - self.recent_messages
+        # Сводку обновляем пачками хотя бы по одному обмену вопрос-ответ
+        if fold_until - covered < 2:
+            return
+
+        # Буфер хранит только последние сообщения: более старые уже не восстановить
+        messages = dialog_manager.get_conversation_history(user_id, limit=session["message_count"] - covered)
+        to_fold = messages[:len(messages) - self.recent_messages]
+        if not to_fold:
+            return
+
+        summary = await llm_client.summarize_dialog(session["summary"], to_fold, self.max_tokens)
+        if not summary:
+            return
+
+        # Пока шел запрос, сессию могли очистить или обновить сводку
+        current = dialog_manager.find_session(user_id)
+        if current is None or current["created_at"] != session["created_at"] or current["summary_count"] != covered:
+            return
+        dialog_manager.set_summary(user_id, summary, fold_until)
+        self.summaries += 1
+
+    async def stop(self):
+        """Отменяет незавершенные обновления сводок"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, float]:
+        """Статистика сводок и экономии токенов истории"""
+        return {
+            "summaries": self.summaries,
+            "turns": self.turns,
+            "raw_tokens": self.raw_tokens,
+            "sent_tokens": self.sent_tokens,
+            "saved_percent": round((1 - self.sent_tokens / self.raw_tokens) * 100, 1) if self.raw_tokens else 0.0
+        }
+
+
+# Глобальный экземпляр для обработчиков сообщений
+conversation_summarizer: ConversationSummarizer = ConversationSummarizer(
+    settings.history_summary, settings.history_recent_messages, settings.history_summary_max_tokens
+)
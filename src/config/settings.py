@@ -10,6 +10,35 @@ class Settings(BaseSettings):
     
     # OpenRouter API
     openrouter_api_key: str
+    llm_models: str = "qwen/qwen3-14b:free"  # Модели через запятую в порядке предпочтения
+    llm_max_retries: int = 2  # Повторы при 429/5xx/сетевых ошибках
+    llm_retry_base_delay: float = 0.5  # Базовая пауза экспоненциального повтора (сек)
+    llm_retry_max_delay: float = 8.0  # Максимальная пауза и максимальный Retry-After, который ждем (сек)
+    llm_hedging: bool = False  # Страховочный запрос к следующей модели после p95 задержки
+    llm_hedge_min_samples: int = 20  # Сколько ответов модели нужно для оценки p95
+    llm_message_layout: str = "split"  # split: услуги и сводка user-сообщением перед вопросом (кэш префикса), inline: в системном промпте
+    llm_prompt_token_budget: int = 3000  # Бюджет токенов промпта (системный промпт, услуги, история)
+    llm_tokenizer: str = "Qwen/Qwen3-14B"  # Токенизатор (имя на HF Hub или путь к tokenizer.json, пусто - оценка)
+    llm_tokenizer_load_timeout: float = 30.0  # Сколько ждать загрузку токенизатора при старте (сек), дальше - в фоне
+    llm_timeout: float = 30.0  # Таймаут запроса к OpenRouter (сек)
+    llm_max_connections: int = 20  # Максимум одновременных соединений в пуле
+    llm_max_keepalive_connections: int = 10  # Сколько соединений держать открытыми
+    llm_keepalive_expiry: float = 60.0  # Время жизни простаивающего соединения (сек)
+    llm_http2: bool = False  # HTTP/2 (нужен пакет h2: httpx[http2])
+    llm_streaming: bool = False  # Потоковые ответы с постепенным редактированием сообщения
+    telegram_edit_interval: float = 1.0  # Минимальный интервал редактирования сообщения (сек)
+    llm_response_cache_size: int = 256  # Кэш ответов на первые вопросы (0 - выключен)
+    llm_response_cache_ttl: float = 3600.0  # Время жизни ответа в кэше (сек)
+    llm_response_cache_similarity: float = 0.0  # Порог близости вопросов 0..1 (0 - только точное совпадение)
+    llm_max_in_flight: int = 8  # Максимум одновременных запросов к OpenRouter
+    llm_requests_per_minute: float = 20.0  # Лимит запросов в минуту (0 - без ограничения)
+    llm_tokens_per_minute: float = 0.0  # Лимит токенов в минуту (0 - без ограничения)
+    llm_queue_size: int = 50  # Сколько запросов может ждать допуска
+    llm_queue_timeout: float = 10.0  # Максимальное ожидание допуска, дольше - ответ поиском без LLM (сек)
+    llm_breaker_failure_threshold: int = 5  # Ошибок подряд до размыкания цепи
+    llm_breaker_open_seconds: float = 30.0  # Сколько отвечать поиском до первой пробы API (сек)
+    llm_breaker_probe_interval: float = 5.0  # Интервал пробных запросов в полуоткрытом состоянии (сек)
+    llm_stats_retention_hours: int = 168  # Сколько часов хранить поминутную статистику запросов для /stats
     
     # 1C Integration
     onec_api_url: str
@@ -18,6 +47,36 @@ class Settings(BaseSettings):
     
     # Application Settings
     log_level: str = "INFO"
+    coalesce_window_ms: float = 500.0  # Окно объединения быстрых сообщений пользователя (мс)
+    
+    # Dialog Sessions
+    session_backend: str = "memory"  # Хранилище сессий диалогов: memory или redis
+    redis_url: str = "redis://localhost:6379/0"  # Сервер Redis для SESSION_BACKEND=redis
+    session_idle_ttl: float = 86400.0  # Сколько секунд хранить неактивную сессию (0 - бессрочно)
+    session_max_count: int = 10000  # Максимум сессий в памяти, давно неактивные вытесняются (0 - без ограничения)
+    session_sweep_interval: float = 60.0  # Как часто (сек) удалять неактивные сессии (0 - выключено)
+    session_persistence_dir: str = "data/sessions"  # Снимки и журнал сессий в памяти ("" - не сохранять)
+    session_snapshot_interval: float = 300.0  # Как часто (сек) сохранять снимок всех сессий
+    session_journal_flush_interval: float = 1.0  # Как часто (сек) дописывать журнал изменений на диск
+    history_summary: bool = False  # Сводка старой части истории (+1 запрос к LLM на ход из тех же лимитов RPM/TPM)
+    history_recent_messages: int = 2  # Сколько последних сообщений передавать в LLM дословно вместе со сводкой
+    history_summary_max_tokens: int = 200  # Максимальная длина сводки в токенах
+    
+    # Knowledge Search
+    search_backend: str = "chroma"  # Хранилище векторов: chroma или numpy
+    search_workers: int = 4  # Размер пула потоков для поиска (эмбеддинги + ChromaDB)
+    catalogue_check_interval: float = 5.0  # Как часто (сек) проверять изменения файла услуг
+    embedding_model: str = "all-MiniLM-L6-v2"  # Модель sentence-transformers для эмбеддингов
+    embedding_batch_size: int = 32  # Размер батча при кодировании текстов
+    embedding_threads: int = 0  # Потоки torch для кодирования (0 - по умолчанию)
+    search_cache_size: int = 512  # Максимум запросов в кэше эмбеддингов и результатов
+    search_cache_ttl: float = 600.0  # Время жизни записи кэша поиска (сек)
+    hybrid_search: bool = True  # Гибридный поиск: векторы + BM25 (reciprocal rank fusion)
+    hybrid_candidates: int = 10  # Кандидатов от каждого метода перед слиянием
+    hybrid_rrf_k: int = 60  # Константа reciprocal rank fusion
+    lexical_max_keyword_tokens: int = 2  # Короткие запросы из известных слов ищутся только BM25
+    search_batch_window_ms: float = 0.0  # Окно сбора одновременных запросов в батч (0 - выключено)
+    search_batch_max_size: int = 32  # Максимум запросов в одном батче
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,215 @@
+"""
+Хранилища векторного индекса услуг.
+
+KnowledgeSearcher работает с индексом через одинаковый набор методов
+(count, get_hashes, upsert, delete, query), поэтому хранилище выбирается
+настройкой SEARCH_BACKEND:
+- chroma: ChromaDB PersistentClient (SQLite + HNSW)
+- numpy: точный поиск в процессе по нормализованной float32 матрице,
+  хранящейся на диске в .npy и открываемой через memory-map
+
+Расстояния в обоих хранилищах совпадают: квадрат L2 между нормализованными
+векторами (метрика ChromaDB по умолчанию), т.е. 2 - 2 * cos.
+"""
+
+import json
+import os
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+from src.config.settings import logger
+
+# Результат запроса: для каждого вектора запроса список (метаданные, расстояние)
+QueryResults = List[List[Tuple[Dict, float]]]
+
+
+class ChromaBackend:
+    """Векторный индекс в ChromaDB (файловая БД)"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Папка PersistentClient
+        """
+        import chromadb  # Импортируем только если выбрано это хранилище
+
+        os.makedirs(path, exist_ok=True)
+        self.client = chromadb.PersistentClient(path=path)
+        # Векторы всегда передаются явно, поэтому функция эмбеддингов коллекции
+        # не нужна: без нее ChromaDB не поднимает свою модель по умолчанию
+        self.collection = self.client.get_or_create_collection(
+            name="services",
+            metadata={"description": "Услуги Академии дронов"},
+            embedding_function=None
+        )
+        logger.info("✅ ChromaDB инициализирована")
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def get_hashes(self) -> Dict[str, Optional[str]]:
+        """Возвращает id → content_hash для всех документов индекса"""
+        existing = self.collection.get(include=["metadatas"])
+        return {
+            service_id: (metadata or {}).get("content_hash")
+            for service_id, metadata in zip(existing["ids"], existing["metadatas"])
+        }
+
+    def upsert(self, ids: List[str], embeddings: np.ndarray, metadatas: List[Dict], documents: List[str]):
+        self.collection.upsert(
+            documents=documents,
+            embeddings=embeddings.tolist(),
+            metadatas=metadatas,
+            ids=ids
+        )
+
+    def delete(self, ids: List[str]):
+        self.collection.delete(ids=ids)
+
+    def query(self, embeddings: np.ndarray, limit: int) -> QueryResults:
+        results = self.collection.query(
+            query_embeddings=embeddings.tolist(),
+            n_results=limit,
+            include=["metadatas", "distances"]
+        )
+
+        return [
+            list(zip(metadatas or [], distances or []))
+            for metadatas, distances in zip(results["metadatas"] or [], results["distances"] or [])
+        ]
+
+
+class _VectorState(NamedTuple):
+    """Согласованный снимок индекса: строка матрицы i соответствует ids[i] и metadatas[i]"""
+    ids: List[str]
+    metadatas: List[Dict]
+    matrix: Optional[np.ndarray]
+
+
+class NumpyBackend:
+    """
+    Точный векторный поиск в процессе: одно умножение матриц + argpartition
+
+    Индекс публикуется одним присваиванием _state, поэтому запрос в другом
+    потоке поиска видит либо старые, либо новые векторы целиком.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Папка с embeddings.npy (векторы) и index.json (id и метаданные)
+        """
+        os.makedirs(path, exist_ok=True)
+        self.matrix_path = os.path.join(path, "embeddings.npy")
+        self.index_path = os.path.join(path, "index.json")
+
+        self._state = _VectorState([], [], None)
+        self._load()
+
+        logger.info(f"✅ NumPy индекс инициализирован: {len(self.ids)} векторов")
+
+    def _load(self):
+        """Открывает сохраненный индекс (матрица через memory-map)"""
+        if not (os.path.exists(self.matrix_path) and os.path.exists(self.index_path)):
+            return
+
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+
+        self._state = _VectorState(index["ids"], index["metadatas"], np.load(self.matrix_path, mmap_mode="r"))
+
+    @property
+    def ids(self) -> List[str]:
+        return self._state.ids
+
+    @property
+    def metadatas(self) -> List[Dict]:
+        return self._state.metadatas
+
+    @property
+    def matrix(self) -> Optional[np.ndarray]:
+        return self._state.matrix
+
+    def _save(self, ids: List[str], metadatas: List[Dict], matrix: np.ndarray):
+        """Атомарно записывает индекс на диск и переоткрывает его"""
+        matrix_tmp = self.matrix_path + ".tmp.npy"
+        index_tmp = self.index_path + ".tmp"
+
+        np.save(matrix_tmp, np.ascontiguousarray(matrix, dtype=np.float32))
+        with open(index_tmp, "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "metadatas": metadatas}, f, ensure_ascii=False)
+
+        os.replace(matrix_tmp, self.matrix_path)
+        os.replace(index_tmp, self.index_path)
+        self._load()
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def get_hashes(self) -> Dict[str, Optional[str]]:
+        """Возвращает id → content_hash для всех векторов индекса"""
+        state = self._state
+        return {
+            service_id: metadata.get("content_hash")
+            for service_id, metadata in zip(state.ids, state.metadatas)
+        }
+
+    def upsert(self, ids: List[str], embeddings: np.ndarray, metadatas: List[Dict], documents: List[str]):
+        state = self._state
+        rows = {service_id: i for i, service_id in enumerate(state.ids)}
+        all_ids = list(state.ids)
+        all_metadatas = list(state.metadatas)
+        vectors = [state.matrix[i] for i in range(len(state.ids))] if state.matrix is not None else []
+
+        for service_id, embedding, metadata in zip(ids, embeddings, metadatas):
+            if service_id in rows:
+                vectors[rows[service_id]] = embedding
+                all_metadatas[rows[service_id]] = metadata
+            else:
+                rows[service_id] = len(all_ids)
+                all_ids.append(service_id)
+                all_metadatas.append(metadata)
+                vectors.append(embedding)
+
+        self._save(all_ids, all_metadatas, np.vstack(vectors))
+
+    def delete(self, ids: List[str]):
+        state = self._state
+        removed = set(ids)
+        keep = [i for i, service_id in enumerate(state.ids) if service_id not in removed]
+        dimension = state.matrix.shape[1] if state.matrix is not None else 0
+        matrix = state.matrix[keep] if keep else np.empty((0, dimension), dtype=np.float32)
+
+        self._save([state.ids[i] for i in keep], [state.metadatas[i] for i in keep], matrix)
+
+    def query(self, embeddings: np.ndarray, limit: int) -> QueryResults:
+        state = self._state  # Один снимок на весь запрос
+        if state.matrix is None or not state.ids or limit <= 0:
+            return [[] for _ in range(len(embeddings))]
+
+        # Косинусная близость нормализованных векторов = скалярное произведение
+        scores = np.asarray(embeddings, dtype=np.float32) @ state.matrix.T
+        k = min(limit, len(state.ids))
+
+        results = []
+        for row in scores:
+            top = np.argpartition(-row, k - 1)[:k] if k < len(row) else np.arange(len(row))
+            top = top[np.argsort(-row[top])]
+            results.append([
+                (state.metadatas[i], float(2.0 - 2.0 * row[i]))
+                for i in top
+            ])
+        return results
+
+
+def create_vector_index(backend: str):
+    """
+    Создает хранилище векторного индекса по названию из настроек
+
+    Args:
+        backend: "chroma" или "numpy"
+    """
+    if backend == "chroma":
+        return ChromaBackend("data/chroma")
+    if backend == "numpy":
+        return NumpyBackend("data/vectors")
+    raise ValueError(f"Неизвестное хранилище векторов: {backend} (ожидается chroma или numpy)")
@@ -0,0 +1,99 @@
+"""
+Микробатчинг поисковых запросов.
+
+Запросы asearch, пришедшие в пределах нескольких миллисекунд, собираются
+в один вызов search_many: одна модель кодирует их одним батчем,
+а векторный индекс получает один запрос на всех.
+
+Очередь батча своя у каждого event loop (поисковик - глобальный объект,
+а тесты и скрипты запускают несколько loop подряд): future и таймер
+нельзя смешивать между loop.
+"""
+
+import asyncio
+import weakref
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+from src.config.settings import logger
+
+
+class _LoopBatch:
+    """Накопленные запросы и таймер отправки в одном event loop"""
+
+    __slots__ = ("pending", "flush_handle", "tasks")
+
+    def __init__(self):
+        self.pending: List[Tuple[str, int, asyncio.Future]] = []
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        # Ссылки на выполняющиеся батчи: loop хранит задачи только по слабым ссылкам
+        self.tasks: Set[asyncio.Task] = set()
+
+
+class SearchBatcher:
+    """Собирает одновременные asearch в пакетный поиск search_many"""
+
+    def __init__(self, searcher, window_ms: float, max_batch_size: int):
+        """
+        Args:
+            searcher: KnowledgeSearcher с методами search_many и _run_in_pool
+            window_ms: Сколько ждать остальные запросы после первого, мс
+            max_batch_size: При таком количестве запросов батч отправляется сразу
+        """
+        self.searcher = searcher
+        self.window_seconds = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        # Состояние создается при первом запросе в loop и уходит вместе с ним
+        self._batches: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopBatch]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    async def search(self, query: str, limit: int) -> List[Dict]:
+        """Ставит запрос в текущий батч и ждет его результатов"""
+        loop = asyncio.get_running_loop()
+        state = self._batches.get(loop)
+        if state is None:
+            state = self._batches[loop] = _LoopBatch()
+
+        future = loop.create_future()
+        state.pending.append((query, limit, future))
+
+        if len(state.pending) >= self.max_batch_size:
+            self._flush(state)
+        elif state.flush_handle is None:
+            state.flush_handle = loop.call_later(self.window_seconds, self._flush, state)
+
+        return await future
+
+    def _flush(self, state: _LoopBatch):
+        """Отправляет накопленные запросы (отдельный батч на каждый limit)"""
+        if state.flush_handle is not None:
+            state.flush_handle.cancel()
+            state.flush_handle = None
+
+        batch, state.pending = state.pending, []
+        groups: Dict[int, List[Tuple[str, asyncio.Future]]] = defaultdict(list)
+        for query, limit, future in batch:
+            groups[limit].append((query, future))
+
+        for limit, items in groups.items():
+            task = asyncio.ensure_future(self._run_batch(items, limit))
+            state.tasks.add(task)
+            task.add_done_callback(state.tasks.discard)
+
+    async def _run_batch(self, items: List[Tuple[str, asyncio.Future]], limit: int):
+        """Выполняет search_many в пуле потоков и раздает результаты ожидающим"""
+        queries = [query for query, _ in items]
+        if len(queries) > 1:
+            logger.info(f"📦 Батч поиска: {len(queries)} запросов")
+
+        try:
+            results = await self.searcher._run_in_pool(self.searcher.search_many, queries, limit)
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), found_services in zip(items, results):
+            if not future.done():
+                future.set_result(found_services)
@@ -0,0 +1,90 @@
+"""
+Кэш повторяющихся поисковых запросов.
+
+Трафик состоит в основном из нескольких сотен почти одинаковых вопросов,
+поэтому эмбеддинги и результаты поиска кэшируются по нормализованному тексту.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = " \t\n.,!?;:…\"'«»()"
+
+
+def normalize_query(query: str) -> str:
+    """
+    Нормализует запрос для ключа кэша
+
+    Нижний регистр, ё → е, схлопывание пробелов и обрезка пунктуации по краям:
+    "Сколько стоит?" и "сколько  стоит" дают один ключ.
+    """
+    normalized = _WHITESPACE_RE.sub(" ", query.lower().replace("ё", "е"))
+    return normalized.strip(_EDGE_PUNCTUATION)
+
+
+class TTLCache:
+    """Ограниченный LRU-кэш с временем жизни записей и счетчиками попаданий"""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        """
+        Args:
+            max_size: Максимальное количество записей (старые вытесняются по LRU)
+            ttl_seconds: Время жизни записи в секундах
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()  # Кэш используется из пула потоков поиска
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Возвращает значение или None, если записи нет или она устарела"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        """Сохраняет значение, вытесняя самую давно использованную запись при переполнении"""
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Очищает кэш (счетчики попаданий сохраняются)"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика эффективности кэша"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate_percent": round(self.hits / total * 100, 1) if total else 0.0
+        }
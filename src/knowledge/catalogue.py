@@ -0,0 +1,104 @@
+"""
+Каталог услуг в памяти.
+
+Загружает services_knowledge_base.json один раз, строит индекс id → услуга
+и перечитывает файл только когда меняется его mtime (горячая перезагрузка
+без рестарта бота). Вместе с индексом строятся готовые текстовые
+представления услуг (rendering.py), поэтому они обновляются при каждой
+перезагрузке.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+from src.config.settings import settings, logger
+from .rendering import ServiceRenderings, render_service
+
+
+class ServiceCatalogue:
+    """Индекс услуг id → услуга с перезагрузкой по mtime файла"""
+
+    def __init__(self, services_file: str, check_interval: Optional[float] = None):
+        """
+        Инициализация каталога с первичной загрузкой файла
+
+        Args:
+            services_file: Путь к файлу с услугами
+            check_interval: Как часто (в секундах) проверять mtime файла
+        """
+        self.services_file = services_file
+        self.check_interval = (
+            settings.catalogue_check_interval if check_interval is None else check_interval
+        )
+
+        self.services: List[Dict] = []
+        self.services_by_id: Dict[str, Dict] = {}
+        self.renderings: Dict[str, ServiceRenderings] = {}
+        self.version = 0  # Увеличивается при каждой перезагрузке
+
+        self._mtime: Optional[float] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+        self.reload()
+
+    def reload(self):
+        """Перечитывает файл услуг и перестраивает индекс"""
+        with self._lock:
+            mtime = os.path.getmtime(self.services_file)
+            with open(self.services_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+
+            services = data.get('services', [])
+            renderings = {service["id"]: render_service(service) for service in services}
+
+            # Подменяем ссылки целиком: читатели видят либо старый, либо новый индекс
+            self.services = services
+            self.services_by_id = {service["id"]: service for service in services}
+            self.renderings = renderings
+            self._mtime = mtime
+            self._last_check = time.monotonic()
+            self.version += 1
+
+        logger.info(f"📚 Каталог услуг загружен: {len(services)} услуг (версия {self.version})")
+
+    def refresh_if_changed(self) -> bool:
+        """
+        Перезагружает каталог, если файл изменился с момента последней загрузки
+
+        Проверка mtime выполняется не чаще check_interval секунд,
+        поэтому на горячем пути файловых операций нет.
+
+        Returns:
+            True если каталог был перезагружен
+        """
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return False
+        self._last_check = now
+
+        try:
+            if os.path.getmtime(self.services_file) == self._mtime:
+                return False
+
+            logger.info("🔄 Файл услуг изменился, перезагружаем каталог")
+            self.reload()
+            return True
+
+        except Exception as e:
+            # Оставляем прежний индекс: лучше старые данные, чем пустой каталог
+            logger.error(f"❌ Ошибка перезагрузки каталога услуг: {e}")
+            return False
+
+    def get(self, service_id: str) -> Optional[Dict]:
+        """Возвращает услугу по ID или None"""
+        return self.services_by_id.get(service_id)
+
+    def get_renderings(self, service_id: str) -> Optional[ServiceRenderings]:
+        """Возвращает готовые представления услуги по ID или None"""
+        return self.renderings.get(service_id)
+
+    def __len__(self) -> int:
+        return len(self.services)
@@ -0,0 +1,63 @@
+"""
+Эмбеддинги на базе одной модели sentence-transformers.
+
+Одна и та же модель используется и для индексации услуг, и для запросов:
+векторный индекс получает готовые векторы, а не считает их своей моделью.
+"""
+
+from typing import List, Optional
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from src.config.settings import settings, logger
+
+
+class SentenceTransformerEmbedder:
+    """Адаптер эмбеддингов: батчевое кодирование в нормализованные float32 векторы"""
+
+    def __init__(self, model_name: Optional[str] = None, batch_size: Optional[int] = None,
+                 threads: Optional[int] = None):
+        """
+        Загрузка модели и настройка параметров кодирования
+
+        Args:
+            model_name: Название модели sentence-transformers
+            batch_size: Размер батча при кодировании
+            threads: Количество потоков torch (0 - значение по умолчанию)
+        """
+        self.model_name = model_name or settings.embedding_model
+        self.batch_size = batch_size or settings.embedding_batch_size
+        threads = settings.embedding_threads if threads is None else threads
+
+        if threads > 0:
+            import torch  # Зависимость sentence-transformers
+            torch.set_num_threads(threads)
+
+        self.model = SentenceTransformer(self.model_name)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+        logger.info(
+            f"✅ Модель эмбеддингов {self.model_name} загружена "
+            f"(размерность {self.dimension}, батч {self.batch_size}, потоков torch: {threads or 'по умолчанию'})"
+        )
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Кодирует тексты батчами
+
+        Args:
+            texts: Список текстов
+
+        Returns:
+            Матрица (len(texts), dimension) нормализованных float32 векторов
+        """
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+
+        embeddings = self.model.encode(
+            list(texts),
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+        return np.asarray(embeddings, dtype=np.float32)
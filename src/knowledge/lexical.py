@@ -0,0 +1,206 @@
+"""
+Лексический поиск BM25 по услугам.
+
+all-MiniLM-L6-v2 обучена в основном на английском, поэтому русские запросы
+и коды курсов (FPV_FLIGHT_BASIC) ранжируются векторным поиском плохо.
+Инвертированный индекс строится один раз при загрузке каталога; веса BM25
+посчитаны заранее, так что запрос - это сумма весов из нескольких списков.
+"""
+
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+_TOKEN_RE = re.compile(r"[a-zа-я0-9]+(?:_[a-zа-я0-9]+)*")
+_CYRILLIC_RE = re.compile(r"[а-я]")
+
+# Частые служебные слова не несут смысла для поиска
+_STOP_WORDS = frozenset(
+    "и в во на с со по для не что как а или к ко о об у за от до из это "
+    "я мне меня мы нам вы вам ли же бы есть хочу можно какой какие".split()
+)
+
+# Окончания для легкого стемминга (от длинных к коротким)
+_SUFFIXES = tuple(sorted(
+    (
+        "иями ями ами ого его ому ему ыми ими ией ий ый ой ая яя ое ее ые ие ия "
+        "ов ев ам ям ах ях ом ем ию ью ей ть ться ет ют ут ит ат ят "
+        "а я ы и е о у ю ь"
+    ).split(),
+    key=len,
+    reverse=True
+))
+_MIN_STEM = 3
+_CONSONANTS = frozenset("бвгджзйклмнпрстфхцчшщ")
+
+
+def stem(token: str) -> str:
+    """
+    Легкий стемминг русских слов: отбрасывает окончание и беглую гласную
+
+    Беглая гласная перед "к" убирается во всех формах одинаково, поэтому
+    "ребенок", "ребенка" и "ребенку" дают один терм "ребенк".
+    """
+    if not _CYRILLIC_RE.search(token):
+        return token
+
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= _MIN_STEM:
+            token = token[:-len(suffix)]
+            break
+
+    if (len(token) > _MIN_STEM and token[-2:] in ("ок", "ек")
+            and token[-3] in _CONSONANTS):
+        token = token[:-2] + "к"
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Разбивает текст на термы: нижний регистр, ё → е, стоп-слова, стемминг
+
+    Коды вида FPV_FLIGHT_BASIC дают и целый терм, и его части.
+    """
+    terms = []
+    for token in _TOKEN_RE.findall(text.lower().replace("ё", "е")):
+        if token in _STOP_WORDS:
+            continue
+        if "_" in token:
+            terms.append(token)
+            terms.extend(stem(part) for part in token.split("_") if part not in _STOP_WORDS)
+        else:
+            terms.append(stem(token))
+    return terms
+
+
+class _IndexState(NamedTuple):
+    """Согласованный снимок индекса: позиции в postings указывают в doc_ids"""
+    doc_ids: List[str]
+    postings: Dict[str, List[Tuple[int, float]]]
+    exact_terms: Dict[str, str]
+    idf: Dict[str, float]
+
+
+class BM25Index:
+    """
+    Инвертированный индекс BM25 с предрассчитанными весами
+
+    build() собирает новый индекс в локальных переменных и публикует его
+    одним присваиванием, поэтому поиск в других потоках видит либо старый,
+    либо новый индекс целиком.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._state = _IndexState([], {}, {}, {})
+
+    @property
+    def doc_ids(self) -> List[str]:
+        return self._state.doc_ids
+
+    @property
+    def postings(self) -> Dict[str, List[Tuple[int, float]]]:
+        return self._state.postings
+
+    @property
+    def exact_terms(self) -> Dict[str, str]:
+        return self._state.exact_terms
+
+    def build(self, documents: Dict[str, str], exact_terms: Optional[Dict[str, str]] = None):
+        """
+        Строит индекс
+
+        Args:
+            documents: id документа → текст
+            exact_terms: точный терм (код курса, id) → id документа
+        """
+        doc_ids = list(documents)
+        doc_terms = [Counter(tokenize(documents[doc_id])) for doc_id in doc_ids]
+        doc_lengths = [sum(terms.values()) for terms in doc_terms]
+        avg_length = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0
+
+        document_frequency: Dict[str, int] = defaultdict(int)
+        for terms in doc_terms:
+            for term in terms:
+                document_frequency[term] += 1
+
+        total = len(doc_ids)
+        idf = {
+            term: math.log(1 + (total - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+        postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        for doc_index, terms in enumerate(doc_terms):
+            norm = self.k1 * (1 - self.b + self.b * doc_lengths[doc_index] / avg_length) if avg_length else self.k1
+            for term, frequency in terms.items():
+                postings[term].append((doc_index, idf[term] * frequency * (self.k1 + 1) / (frequency + norm)))
+
+        self._state = _IndexState(
+            doc_ids,
+            dict(postings),
+            {term.lower(): doc_id for term, doc_id in (exact_terms or {}).items()},
+            idf
+        )
+
+    def match_exact(self, query: str) -> List[str]:
+        """Возвращает документы, код или id которых указан в запросе дословно"""
+        exact_terms = self._state.exact_terms
+        matched = []
+        for token in _TOKEN_RE.findall(query.lower()):
+            doc_id = exact_terms.get(token)
+            if doc_id is not None and doc_id not in matched:
+                matched.append(doc_id)
+        return matched
+
+    def is_known(self, query: str) -> bool:
+        """Все ли термы запроса есть в словаре индекса"""
+        terms = tokenize(query)
+        postings = self._state.postings
+        return bool(terms) and all(term in postings for term in terms)
+
+    def search(self, query: str, limit: int, normalize: bool = False) -> List[Tuple[str, float]]:
+        """
+        Поиск BM25
+
+        Args:
+            query: Запрос
+            limit: Максимум документов
+            normalize: Вернуть вместо score его долю от наибольшего возможного
+                для запроса (0..1): вес терма не превышает idf * (k1 + 1)
+                при любой частоте и длине документа
+
+        Returns:
+            Список (id документа, score) по убыванию score
+        """
+        state = self._state  # Один снимок на весь запрос
+        terms = tokenize(query)
+        scores: Dict[int, float] = defaultdict(float)
+        for term in terms:
+            for doc_index, weight in state.postings.get(term, ()):
+                scores[doc_index] += weight
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        scale = 1.0
+        if normalize and ranked:
+            scale = 1.0 / sum(state.idf[term] * (self.k1 + 1) for term in terms if term in state.idf)
+        return [(state.doc_ids[doc_index], score * scale) for doc_index, score in ranked]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Объединяет несколько ранжирований методом reciprocal rank fusion
+
+    Args:
+        rankings: Списки id документов, каждый отсортирован по релевантности
+        k: Сглаживающая константа RRF
+
+    Returns:
+        Список (id, score RRF) по убыванию score
+    """
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
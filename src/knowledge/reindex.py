@@ -0,0 +1,40 @@
+"""
+Инкрементальная переиндексация услуг в векторной БД.
+
+Векторизует заново только новые и измененные услуги (по хэшу содержимого)
+и удаляет из БД услуги, которых больше нет в каталоге.
+
+Запуск:
+    python -m src.knowledge.reindex
+    python -m src.knowledge.reindex --full   # переиндексировать все услуги
+"""
+
+import argparse
+from .search import KnowledgeSearcher
+
+
+def main():
+    """Точка входа CLI переиндексации"""
+    parser = argparse.ArgumentParser(description="Инкрементальная переиндексация услуг")
+    parser.add_argument(
+        "--services-file",
+        default="doc/services_knowledge_base.json",
+        help="Путь к файлу с услугами"
+    )
+    parser.add_argument("--full", action="store_true", help="Переиндексировать все услуги")
+    args = parser.parse_args()
+
+    searcher = KnowledgeSearcher(args.services_file, sync_on_start=False)
+    stats = searcher.sync_index(force=args.full)
+
+    print(
+        f"Услуг в каталоге: {stats['total']}\n"
+        f"Векторизовано заново: {stats['embedded']}\n"
+        f"Удалено: {stats['deleted']}\n"
+        f"Без изменений: {stats['unchanged']}\n"
+        f"Время: {stats['seconds']}с"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Готовые текстовые представления услуг.
+
+Строятся один раз при загрузке каталога (и заново при его перезагрузке),
+чтобы на горячем пути ответ собирался склейкой готовых строк:
+- блок контекста для LLM (с заголовком, который нельзя обрезать);
+- карточка для списка результатов поиска в Telegram;
+- подробное описание услуги для Telegram.
+"""
+
+from dataclasses import dataclass
+from typing import Dict
+
+
+@dataclass(frozen=True)
+class ServiceRenderings:
+    """Представления одной услуги"""
+    llm_header: str
+    llm_context: str
+    telegram_card: str
+    telegram_details: str
+
+
+def extract_price(service: Dict) -> str:
+    """Извлекает цену из данных услуги"""
+    details = service.get("details", {})
+    if isinstance(details, dict):
+        return details.get("Цена", "Не указана")
+    return "Не указана"
+
+
+def _render_llm_context(service: Dict) -> tuple:
+    """Блок услуги для контекста LLM: (заголовок, полный текст)"""
+    header = (
+        f"Услуга: {service['name']}\n"
+        f"Категория: {service['category']}\n"
+        f"Цена: {extract_price(service)}\n"
+        f"Код курса: {service.get('courseCode', '')}\n"
+    )
+
+    text = header
+    if service.get('full_description'):
+        text += f"Описание: {service['full_description']}\n"
+    if service.get('details'):
+        text += f"Детали: {service['details']}\n"
+
+    return header, text
+
+
+def _render_telegram_card(service: Dict) -> str:
+    """Карточка услуги в списке результатов (без строки с номером и названием)"""
+    card = (
+        f"📂 Категория: {service['category']}\n"
+        f"💰 Цена: {extract_price(service)}\n"
+    )
+
+    service_details = service.get('details')
+    if isinstance(service_details, dict):
+        # Показываем ключевые детали
+        key_info = [
+            f"{key}: {value}" for key, value in service_details.items()
+            if key not in ['Цена'] and isinstance(value, str)
+        ]
+        if key_info:
+            card += f"ℹ️ {', '.join(key_info[:2])}\n"  # Максимум 2 детали
+
+    card += f"🏷️ Код: {service.get('courseCode', '')}\n\n"
+    return card
+
+
+def _render_telegram_details(service: Dict) -> str:
+    """Полная информация об услуге для Telegram"""
+    parts = [f"📋 **{service['name']}**\n\n", f"📂 Категория: {service['category']}\n"]
+
+    if service.get('sub_category'):
+        parts.append(f"📁 Подкатегория: {service['sub_category']}\n")
+
+    # Детали услуги
+    details = service.get('details', {})
+    if isinstance(details, dict):
+        parts.append("\n💡 **Детали:**\n")
+        for key, value in details.items():
+            if isinstance(value, str):
+                parts.append(f"• {key}: {value}\n")
+            elif isinstance(value, list):
+                parts.append(f"• {key}:\n")
+                parts.extend(f"  - {item}\n" for item in value)
+
+    # Полное описание
+    if service.get('full_description'):
+        parts.append(f"\n📖 **Описание:**\n{service['full_description']}\n")
+
+    parts.append(f"\n🏷️ Код услуги: {service.get('courseCode', 'Не указан')}")
+    return "".join(parts)
+
+
+def render_service(service: Dict) -> ServiceRenderings:
+    """Строит все представления услуги"""
+    llm_header, llm_context = _render_llm_context(service)
+    return ServiceRenderings(
+        llm_header=llm_header,
+        llm_context=llm_context,
+        telegram_card=_render_telegram_card(service),
+        telegram_details=_render_telegram_details(service)
+    )
@@ -1,65 +1,121 @@
+import asyncio
+import hashlib
 import json
-import os
-from typing import List, Dict, Optional
-import chromadb
-from sentence_transformers import SentenceTransformer
-from src.config.settings import logger
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, List, Dict, Optional
+import numpy as np
+from src.config.settings import settings, logger
+from .backends import create_vector_index
+from .batching import SearchBatcher
+from .cache import TTLCache, normalize_query
+from .catalogue import ServiceCatalogue
+from .rendering import ServiceRenderings, extract_price
+from .embeddings import SentenceTransformerEmbedder
+from .lexical import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+# Пул потоков для поиска: эмбеддинги и ChromaDB выполняются вне event loop
+_search_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_search_executor() -> ThreadPoolExecutor:
+    """Возвращает общий ограниченный пул потоков для поиска (создается при первом вызове)"""
+    global _search_executor
+    if _search_executor is None:
+        _search_executor = ThreadPoolExecutor(
+            max_workers=settings.search_workers,
+            thread_name_prefix="knowledge-search"
+        )
+        logger.info(f"🧵 Пул потоков поиска создан: {settings.search_workers} воркеров")
+    return _search_executor
 
 
 class KnowledgeSearcher:
     """
     Поиск по базе знаний услуг компании
-    Использует ChromaDB для векторного поиска и sentence-transformers для эмбеддингов
+    Использует векторный индекс (ChromaDB или NumPy, см. backends.py) и
+    sentence-transformers для эмбеддингов
+    (одна модель считает векторы и для индексации, и для запросов)
     """
     
-    def __init__(self, services_file: str = "doc/services_knowledge_base.json"):
+    def __init__(self, services_file: str = "doc/services_knowledge_base.json", sync_on_start: bool = True):
         """
         Инициализация поисковика
         
         Args:
             services_file: Путь к файлу с услугами
+            sync_on_start: Синхронизировать векторную БД с каталогом при создании
         """
         logger.info("🔍 Инициализация системы поиска по базе знаний")
         
-        # Инициализация модели для векторизации (локальная)
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        logger.info("✅ Модель sentence-transformers загружена")
+        # Инициализация модели для векторизации (локальная, единственная в процессе)
+        self.embedder = SentenceTransformerEmbedder()
+        self.model = self.embedder.model
         
-        # Инициализация ChromaDB (файловая БД)
-        os.makedirs("data/chroma", exist_ok=True)
-        self.client = chromadb.PersistentClient(path="data/chroma")
-        self.collection = self.client.get_or_create_collection(
-            name="services",
-            metadata={"description": "Услуги Академии дронов"}
-        )
-        logger.info("✅ ChromaDB инициализирована")
+        # Инициализация векторного индекса (хранилище выбирается в настройках)
+        # Векторы считаются нашей моделью и передаются в индекс явно
+        self.index = create_vector_index(settings.search_backend)
         
-        # Загрузка услуг в БД
+        # Каталог услуг в памяти (индекс id → услуга, перезагрузка по mtime)
         self.services_file = services_file
-        self._load_services_if_needed()
+        self.catalogue = ServiceCatalogue(services_file)
         
-        logger.info(f"🎯 Система поиска готова. Услуг в БД: {self.collection.count()}")
-
-    def _load_services_if_needed(self):
-        """Загружает услуги в БД если она пустая"""
-        if self.collection.count() == 0:
-            logger.info("📦 База данных пустая, загружаем услуги")
-            self.load_services_from_file()
-        else:
-            logger.info(f"📊 База данных уже содержит {self.collection.count()} услуг")
+        # Кэши повторяющихся запросов: нормализованный текст → эмбеддинг / результаты
+        self.embedding_cache = TTLCache(settings.search_cache_size, settings.search_cache_ttl)
+        self.results_cache = TTLCache(settings.search_cache_size, settings.search_cache_ttl)
+        
+        # Лексический индекс BM25 (коды курсов, русские ключевые слова)
+        self.lexical_index = BM25Index()
+        self._build_lexical_index()
+        
+        # Сборщик одновременных asearch (создается при первом вызове в event loop)
+        self._batcher: Optional[SearchBatcher] = None
+        
+        # Синхронизация векторной БД с каталогом (переиндексируются только изменения)
+        self._sync_lock = threading.Lock()
+        if sync_on_start:
+            self.sync_index()
+        
+        logger.info(f"🎯 Система поиска готова. Услуг в БД: {self.index.count()}")
 
     def load_services_from_file(self):
         """
-        Загружает услуги из JSON файла в векторную БД
+        Перечитывает JSON файл услуг и синхронизирует с ним векторную БД
         """
         try:
-            with open(self.services_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            self.catalogue.reload()
+            self._on_catalogue_reloaded()
+            self.sync_index()
             
-            services = data.get('services', [])
-            logger.info(f"📋 Загружаем {len(services)} услуг в векторную БД")
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки услуг: {e}")
+            raise
+
+    def sync_index(self, force: bool = False) -> Dict[str, Any]:
+        """
+        Инкрементально синхронизирует векторную БД с каталогом услуг
+        
+        Для каждой услуги считается хэш текста для векторизации и метаданных.
+        Заново векторизуются только новые и измененные услуги, удаленные из
+        каталога услуги удаляются из БД.
+        
+        Args:
+            force: Переиндексировать все услуги независимо от хэшей
+            
+        Returns:
+            Статистика синхронизации (embedded, deleted, unchanged, total, seconds)
+        """
+        with self._sync_lock:
+            started = time.perf_counter()
+            services = self.catalogue.services
             
-            # Подготовка данных для ChromaDB
+            # Текущие хэши в БД
+            existing_hashes = self.index.get_hashes()
+            
+            # Подготовка данных для индекса только по изменившимся услугам
             documents = []
             metadatas = []
             ids = []
@@ -67,31 +123,122 @@ class KnowledgeSearcher:
             for service in services:
                 # Создаем полный текст для векторизации
                 search_text = self._create_search_text(service)
-                documents.append(search_text)
                 
                 # Метаданные для фильтрации и возврата результатов
-                metadata = {
-                    "id": service["id"],
-                    "name": service["name"],
-                    "category": service["category"],
-                    "courseCode": service.get("courseCode", ""),
-                    "price": self._extract_price(service),
-                }
+                metadata = self._build_metadata(service)
+                metadata["content_hash"] = self._content_hash(search_text, metadata)
+                
+                if not force and existing_hashes.get(service["id"]) == metadata["content_hash"]:
+                    continue
+                
+                documents.append(search_text)
                 metadatas.append(metadata)
                 ids.append(service["id"])
             
-            # Добавление в ChromaDB (автоматическая векторизация)
-            self.collection.add(
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
-            )
+            catalogue_ids = {service["id"] for service in services}
+            removed_ids = [service_id for service_id in existing_hashes if service_id not in catalogue_ids]
             
-            logger.info(f"✅ Загружено {len(services)} услуг в векторную БД")
+            if ids:
+                # Векторизация батчами и добавление/обновление в индексе
+                embeddings = self.embedder.encode(documents)
+                self.index.upsert(ids, embeddings, metadatas, documents)
             
-        except Exception as e:
-            logger.error(f"❌ Ошибка загрузки услуг: {e}")
-            raise
+            if removed_ids:
+                self.index.delete(removed_ids)
+            
+            stats = {
+                "total": len(services),
+                "embedded": len(ids),
+                "deleted": len(removed_ids),
+                "unchanged": len(services) - len(ids),
+                "seconds": round(time.perf_counter() - started, 3)
+            }
+        
+        if ids or removed_ids:
+            # Результаты поиска могли измениться
+            self.results_cache.clear()
+        
+        logger.info(
+            f"✅ Синхронизация векторной БД: векторизовано {stats['embedded']}, "
+            f"удалено {stats['deleted']}, без изменений {stats['unchanged']} "
+            f"за {stats['seconds']}с"
+        )
+        return stats
+
+    def _build_metadata(self, service: Dict) -> Dict:
+        """Метаданные услуги, которые хранятся в индексе и возвращаются в результатах"""
+        return {
+            "id": service["id"],
+            "name": service["name"],
+            "category": service["category"],
+            "courseCode": service.get("courseCode", ""),
+            "price": self._extract_price(service),
+        }
+
+    def _content_hash(self, search_text: str, metadata: Dict) -> str:
+        """Хэш содержимого услуги: текст для векторизации + метаданные"""
+        payload = search_text + "\x00" + json.dumps(metadata, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _refresh_catalogue(self) -> bool:
+        """Подхватывает изменения файла услуг (проверка mtime не чаще интервала)"""
+        reloaded = self.catalogue.refresh_if_changed()
+        if reloaded:
+            self._on_catalogue_reloaded()
+            self.sync_index()
+        return reloaded
+
+    def _on_catalogue_reloaded(self):
+        """Перестраивает производные структуры после перезагрузки каталога"""
+        self._build_lexical_index()
+        self._invalidate_caches()
+
+    def _invalidate_caches(self):
+        """Сбрасывает кэши запросов после перезагрузки каталога"""
+        self.embedding_cache.clear()
+        self.results_cache.clear()
+        logger.info("🧹 Кэши поиска очищены")
+
+    def _build_lexical_index(self):
+        """Строит индекс BM25 по тексту услуг; коды курсов и id ищутся дословно"""
+        services = self.catalogue.services
+        documents = {service["id"]: self._create_search_text(service) for service in services}
+        
+        exact_terms = {service["id"]: service["id"] for service in services}
+        for service in services:
+            if service.get("courseCode"):
+                exact_terms[service["courseCode"]] = service["id"]
+        
+        self.lexical_index.build(documents, exact_terms)
+        logger.info(f"📇 Лексический индекс BM25 построен: {len(self.lexical_index.postings)} термов")
+
+    def _embed_queries(self, normalized_queries: List[str]) -> np.ndarray:
+        """Эмбеддинги нормализованных запросов: кэш + один батч для промахов"""
+        embeddings: Dict[str, np.ndarray] = {}
+        for normalized_query in normalized_queries:
+            if normalized_query not in embeddings:
+                cached = self.embedding_cache.get(normalized_query)
+                if cached is not None:
+                    embeddings[normalized_query] = cached
+        
+        missing = [query for query in dict.fromkeys(normalized_queries) if query not in embeddings]
+        if missing:
+            for normalized_query, embedding in zip(missing, self.embedder.encode(missing)):
+                embeddings[normalized_query] = embedding
+                self.embedding_cache.set(normalized_query, embedding)
+        
+        return np.vstack([embeddings[query] for query in normalized_queries])
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Нормализованный эмбеддинг запроса (из кэша, если запрос уже искали)"""
+        return self._embed_queries([normalize_query(query)])[0]
+
+    def get_cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Статистика эффективности кэшей поиска"""
+        return {
+            "embeddings": self.embedding_cache.stats(),
+            "results": self.results_cache.stats()
+        }
 
     def _create_search_text(self, service: Dict) -> str:
         """
@@ -124,10 +271,7 @@ class KnowledgeSearcher:
 
     def _extract_price(self, service: Dict) -> str:
         """Извлекает цену из данных услуги"""
-        details = service.get("details", {})
-        if isinstance(details, dict):
-            return details.get("Цена", "Не указана")
-        return "Не указана"
+        return extract_price(service)
 
     def search(self, query: str, limit: int = 3) -> List[Dict]:
         """
@@ -140,43 +284,202 @@ class KnowledgeSearcher:
         Returns:
             Список найденных услуг с метаданными
         """
+        return self.search_many([query], limit)[0]
+
+    def search_many(self, queries: List[str], limit: int = 3) -> List[List[Dict]]:
+        """
+        Поиск по нескольким запросам за один проход модели и один запрос к индексу
+        
+        Args:
+            queries: Поисковые запросы пользователей
+            limit: Максимальное количество результатов на запрос
+            
+        Returns:
+            Списки найденных услуг в порядке запросов
+        """
         try:
-            logger.info(f"🔍 Поиск по запросу: '{query}' (лимит: {limit})")
+            logger.info(f"🔍 Поиск по {len(queries)} запросам: {queries} (лимит: {limit})")
             
-            # Выполняем векторный поиск
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=limit,
-                include=["metadatas", "documents", "distances"]
-            )
+            self._refresh_catalogue()
             
-            # Формируем ответ
-            found_services = []
-            if results['metadatas'] and results['metadatas'][0]:
-                for i, metadata in enumerate(results['metadatas'][0]):
-                    distance = results['distances'][0][i]
-                    similarity = 1 - distance  # Преобразуем расстояние в схожесть
-                    
-                    service_result = {
-                        "id": metadata["id"],
-                        "name": metadata["name"],
-                        "category": metadata["category"],
-                        "courseCode": metadata["courseCode"],
-                        "price": metadata["price"],
-                        "similarity": round(similarity, 3),
-                        "relevance_score": round(similarity * 100, 1)
-                    }
-                    found_services.append(service_result)
+            all_results: List[Optional[List[Dict]]] = [None] * len(queries)
+            vector_positions: List[int] = []
+            normalized_queries = [normalize_query(query) for query in queries]
             
-            logger.info(f"✅ Найдено {len(found_services)} релевантных услуг")
-            for service in found_services:
-                logger.info(f"  📌 {service['name']} (релевантность: {service['relevance_score']}%)")
+            for position, normalized_query in enumerate(normalized_queries):
+                # Повторяющиеся вопросы отдаем из кэша без эмбеддинга и векторного индекса
+                cached_results = self.results_cache.get((normalized_query, limit))
+                if cached_results is not None:
+                    logger.info(f"⚡ Результаты поиска из кэша: {len(cached_results)} услуг")
+                    all_results[position] = [dict(service) for service in cached_results]
+                    continue
                 
-            return found_services
+                # Коды курсов и известные ключевые слова - без модели эмбеддингов
+                found_services = self._search_lexical(normalized_query, limit)
+                if found_services is None:
+                    vector_positions.append(position)
+                else:
+                    self._remember_results(normalized_query, limit, found_services)
+                    all_results[position] = found_services
+            
+            if vector_positions:
+                # Выполняем векторный поиск: один батч эмбеддингов и один запрос к индексу
+                query_embeddings = self._embed_queries([normalized_queries[i] for i in vector_positions])
+                candidates = max(limit, settings.hybrid_candidates) if settings.hybrid_search else limit
+                results = self.index.query(query_embeddings, candidates)
+                
+                for position, query_results in zip(vector_positions, results):
+                    normalized_query = normalized_queries[position]
+                    
+                    # Формируем ответ
+                    vector_results = [
+                        self._build_result(metadata, distance)
+                        for metadata, distance in query_results
+                    ]
+                    found_services = (
+                        self._fuse_with_lexical(normalized_query, vector_results, limit)
+                        if settings.hybrid_search else vector_results[:limit]
+                    )
+                    self._remember_results(normalized_query, limit, found_services)
+                    all_results[position] = found_services
+            
+            return all_results
             
         except Exception as e:
             logger.error(f"❌ Ошибка поиска: {e}")
-            return []
+            return [[] for _ in queries]
+
+    def _remember_results(self, normalized_query: str, limit: int, found_services: List[Dict]):
+        """Логгирует результаты поиска и сохраняет их в кэш"""
+        logger.info(f"✅ Найдено {len(found_services)} релевантных услуг по '{normalized_query}'")
+        for service in found_services:
+            logger.info(f"  📌 {service['name']} (релевантность: {service['relevance_score']}%)")
+        
+        self.results_cache.set((normalized_query, limit), [dict(service) for service in found_services])
+
+    def _search_lexical(self, normalized_query: str, limit: int) -> Optional[List[Dict]]:
+        """
+        Быстрый путь без эмбеддингов: точные коды курсов и короткие запросы из ключевых слов
+        
+        Returns:
+            Результаты поиска или None, если нужен векторный поиск
+        """
+        if not settings.hybrid_search:
+            return None
+        
+        exact_ids = self.lexical_index.match_exact(normalized_query)
+        if exact_ids:
+            logger.info(f"🎯 Точное совпадение кода: {', '.join(exact_ids)}")
+            return [
+                self._build_result_by_id(service_id, 1.0)
+                for service_id in exact_ids[:limit]
+                if self.catalogue.get(service_id) is not None
+            ]
+        
+        if (len(tokenize(normalized_query)) <= settings.lexical_max_keyword_tokens
+                and self.lexical_index.is_known(normalized_query)):
+            # Релевантность - доля score от наибольшего возможного BM25 для запроса
+            hits = self.lexical_index.search(normalized_query, limit, normalize=True)
+            if hits:
+                logger.info(f"🔤 Поиск по ключевым словам BM25: {len(hits)} услуг")
+                return [
+                    self._build_result_by_id(service_id, relevance)
+                    for service_id, relevance in hits
+                    if self.catalogue.get(service_id) is not None
+                ]
+        
+        return None
+
+    def _fuse_with_lexical(self, normalized_query: str, vector_results: List[Dict], limit: int) -> List[Dict]:
+        """Объединяет векторные результаты с BM25 методом reciprocal rank fusion"""
+        candidates = max(limit, settings.hybrid_candidates)
+        lexical_hits = self.lexical_index.search(normalized_query, candidates)
+        if not lexical_hits:
+            return vector_results[:limit]
+        
+        rrf_k = settings.hybrid_rrf_k
+        fused = reciprocal_rank_fusion(
+            [[service["id"] for service in vector_results], [service_id for service_id, _ in lexical_hits]],
+            k=rrf_k
+        )
+        
+        # Нормируем RRF на максимум (первое место в обоих ранжированиях)
+        best_possible = 2.0 / (rrf_k + 1)
+        by_id = {service["id"]: service for service in vector_results}
+        
+        found_services = []
+        for service_id, score in fused:
+            if len(found_services) >= limit:
+                break
+            if service_id not in by_id and self.catalogue.get(service_id) is None:
+                continue
+            found_services.append(self._build_result_by_id(service_id, score / best_possible, by_id.get(service_id)))
+        return found_services
+
+    def _build_result_by_id(self, service_id: str, similarity: float, base: Optional[Dict] = None) -> Dict:
+        """Формирует результат поиска по id услуги из каталога с заданной схожестью"""
+        result = dict(base) if base else self._build_metadata(self.catalogue.get(service_id))
+        result["similarity"] = round(similarity, 3)
+        result["relevance_score"] = round(similarity * 100, 1)
+        return result
+
+    def _build_result(self, metadata: Dict, distance: float) -> Dict:
+        """Формирует результат поиска из метаданных индекса"""
+        similarity = 1 - distance  # Преобразуем расстояние в схожесть
+        
+        return {
+            "id": metadata["id"],
+            "name": metadata["name"],
+            "category": metadata["category"],
+            "courseCode": metadata["courseCode"],
+            "price": metadata["price"],
+            "similarity": round(similarity, 3),
+            "relevance_score": round(similarity * 100, 1)
+        }
+
+    async def _run_in_pool(self, func, *args):
+        """Выполняет блокирующую функцию поиска в пуле потоков, не блокируя event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_search_executor(), partial(func, *args))
+
+    async def asearch(self, query: str, limit: int = 3) -> List[Dict]:
+        """
+        Асинхронный поиск релевантных услуг (выполняется в пуле потоков)
+        
+        Если задано окно SEARCH_BATCH_WINDOW_MS, одновременные запросы
+        собираются в один вызов search_many.
+        
+        Args:
+            query: Поисковый запрос пользователя
+            limit: Максимальное количество результатов
+            
+        Returns:
+            Список найденных услуг с метаданными
+        """
+        if settings.search_batch_window_ms > 0:
+            if self._batcher is None:
+                self._batcher = SearchBatcher(
+                    self, settings.search_batch_window_ms, settings.search_batch_max_size
+                )
+            return await self._batcher.search(query, limit)
+        
+        return await self._run_in_pool(self.search, query, limit)
+
+    async def asearch_many(self, queries: List[str], limit: int = 3) -> List[List[Dict]]:
+        """Асинхронный пакетный поиск (выполняется в пуле потоков)"""
+        return await self._run_in_pool(self.search_many, queries, limit)
+
+    async def aembed_query(self, query: str) -> np.ndarray:
+        """Асинхронное получение эмбеддинга запроса (выполняется в пуле потоков)"""
+        return await self._run_in_pool(self.embed_query, query)
+
+    async def aget_service_details(self, service_id: str) -> Optional[Dict]:
+        """Асинхронное получение деталей услуги (выполняется в пуле потоков)"""
+        return await self._run_in_pool(self.get_service_details, service_id)
+
+    async def asearch_and_format_for_telegram(self, query: str, limit: int = 3) -> str:
+        """Асинхронный поиск с форматированием для Telegram (выполняется в пуле потоков)"""
+        return await self._run_in_pool(self.search_and_format_for_telegram, query, limit)
 
     def get_service_details(self, service_id: str) -> Optional[Dict]:
         """
@@ -189,14 +492,12 @@ class KnowledgeSearcher:
             Полная информация об услуге или None
         """
         try:
-            with open(self.services_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            self._refresh_catalogue()
             
-            services = data.get('services', [])
-            for service in services:
-                if service["id"] == service_id:
-                    logger.info(f"📄 Получены детали услуги: {service['name']}")
-                    return service
+            service = self.catalogue.get(service_id)
+            if service is not None:
+                logger.info(f"📄 Получены детали услуги: {service['name']}")
+                return service
                     
             logger.warning(f"⚠️ Услуга с ID '{service_id}' не найдена")
             return None
@@ -205,6 +506,15 @@ class KnowledgeSearcher:
             logger.error(f"❌ Ошибка получения деталей услуги: {e}")
             return None
 
+    def get_service_renderings(self, service_id: str) -> Optional[ServiceRenderings]:
+        """
+        Готовые представления услуги (контекст LLM, карточки Telegram)
+        
+        Только чтение из памяти - можно вызывать прямо в event loop:
+        каталог уже проверен на изменения поиском, вернувшим эту услугу.
+        """
+        return self.catalogue.get_renderings(service_id)
+
     def search_and_format_for_telegram(self, query: str, limit: int = 3) -> str:
         """
         Поиск услуг с форматированием для отправки в Telegram
@@ -225,32 +535,24 @@ class KnowledgeSearcher:
                 "что вас интересует (например: 'обучение полетам', 'корпоративные мероприятия', 'индивидуальные занятия')."
             )
         
-        response = f"🎯 Нашел для вас {len(results)} подходящих услуг:\n\n"
+        parts = [f"🎯 Нашел для вас {len(results)} подходящих услуг:\n\n"]
         
         for i, service in enumerate(results, 1):
-            response += f"**{i}. {service['name']}**\n"
-            response += f"📂 Категория: {service['category']}\n"
-            response += f"💰 Цена: {service['price']}\n"
-            
-            # Добавляем детальную информацию если доступна
-            details = self.get_service_details(service['id'])
-            if details and details.get('details'):
-                service_details = details['details']
-                if isinstance(service_details, dict):
-                    # Показываем ключевые детали
-                    key_info = []
-                    for key, value in service_details.items():
-                        if key not in ['Цена'] and isinstance(value, str):
-                            key_info.append(f"{key}: {value}")
-                    
-                    if key_info:
-                        response += f"ℹ️ {', '.join(key_info[:2])}\n"  # Максимум 2 детали
-            
-            response += f"🏷️ Код: {service['courseCode']}\n\n"
+            parts.append(f"**{i}. {service['name']}**\n")
+            renderings = self.catalogue.get_renderings(service['id'])
+            if renderings is not None:
+                parts.append(renderings.telegram_card)
+            else:
+                # Индекс опередил каталог: показываем то, что есть в метаданных
+                parts.append(
+                    f"📂 Категория: {service['category']}\n"
+                    f"💰 Цена: {service['price']}\n"
+                    f"🏷️ Код: {service['courseCode']}\n\n"
+                )
         
-        response += "💬 Хотите узнать подробнее о какой-то из услуг или у вас есть другие вопросы?"
+        parts.append("💬 Хотите узнать подробнее о какой-то из услуг или у вас есть другие вопросы?")
         
-        return response
+        return "".join(parts)
 
     def format_service_details(self, service_id: str) -> str:
         """
@@ -263,45 +565,50 @@ class KnowledgeSearcher:
             Подробная информация об услуге
         """
         service = self.get_service_details(service_id)
+        renderings = self.catalogue.get_renderings(service_id) if service else None
         
-        if not service:
+        if renderings is None:
             return "❌ Услуга не найдена. Попробуйте поискать еще раз."
         
-        response = f"📋 **{service['name']}**\n\n"
-        response += f"📂 Категория: {service['category']}\n"
-        
-        if service.get('sub_category'):
-            response += f"📁 Подкатегория: {service['sub_category']}\n"
-        
-        # Детали услуги
-        details = service.get('details', {})
-        if isinstance(details, dict):
-            response += "\n💡 **Детали:**\n"
-            for key, value in details.items():
-                if isinstance(value, str):
-                    response += f"• {key}: {value}\n"
-                elif isinstance(value, list):
-                    response += f"• {key}:\n"
-                    for item in value:
-                        response += f"  - {item}\n"
-        
-        # Полное описание
-        if service.get('full_description'):
-            response += f"\n📖 **Описание:**\n{service['full_description']}\n"
-        
-        response += f"\n🏷️ Код услуги: {service.get('courseCode', 'Не указан')}"
+        return renderings.telegram_details
+
+
+# Реестр поисковиков процесса: модель и ChromaDB создаются один раз на файл услуг
+_searchers: Dict[str, KnowledgeSearcher] = {}
+_searchers_lock = threading.Lock()
+
+
+def get_knowledge_searcher(services_file: str = "doc/services_knowledge_base.json") -> KnowledgeSearcher:
+    """
+    Возвращает общий для процесса поисковик, создавая его при первом обращении
+    
+    Args:
+        services_file: Путь к файлу с услугами
         
-        return response
+    Returns:
+        Единственный экземпляр KnowledgeSearcher для этого файла
+    """
+    searcher = _searchers.get(services_file)
+    if searcher is None:
+        with _searchers_lock:
+            searcher = _searchers.get(services_file)
+            if searcher is None:
+                searcher = KnowledgeSearcher(services_file)
+                _searchers[services_file] = searcher
+    return searcher
+
 
+async def warm_up_knowledge_searcher() -> KnowledgeSearcher:
+    """Заранее загружает модель и ChromaDB в пуле потоков, не блокируя event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_search_executor(), get_knowledge_searcher)
 
-# Глобальный экземпляр для использования в приложении
-knowledge_searcher = KnowledgeSearcher()
 
 # Удобные функции для использования в handlers
 def search_services(query: str, limit: int = 3) -> str:
     """Поиск услуг с форматированием для Telegram"""
-    return knowledge_searcher.search_and_format_for_telegram(query, limit)
+    return get_knowledge_searcher().search_and_format_for_telegram(query, limit)
 
 def get_service_info(service_id: str) -> str:
     """Получение подробной информации об услуге"""
-    return knowledge_searcher.format_service_details(service_id) 
\ No newline at end of file
+    return get_knowledge_searcher().format_service_details(service_id) 
\ No newline at end of file
@@ -6,6 +6,7 @@
 """
 
 from .client import LLMClient
+from .errors import LLMUnavailableError
 from .logger import LLMLogger, llm_logger
 
-__all__ = ["LLMClient", "LLMLogger", "llm_logger"] 
\ No newline at end of file
+__all__ = ["LLMClient", "LLMUnavailableError", "LLMLogger", "llm_logger"] 
\ No newline at end of file
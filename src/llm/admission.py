@@ -0,0 +1,205 @@
+"""
+Контроль допуска запросов к OpenRouter.
+
+Бесплатная модель имеет жесткие лимиты: при всплесках нагрузки API
+отвечает 429. Перед отправкой запрос проходит три проверки:
+- не больше LLM_MAX_IN_FLIGHT одновременных запросов (семафор);
+- лимиты запросов и токенов в минуту (token bucket);
+- ограниченная очередь ожидания с дедлайном LLM_QUEUE_TIMEOUT.
+Если запрос не успеет пройти до дедлайна, он сразу отклоняется
+с LLMUnavailableError - бот отвечает простым поиском, а не ждет таймаута.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from src.config.settings import logger
+from .errors import LLMUnavailableError
+
+
+def estimate_request_tokens(messages: List[Dict], max_completion_tokens: int) -> int:
+    """Грубая оценка токенов запроса: ~3 символа на токен для русского текста + лимит ответа"""
+    prompt_chars = sum(len(message.get("content", "")) for message in messages)
+    return prompt_chars // 3 + max_completion_tokens
+
+
+class TokenBucket:
+    """Token bucket с пополнением rate_per_minute в минуту (0 - без ограничения)"""
+
+    def __init__(self, rate_per_minute: float):
+        self.rate_per_second = rate_per_minute / 60
+        self.capacity = rate_per_minute
+        self.tokens = float(rate_per_minute)
+        self._updated_at = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate_per_second <= 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.rate_per_second)
+        self._updated_at = now
+
+    def time_until(self, amount: float) -> float:
+        """Через сколько секунд будет доступно amount токенов (0 - уже доступно)"""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        # Запрос больше емкости ждет полного бакета, а не бесконечно
+        needed = min(amount, self.capacity) - self.tokens
+        return max(0.0, needed / self.rate_per_second)
+
+    def consume(self, amount: float):
+        """Списывает токены (баланс может уйти в минус после уточнения расхода)"""
+        if not self.unlimited:
+            self._refill()
+            self.tokens -= amount
+
+
+@dataclass
+class AdmissionTicket:
+    """Разрешение на один запрос к API"""
+    estimated_tokens: int
+    waited_ms: float
+
+
+class AdmissionController:
+    """Семафор одновременных запросов + лимиты RPM/TPM + очередь с дедлайном"""
+
+    def __init__(self, max_in_flight: int, requests_per_minute: float, tokens_per_minute: float,
+                 max_queue_size: int, queue_timeout: float):
+        """
+        Args:
+            max_in_flight: Максимум одновременных запросов к API
+            requests_per_minute: Лимит запросов в минуту (0 - без ограничения)
+            tokens_per_minute: Лимит токенов в минуту (0 - без ограничения)
+            max_queue_size: Сколько запросов может ждать допуска одновременно
+            queue_timeout: Сколько запрос может ждать допуска, сек
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue_size = max_queue_size
+        self.queue_timeout = queue_timeout
+        self.requests_bucket = TokenBucket(requests_per_minute)
+        self.tokens_bucket = TokenBucket(tokens_per_minute)
+
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+
+    def _reject(self, reason: str, message: str) -> LLMUnavailableError:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        logger.warning(f"🚦 Запрос к LLM отклонен ({reason}): {message}")
+        return LLMUnavailableError(reason, message)
+
+    async def acquire(self, estimated_tokens: int) -> AdmissionTicket:
+        """
+        Ждет допуска запроса не дольше queue_timeout
+
+        Raises:
+            LLMUnavailableError: Очередь полна или допуск не успеет до дедлайна
+        """
+        # Лимиты не освободятся до дедлайна - не занимаем место в очереди
+        wait = max(self.requests_bucket.time_until(1), self.tokens_bucket.time_until(estimated_tokens))
+        if wait > self.queue_timeout:
+            raise self._reject("rate_limit", f"лимит освободится через {wait:.1f}с")
+
+        started = time.monotonic()
+        deadline = started + self.queue_timeout
+
+        if self._semaphore.locked():
+            # Все слоты заняты: ждем в ограниченной очереди
+            if self.waiting >= self.max_queue_size:
+                raise self._reject("queue_full", f"в очереди уже {self.waiting} запросов")
+
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise self._reject(
+                    "concurrency", f"все {self.max_in_flight} слотов заняты дольше {self.queue_timeout}с"
+                )
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+
+        # Слот получен: ждем лимиты, если они освободятся до дедлайна
+        try:
+            while True:
+                wait = max(
+                    self.requests_bucket.time_until(1),
+                    self.tokens_bucket.time_until(estimated_tokens)
+                )
+                if wait <= 0:
+                    break
+                if time.monotonic() + wait > deadline:
+                    raise self._reject("rate_limit", f"лимит освободится через {wait:.1f}с")
+                await asyncio.sleep(wait)
+        except BaseException:
+            # Отказ или отмена ожидания - слот возвращается
+            self._semaphore.release()
+            raise
+
+        self.requests_bucket.consume(1)
+        self.tokens_bucket.consume(estimated_tokens)
+        self.in_flight += 1
+        self.admitted += 1
+
+        return AdmissionTicket(estimated_tokens, (time.monotonic() - started) * 1000)
+
+    async def try_acquire(self, estimated_tokens: int) -> Optional[AdmissionTicket]:
+        """Допуск без ожидания (для страховочных запросов): None, если слот или лимиты заняты"""
+        if self._semaphore.locked() or self.waiting:
+            return None
+        if self.requests_bucket.time_until(1) > 0 or self.tokens_bucket.time_until(estimated_tokens) > 0:
+            return None
+
+        await self._semaphore.acquire()  # Слот свободен - захват без ожидания
+        self.requests_bucket.consume(1)
+        self.tokens_bucket.consume(estimated_tokens)
+        self.in_flight += 1
+        self.admitted += 1
+        return AdmissionTicket(estimated_tokens, 0.0)
+
+    def try_charge(self, estimated_tokens: int) -> bool:
+        """
+        Списывает лимиты RPM/TPM за повтор без ожидания (слот остается у исходного запроса)
+
+        Returns:
+            False, если лимиты исчерпаны или допуска ждут другие запросы
+        """
+        if self.waiting:
+            return False
+        if self.requests_bucket.time_until(1) > 0 or self.tokens_bucket.time_until(estimated_tokens) > 0:
+            return False
+
+        self.requests_bucket.consume(1)
+        self.tokens_bucket.consume(estimated_tokens)
+        self.admitted += 1
+        return True
+
+    def release(self, ticket: AdmissionTicket, actual_tokens: int = 0):
+        """
+        Освобождает слот и уточняет расход токенов по usage из ответа
+
+        Args:
+            ticket: Разрешение из acquire
+            actual_tokens: Фактически израсходовано токенов (0 - оставить оценку)
+        """
+        if actual_tokens:
+            self.tokens_bucket.consume(actual_tokens - ticket.estimated_tokens)
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def get_stats(self) -> Dict:
+        """Текущая загрузка и счетчики отказов"""
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected)
+        }
@@ -0,0 +1,101 @@
+"""
+Автоматический выключатель (circuit breaker) для OpenRouter.
+
+При сбое API каждый запрос ждал бы полный таймаут, прежде чем бот
+ответит извинением. Выключатель следит за итогами запросов через
+LLMLogger и после серии ошибок размыкается: запросы к LLM сразу
+отклоняются, бот отвечает простым поиском. Через LLM_BREAKER_OPEN_SECONDS
+выключатель переходит в полуоткрытое состояние и пропускает не больше
+одного пробного запроса за LLM_BREAKER_PROBE_INTERVAL - успешный ответ
+замыкает цепь, ошибка снова размыкает ее.
+"""
+
+import time
+from typing import Dict, Literal
+from src.config.settings import logger
+from .logger import LLMRequestMetrics
+
+BreakerState = Literal["closed", "open", "half_open"]
+
+
+class CircuitBreaker:
+    """Выключатель closed → open → half_open → closed по итогам запросов к API"""
+
+    def __init__(self, failure_threshold: int, open_seconds: float, probe_interval: float):
+        """
+        Args:
+            failure_threshold: Сколько ошибок подряд размыкают цепь
+            open_seconds: Сколько цепь разомкнута до первой пробы, сек
+            probe_interval: Минимальный интервал между пробными запросами, сек
+        """
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.probe_interval = probe_interval
+
+        self.state: BreakerState = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.last_probe_at = 0.0
+        self.times_opened = 0
+
+    def _probe_due(self, now: float) -> bool:
+        if self.state == "open":
+            return now - self.opened_at >= self.open_seconds
+        return now - self.last_probe_at >= self.probe_interval
+
+    def rejects_requests(self) -> bool:
+        """Будет ли сейчас отклонен запрос (проверка без расхода пробы)"""
+        return self.state != "closed" and not self._probe_due(time.monotonic())
+
+    def allow_request(self) -> bool:
+        """Можно ли отправить запрос; в полуоткрытом состоянии расходует пробу"""
+        if self.state == "closed":
+            return True
+
+        now = time.monotonic()
+        if not self._probe_due(now):
+            return False
+
+        if self.state == "open":
+            self.state = "half_open"
+            logger.info("🟡 Circuit breaker LLM: полуоткрыт, пробный запрос")
+        self.last_probe_at = now
+        return True
+
+    def on_request_finished(self, metrics: LLMRequestMetrics):
+        """Слушатель LLMLogger: учитывает итог запроса к API"""
+        if metrics.outcome == "cache_hit":
+            return
+        if metrics.outcome == "rejected":
+            return  # Отказ до отправки запроса ничего не говорит о состоянии API
+
+        if metrics.success:
+            self._record_success()
+        else:
+            self._record_failure(metrics.error_type)
+
+    def _record_success(self):
+        self.consecutive_failures = 0
+        if self.state != "closed":
+            self.state = "closed"
+            logger.info("🟢 Circuit breaker LLM: замкнут, API снова отвечает")
+
+    def _record_failure(self, error_type: str):
+        self.consecutive_failures += 1
+        if self.state == "half_open" or (
+            self.state == "closed" and self.consecutive_failures >= self.failure_threshold
+        ):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+            logger.warning(
+                f"🔴 Circuit breaker LLM: разомкнут после {self.consecutive_failures} ошибок "
+                f"(последняя: {error_type}), {self.open_seconds:.0f}с отвечаем поиском"
+            )
+
+    def get_stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened
+        }
@@ -1,16 +1,39 @@
 """
 LLM клиент для работы с OpenRouter API.
 
-Использует бесплатную модель qwen/qwen3-14b:free для генерации
-человекоподобных ответов в контексте консультации по услугам.
+Использует бесплатную модель qwen/qwen3-14b:free (и резервные модели
+из LLM_MODELS) для генерации человекоподобных ответов в контексте
+консультации по услугам.
 """
 
+import asyncio
+import hashlib
 import httpx
 import json
+import re
+import time
+import numpy as np
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 from src.config.settings import settings, logger
+from .admission import AdmissionController, AdmissionTicket, estimate_request_tokens
+from .circuit_breaker import CircuitBreaker
+from .errors import LLMUnavailableError
 from .logger import llm_logger
+from .prompt_builder import PromptBuilder, ServicesContext, TokenCounter, render_services
+from .response_cache import ResponseCache, prior_history
+from .routing import ModelRouter, RetryPolicy, is_retryable, retry_after_seconds
+
+
+# Сводка диалога: каждое сообщение обрезается до этого числа токенов
+_SUMMARY_MESSAGE_TOKENS = 300
+_HTML_TAG = re.compile(r"<[^>]+>")
+_SUMMARY_PROMPT = (
+    "Ты ведешь краткую сводку диалога консультанта Академии дронов с клиентом. "
+    "Обнови сводку с учетом новых сообщений: что интересует клиента, какие услуги "
+    "и цены обсуждались, что клиент выбрал, его контактные данные и открытые вопросы. "
+    "Пиши кратко, в третьем лице, без приветствий и без HTML. Верни только текст сводки."
+)
 
 
 class LLMClient:
@@ -19,7 +42,16 @@ class LLMClient:
     def __init__(self):
         """Инициализация LLM клиента с настройками OpenRouter"""
         self.api_url = "https://openrouter.ai/api/v1/chat/completions"
-        self.model = "qwen/qwen3-14b:free"  # Бесплатная модель 14.8B параметров
+        # Модели в порядке предпочтения: основная бесплатная qwen3-14b и резервные
+        self.models = [model.strip() for model in settings.llm_models.split(",") if model.strip()]
+        self.model = self.models[0]
+        self.router = ModelRouter(self.models, hedge_min_samples=settings.llm_hedge_min_samples)
+        self.retry_policy = RetryPolicy(
+            max_retries=settings.llm_max_retries,
+            base_delay=settings.llm_retry_base_delay,
+            max_delay=settings.llm_retry_max_delay
+        )
+        self.max_tokens = 800  # Ограничиваем длину ответа
         self.headers = {
             "Authorization": f"Bearer {settings.openrouter_api_key}",
             "Content-Type": "application/json",
@@ -29,9 +61,99 @@ class LLMClient:
         
         # Загружаем системный промпт из файла
         self.system_prompt = self._load_system_prompt()
+        self.system_prompt_hash = hashlib.sha256(self.system_prompt.encode("utf-8")).hexdigest()[:16]
+        
+        # Сборка промпта в бюджет токенов (токенизатор загружается в start())
+        self.token_counter = TokenCounter(settings.llm_tokenizer)
+        self.prompt_builder = PromptBuilder(self.token_counter, settings.llm_prompt_token_budget)
+        self._tokenizer_loading: Optional[asyncio.Future] = None
+        
+        # Кэш ответов на первые вопросы диалога
+        self.response_cache = ResponseCache(
+            max_size=settings.llm_response_cache_size,
+            ttl_seconds=settings.llm_response_cache_ttl,
+            similarity_threshold=settings.llm_response_cache_similarity
+        )
         
-        logger.info(f"🤖 LLM клиент инициализирован. Модель: {self.model}")
+        # Допуск запросов: одновременные запросы, лимиты RPM/TPM, очередь с дедлайном
+        self.admission = AdmissionController(
+            max_in_flight=settings.llm_max_in_flight,
+            requests_per_minute=settings.llm_requests_per_minute,
+            tokens_per_minute=settings.llm_tokens_per_minute,
+            max_queue_size=settings.llm_queue_size,
+            queue_timeout=settings.llm_queue_timeout
+        )
+        
+        # Выключатель: при сбое API запросы сразу уходят в ответ поиском
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=settings.llm_breaker_failure_threshold,
+            open_seconds=settings.llm_breaker_open_seconds,
+            probe_interval=settings.llm_breaker_probe_interval
+        )
+        llm_logger.add_listener(self.circuit_breaker.on_request_finished)
+        
+        # Долгоживущий HTTP клиент с пулом соединений (создается в start())
+        self._http_client: Optional[httpx.AsyncClient] = None
+        
+        logger.info(f"🤖 LLM клиент инициализирован. Модели: {', '.join(self.models)}")
         logger.info(f"📝 Системный промпт загружен ({len(self.system_prompt)} символов)")
+    
+    async def start(self):
+        """Создает HTTP клиент с пулом keep-alive соединений и загружает токенизатор (при старте бота)"""
+        if self._http_client is None:
+            self._http_client = self._create_http_client()
+        if not self.token_counter.exact and self._tokenizer_loading is None:
+            # Загрузка может скачивать tokenizer.json: ждем ее до начала polling, чтобы бюджет
+            # промпта с первого запроса считался точно; долгое скачивание продолжается в фоне
+            self._tokenizer_loading = asyncio.get_running_loop().run_in_executor(None, self.token_counter.load)
+            try:
+                await asyncio.wait_for(asyncio.shield(self._tokenizer_loading), settings.llm_tokenizer_load_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"⚠️ Токенизатор {self.token_counter.tokenizer_name} загружается дольше "
+                    f"{settings.llm_tokenizer_load_timeout:.0f}с: до окончания загрузки токены оцениваются по символам"
+                )
+    
+    async def close(self):
+        """Закрывает HTTP клиент и его соединения (вызывается при остановке бота)"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+            logger.info("🔌 HTTP клиент OpenRouter закрыт")
+    
+    def _create_http_client(self) -> httpx.AsyncClient:
+        """Создает httpx клиент с настройками пула соединений из Settings"""
+        http2 = settings.llm_http2
+        if http2:
+            try:
+                import h2  # noqa: F401 - нужен httpx для HTTP/2
+            except ImportError:
+                logger.warning("⚠️ HTTP/2 недоступен (нет пакета h2, установите httpx[http2]), используем HTTP/1.1")
+                http2 = False
+        
+        limits = httpx.Limits(
+            max_connections=settings.llm_max_connections,
+            max_keepalive_connections=settings.llm_max_keepalive_connections,
+            keepalive_expiry=settings.llm_keepalive_expiry
+        )
+        
+        logger.info(
+            f"🔗 HTTP клиент OpenRouter: до {settings.llm_max_connections} соединений, "
+            f"keep-alive {settings.llm_max_keepalive_connections}/{settings.llm_keepalive_expiry}с, "
+            f"{'HTTP/2' if http2 else 'HTTP/1.1'}"
+        )
+        return httpx.AsyncClient(
+            headers=self.headers,
+            timeout=settings.llm_timeout,
+            limits=limits,
+            http2=http2
+        )
+    
+    async def _get_http_client(self) -> httpx.AsyncClient:
+        """Возвращает общий HTTP клиент, создавая его при первом запросе"""
+        if self._http_client is None:
+            await self.start()
+        return self._http_client
         
     def _load_system_prompt(self) -> str:
         """Загружает системный промпт из файла data/system_prompt.txt"""
@@ -62,88 +184,601 @@ class LLMClient:
             "Отвечай только о наших услугах по дронам."
         )
 
+    def _build_messages(
+        self,
+        user_message: str,
+        found_services: ServicesContext = "",
+        conversation_history: Optional[List[Dict]] = None
+    ) -> Tuple[List[Dict], Dict[str, int]]:
+        """
+        Формирует список сообщений для API: системный промпт, история, контекст хода (сводка и услуги), вопрос
+        
+        Returns:
+            (сообщения, разбивка токенов промпта по частям)
+        """
+        # split: системный промпт не меняется между запросами (кэш префикса у провайдера),
+        # контекст хода идет отдельным сообщением перед вопросом; inline: все в системном промпте
+        split_layout = settings.llm_message_layout == "split"
+        services_title = "ДОСТУПНЫЕ УСЛУГИ:\n" if split_layout else "\n\nДОСТУПНЫЕ УСЛУГИ:\n"
+        
+        # Укладываем услуги и историю (последние 5 сообщений) в бюджет токенов
+        prompt = self.prompt_builder.build(
+            system_prompt=self.system_prompt,
+            user_message=user_message,
+            found_services=found_services,
+            conversation_history=(conversation_history or [])[-5:],
+            services_title=services_title
+        )
+        
+        # Системные сообщения истории (сводка диалога) не идут отдельными system:
+        # системное сообщение в запросе одно - первое
+        history = [message for message in prompt.history if message["role"] != "system"]
+        summary_parts = [message["content"] for message in prompt.history if message["role"] == "system"]
+        
+        if split_layout:
+            # Порядок system → история → контекст → вопрос: префикс совпадает с прошлым запросом
+            messages = [{"role": "system", "content": self.system_prompt}]
+            messages.extend(history)
+            context_parts = summary_parts + ([f"{services_title}{prompt.services}"] if prompt.services else [])
+            if context_parts:
+                messages.append({"role": "user", "content": "\n\n".join(context_parts)})
+        else:
+            # Формируем полный системный промпт со сводкой и контекстом услуг
+            full_system_prompt = "\n\n".join([self.system_prompt, *summary_parts])
+            if prompt.services:
+                full_system_prompt += f"{services_title}{prompt.services}"
+            
+            # Формируем список сообщений для API
+            messages = [{"role": "system", "content": full_system_prompt}]
+            messages.extend(history)
+        
+        # Добавляем текущее сообщение пользователя  
+        messages.append({"role": "user", "content": user_message})
+        
+        return messages, prompt.token_breakdown
+    
+    def is_available(self) -> bool:
+        """Можно ли сейчас обращаться к LLM (цепь не разомкнута)"""
+        return not self.circuit_breaker.rejects_requests()
+    
+    def _is_cacheable(
+        self,
+        user_message: str,
+        service_ids: Optional[List[str]],
+        conversation_history: Optional[List[Dict]]
+    ) -> bool:
+        """Кэш ответов применим только к первому вопросу с известным набором услуг"""
+        return (
+            self.response_cache.enabled
+            and service_ids is not None
+            and not prior_history(conversation_history, user_message)
+        )
+    
+    def needs_query_embedding(self, user_message: str, conversation_history: Optional[List[Dict]] = None) -> bool:
+        """Нужен ли эмбеддинг вопроса для поиска похожих ответов в кэше"""
+        return (
+            self.response_cache.enabled
+            and self.response_cache.similarity_threshold > 0
+            and not prior_history(conversation_history, user_message)
+        )
+    
+    def _get_cached_response(
+        self,
+        user_message: str,
+        messages: List[Dict],
+        found_services: str,
+        conversation_history: Optional[List[Dict]],
+        user_id: str,
+        service_ids: Optional[List[str]],
+        query_embedding: Optional[np.ndarray],
+        catalogue_version: int
+    ) -> Optional[str]:
+        """Возвращает ответ из кэша (и логгирует попадание) или None"""
+        if not self._is_cacheable(user_message, service_ids, conversation_history):
+            return None
+        
+        cached = self.response_cache.get(
+            user_message, service_ids, self.system_prompt_hash, catalogue_version, query_embedding
+        )
+        if cached is None:
+            return None
+        
+        request_context = llm_logger.start_request(
+            user_id=user_id,
+            model=self.model,
+            messages=messages,
+            found_services=found_services,
+            conversation_history=conversation_history
+        )
+        llm_logger.log_cache_hit(request_context, cached)
+        return cached
+    
+    async def _admit(self, request_context: Dict, messages: List[Dict]) -> AdmissionTicket:
+        """
+        Ждет допуска запроса к API
+        
+        Raises:
+            LLMUnavailableError: Цепь разомкнута или запрос не успеет пройти лимиты до дедлайна очереди
+        """
+        try:
+            if not self.circuit_breaker.allow_request():
+                raise LLMUnavailableError("circuit_open", "API недоступен, цепь разомкнута")
+            prompt_tokens = request_context.get("token_breakdown", {}).get("total")
+            estimated_tokens = (
+                prompt_tokens + self.max_tokens if prompt_tokens is not None
+                else estimate_request_tokens(messages, self.max_tokens)
+            )
+            return await self.admission.acquire(estimated_tokens)
+        except LLMUnavailableError as e:
+            llm_logger.log_rejected(request_context, e.reason, str(e))
+            raise
+    
+    def _build_payload(self, messages: List[Dict], model: str, stream: bool = False) -> Dict:
+        """Тело запроса chat/completions"""
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": 0.7,  # Баланс креативности/точности
+            "max_tokens": self.max_tokens,
+            "top_p": 0.9,        # Nucleus sampling для качества
+            "usage": {"include": True}  # Детализация usage, в т.ч. cached_tokens (и в потоке)
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
     async def generate_response(
         self, 
         user_message: str,
-        found_services: str = "",
+        found_services: ServicesContext = "",
         conversation_history: Optional[List[Dict]] = None,
-        user_id: str = "unknown"
+        user_id: str = "unknown",
+        service_ids: Optional[List[str]] = None,
+        query_embedding: Optional[np.ndarray] = None,
+        catalogue_version: int = 0
     ) -> str:
         """
         Генерирует ответ через OpenRouter API с детальным логгированием
         
         Args:
             user_message: Сообщение пользователя
-            found_services: Найденные услуги из базы знаний (контекст для RAG)
+            found_services: Найденные услуги (строка или блоки ContextBlock по убыванию релевантности)
             conversation_history: История диалога (список dict с role/content)
             user_id: ID пользователя для логгирования
+            service_ids: ID найденных услуг (включает кэш ответов)
+            query_embedding: Эмбеддинг вопроса для поиска похожих ответов в кэше
+            catalogue_version: Версия каталога услуг на момент поиска (входит в ключ кэша)
             
         Returns:
             str: Ответ от LLM модели
+            
+        Raises:
+            LLMUnavailableError: Запрос отклонен лимитами (нужен ответ без LLM)
         """
+        messages, token_breakdown = self._build_messages(user_message, found_services, conversation_history)
+        services_text = render_services(found_services)
         
-        # Формируем полный системный промпт с контекстом услуг
-        full_system_prompt = self.system_prompt
-        if found_services:
-            full_system_prompt += f"\n\nДОСТУПНЫЕ УСЛУГИ:\n{found_services}"
+        cached = self._get_cached_response(
+            user_message, messages, services_text, conversation_history, user_id, service_ids, query_embedding,
+            catalogue_version
+        )
+        if cached is not None:
+            return cached
         
-        # Формируем список сообщений для API
-        messages = [{"role": "system", "content": full_system_prompt}]
+        # Начинаем детальное логгирование запроса
+        request_context = llm_logger.start_request(
+            user_id=user_id,
+            model=self.model,
+            messages=messages,
+            found_services=services_text,
+            conversation_history=conversation_history
+        )
+        request_context["token_breakdown"] = token_breakdown
+        
+        ticket = await self._admit(request_context, messages)
+        actual_tokens = 0
         
-        # Добавляем историю диалога (последние 5 сообщений для экономии токенов)
-        if conversation_history:
-            messages.extend(conversation_history[-5:])
+        try:
+            data = await self._complete(messages, request_context)
+            actual_tokens = (data.get("usage") or {}).get("total_tokens", 0)
             
-        # Добавляем текущее сообщение пользователя  
-        messages.append({"role": "user", "content": user_message})
+            # Извлекаем ответ модели
+            assistant_message = data["choices"][0]["message"]["content"]
+            
+            # Логгируем успешный ответ через детальный логгер
+            llm_logger.log_success(request_context, data, assistant_message)
+            
+            assistant_message = assistant_message.strip()
+            if self._is_cacheable(user_message, service_ids, conversation_history) and assistant_message:
+                self.response_cache.set(
+                    user_message, service_ids, self.system_prompt_hash, catalogue_version,
+                    assistant_message, query_embedding
+                )
+            
+            return assistant_message
+                
+        except asyncio.CancelledError:
+            logger.info(f"⏹️ LLM запрос {user_id} отменен: ответ больше не нужен")
+            raise
+        except Exception as e:
+            return self._handle_request_error(request_context, e)
+        finally:
+            self.admission.release(ticket, actual_tokens)
+    
+    def _next_model(self, failed: Dict[str, int]) -> str:
+        """Следующая модель: лучшая по статистике, еще не падавшая в этом запросе"""
+        ordered = self.router.ordered_models()
+        for model in ordered:
+            if model not in failed:
+                return model
+        # Все модели уже ошибались - повторяем ту, что упала меньше раз
+        return min(ordered, key=lambda model: failed[model])
+    
+    async def _wait_before_retry(self, model: str, failed: Dict[str, int]) -> bool:
+        """
+        Пауза перед повтором к модели, которая уже ошибалась в этом запросе
+        
+        Returns:
+            False, если модель просит ждать дольше LLM_RETRY_MAX_DELAY (повтор бессмыслен)
+        """
+        if model not in failed:
+            return True  # Другая модель: повторяем сразу
+        
+        retry_after = self.router.cooldown_left(model) or None
+        delay = self.retry_policy.delay(failed[model] - 1, retry_after)
+        if delay is None:
+            logger.warning(f"⏳ {model} просит подождать {retry_after:.0f}с - повтор отменен")
+            return False
+        
+        await asyncio.sleep(delay)
+        return True
+    
+    def _charge_retry(self, model: str, messages: List[Dict]) -> bool:
+        """
+        Повтор и переход на резервную модель расходуют лимиты RPM/TPM как новый запрос
+        
+        Returns:
+            False, если лимиты исчерпаны без ожидания (повтор не выполняется)
+        """
+        if self.admission.try_charge(estimate_request_tokens(messages, self.max_tokens)):
+            return True
+        logger.warning(f"🚦 Повтор к {model} отменен: лимиты запросов к LLM исчерпаны")
+        return False
+    
+    async def _complete(self, messages: List[Dict], request_context: Dict) -> Dict:
+        """
+        Запрос chat/completions с повторами и переключением моделей
+        
+        Временные ошибки (429, 5xx, сеть) повторяются до LLM_MAX_RETRIES раз:
+        сначала на следующей модели из LLM_MODELS, а если все модели уже
+        ошибались - с экспоненциальной паузой и учетом Retry-After.
+        
+        Returns:
+            Ответ API (модель записывается в request_context["model"])
+        """
+        client = await self._get_http_client()
+        failed: Dict[str, int] = {}
+        last_error: Optional[Exception] = None
+        
+        for attempt in range(self.retry_policy.max_retries + 1):
+            model = self._next_model(failed)
+            if attempt and not (await self._wait_before_retry(model, failed) and self._charge_retry(model, messages)):
+                break
+            
+            request_context["attempts"] = attempt + 1
+            try:
+                data, used_model = await self._post_hedged(client, model, messages, request_context)
+                request_context["model"] = used_model
+                return data
+            except Exception as e:
+                last_error = e
+                failed[model] = failed.get(model, 0) + 1
+                if not is_retryable(e) and len(failed) == len(self.models):
+                    break
+                logger.warning(f"🔁 {model}: попытка {attempt + 1} не удалась ({type(e).__name__})")
+        
+        request_context["model"] = model
+        raise last_error
+    
+    async def _post_completion(
+        self,
+        client: httpx.AsyncClient,
+        model: str,
+        messages: List[Dict],
+        payload_overrides: Optional[Dict] = None
+    ) -> Dict:
+        """Один запрос к модели с записью задержки и ошибок в статистику роутера"""
+        payload = self._build_payload(messages, model)
+        if payload_overrides:
+            payload.update(payload_overrides)
+        
+        started = time.monotonic()
+        try:
+            response = await client.post(self.api_url, json=payload)
+            response.raise_for_status()
+            data = response.json()
+        except Exception as e:
+            self.router.record_error(model, retry_after_seconds(e))
+            raise
+        
+        self.router.record_success(model, (time.monotonic() - started) * 1000)
+        return data
+    
+    async def _post_hedged(
+        self,
+        client: httpx.AsyncClient,
+        model: str,
+        messages: List[Dict],
+        request_context: Dict
+    ):
+        """
+        Запрос к модели со страховкой: если ответа нет дольше p95 модели,
+        параллельно уходит запрос к следующей модели, берется первый успешный
+        
+        Returns:
+            (ответ API, модель, которая ответила)
+        """
+        primary = asyncio.ensure_future(self._post_completion(client, model, messages))
+        backups = [candidate for candidate in self.router.ordered_models() if candidate != model]
+        hedge_delay = self.router.hedge_delay(model) if settings.llm_hedging and backups else None
+        
+        if hedge_delay is None:
+            return await primary, model
+        
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+            if done:
+                return primary.result(), model
+            
+            # Страховка не должна обходить лимиты: берем слот, только если он свободен сразу
+            hedge_ticket = await self.admission.try_acquire(estimate_request_tokens(messages, self.max_tokens))
+        except asyncio.CancelledError:
+            # asyncio.wait не отменяет ожидаемую задачу: без этого запрос висел бы в фоне
+            primary.cancel()
+            raise
+        if hedge_ticket is None:
+            return await primary, model
+        
+        backup = backups[0]
+        request_context["hedged"] = True
+        logger.info(f"🪁 {model} отвечает дольше p95 ({hedge_delay * 1000:.0f}мс), страховочный запрос к {backup}")
+        
+        pending = {primary: model, asyncio.ensure_future(self._post_completion(client, backup, messages)): backup}
+        try:
+            error: Optional[Exception] = None
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    used_model = pending.pop(task)
+                    if task.exception() is None:
+                        return task.result(), used_model
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            self.admission.release(hedge_ticket)
+    
+    async def stream_response(
+        self,
+        user_message: str,
+        found_services: ServicesContext = "",
+        conversation_history: Optional[List[Dict]] = None,
+        user_id: str = "unknown",
+        service_ids: Optional[List[str]] = None,
+        query_embedding: Optional[np.ndarray] = None,
+        catalogue_version: int = 0
+    ) -> AsyncIterator[str]:
+        """
+        Потоковая генерация ответа: фрагменты текста по мере прихода SSE от OpenRouter
+        
+        Args:
+            user_message: Сообщение пользователя
+            found_services: Найденные услуги (строка или блоки ContextBlock по убыванию релевантности)
+            conversation_history: История диалога (список dict с role/content)
+            user_id: ID пользователя для логгирования
+            service_ids: ID найденных услуг (включает кэш ответов)
+            query_embedding: Эмбеддинг вопроса для поиска похожих ответов в кэше
+            catalogue_version: Версия каталога услуг на момент поиска (входит в ключ кэша)
+            
+        Yields:
+            str: Очередной фрагмент ответа (при ошибке - текст fallback сообщения)
+            
+        Raises:
+            LLMUnavailableError: Запрос отклонен лимитами до первого фрагмента
+        """
+        messages, token_breakdown = self._build_messages(user_message, found_services, conversation_history)
+        services_text = render_services(found_services)
+        
+        cached = self._get_cached_response(
+            user_message, messages, services_text, conversation_history, user_id, service_ids, query_embedding,
+            catalogue_version
+        )
+        if cached is not None:
+            yield cached
+            return
         
-        # Начинаем детальное логгирование запроса
         request_context = llm_logger.start_request(
             user_id=user_id,
             model=self.model,
             messages=messages,
-            found_services=found_services,
+            found_services=services_text,
             conversation_history=conversation_history
         )
+        request_context["token_breakdown"] = token_breakdown
+        
+        ticket = await self._admit(request_context, messages)
+        parts: List[str] = []
+        usage: Dict = {}
         
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    self.api_url,
-                    headers=self.headers,
-                    json={
-                        "model": self.model,
-                        "messages": messages,
-                        "temperature": 0.7,  # Баланс креативности/точности
-                        "max_tokens": 800,   # Ограничиваем длину ответа
-                        "top_p": 0.9        # Nucleus sampling для качества
-                    }
-                )
+            client = await self._get_http_client()
+            failed: Dict[str, int] = {}
+            last_error: Optional[Exception] = None
+            
+            for attempt in range(self.retry_policy.max_retries + 1):
+                model = self._next_model(failed)
+                if attempt and not (
+                    await self._wait_before_retry(model, failed) and self._charge_retry(model, messages)
+                ):
+                    raise last_error
                 
+                request_context["attempts"] = attempt + 1
+                request_context["model"] = model
+                try:
+                    async for delta in self._stream_completion(client, model, messages, usage):
+                        if not parts:
+                            llm_logger.log_first_token(request_context)
+                        parts.append(delta)
+                        yield delta
+                    break
+                except Exception as e:
+                    # После первого фрагмента повтор невозможен: часть ответа уже показана
+                    if parts:
+                        raise
+                    last_error = e
+                    failed[model] = failed.get(model, 0) + 1
+                    last_attempt = attempt == self.retry_policy.max_retries
+                    if last_attempt or (not is_retryable(e) and len(failed) == len(self.models)):
+                        raise
+                    logger.warning(f"🔁 {model}: попытка {attempt + 1} не удалась ({type(e).__name__})")
+            
+            assistant_message = "".join(parts)
+            llm_logger.log_success(request_context, {"usage": usage}, assistant_message)
+            
+            assistant_message = assistant_message.strip()
+            if self._is_cacheable(user_message, service_ids, conversation_history) and assistant_message:
+                self.response_cache.set(
+                    user_message, service_ids, self.system_prompt_hash, catalogue_version,
+                    assistant_message, query_embedding
+                )
+            
+        except (asyncio.CancelledError, GeneratorExit):
+            # Генерация прервана (пришло новое сообщение) - соединение закрывается вместе с потоком
+            logger.info(f"⏹️ LLM поток {user_id} прерван после {len(parts)} фрагментов")
+            raise
+        except Exception as e:
+            fallback = self._handle_request_error(request_context, e)
+            # Если часть ответа уже отправлена, добавляем fallback отдельным абзацем
+            yield f"\n\n{fallback}" if parts else fallback
+        finally:
+            self.admission.release(ticket, usage.get("total_tokens", 0))
+    
+    async def _stream_completion(
+        self,
+        client: httpx.AsyncClient,
+        model: str,
+        messages: List[Dict],
+        usage: Dict
+    ) -> AsyncIterator[str]:
+        """Потоковый запрос к одной модели: фрагменты ответа из SSE, usage - в переданный dict"""
+        started = time.monotonic()
+        try:
+            payload = self._build_payload(messages, model, stream=True)
+            async with client.stream("POST", self.api_url, json=payload) as response:
+                if response.is_error:
+                    await response.aread()  # Тело нужно для текста ошибки
                 response.raise_for_status()
-                data = response.json()
-                
-                # Извлекаем ответ модели
-                assistant_message = data["choices"][0]["message"]["content"]
                 
-                # Логгируем успешный ответ через детальный логгер
-                llm_logger.log_success(request_context, data, assistant_message)
-                
-                return assistant_message.strip()
-                
-        except httpx.HTTPStatusError as e:
+                async for line in response.aiter_lines():
+                    # SSE: пропускаем пустые строки и комментарии (": OPENROUTER PROCESSING")
+                    if not line.startswith("data:"):
+                        continue
+                    
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    
+                    chunk = json.loads(data)
+                    if chunk.get("error"):
+                        raise RuntimeError(chunk["error"].get("message", "ошибка в потоке"))
+                    if chunk.get("usage"):
+                        usage.update(chunk["usage"])
+                    
+                    choices = chunk.get("choices") or [{}]
+                    delta = (choices[0].get("delta") or {}).get("content")
+                    if delta:
+                        yield delta
+        except Exception as e:
+            self.router.record_error(model, retry_after_seconds(e))
+            raise
+        
+        self.router.record_success(model, (time.monotonic() - started) * 1000)
+    
+    async def summarize_dialog(
+        self,
+        previous_summary: str,
+        messages: List[Dict],
+        max_tokens: int
+    ) -> Optional[str]:
+        """
+        Обновляет сводку диалога новыми сообщениями (фоновая задача, не для ответа пользователю)
+        
+        Запрос идет только при свободном слоте и закрытом выключателе, без
+        повторов и без записи в статистику запросов: если сейчас не вышло,
+        сводка обновится после следующего ответа.
+        
+        Args:
+            previous_summary: Текущая сводка (пустая строка - сводки еще нет)
+            messages: Сообщения для добавления в сводку, старые первыми
+            max_tokens: Максимальная длина сводки в токенах
+            
+        Returns:
+            Новая сводка или None, если запрос не выполнялся или не удался
+        """
+        if not messages or self.circuit_breaker.rejects_requests():
+            return None
+        
+        dialog = "\n".join(
+            f"{'Клиент' if message['role'] == 'user' else 'Консультант'}: "
+            f"{self.token_counter.truncate(_HTML_TAG.sub('', message['content']), _SUMMARY_MESSAGE_TOKENS)}"
+            for message in messages
+        )
+        prompt = [
+            {"role": "system", "content": _SUMMARY_PROMPT},
+            {"role": "user", "content": (
+                f"Текущая сводка:\n{previous_summary or '(пока нет)'}\n\nНовые сообщения:\n{dialog}"
+            )}
+        ]
+        
+        ticket = await self.admission.try_acquire(estimate_request_tokens(prompt, max_tokens))
+        if ticket is None:
+            return None
+        
+        model = self.router.ordered_models()[0]
+        try:
+            client = await self._get_http_client()
+            data = await self._post_completion(
+                client, model, prompt, {"max_tokens": max_tokens, "temperature": 0.2}
+            )
+            summary = (data["choices"][0]["message"].get("content") or "").strip()
+            return summary or None
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось обновить сводку диалога ({model}): {type(e).__name__}")
+            return None
+        finally:
+            self.admission.release(ticket)
+    
+    def _handle_request_error(self, request_context: Dict, error: Exception) -> str:
+        """Логгирует ошибку запроса к OpenRouter и возвращает fallback сообщение"""
+        if isinstance(error, httpx.HTTPStatusError):
             error_detail = ""
             try:
-                error_data = e.response.json()
+                error_data = error.response.json()
                 error_detail = error_data.get("error", {}).get("message", "")
             except:
-                error_detail = e.response.text
+                error_detail = error.response.text
+            
+            # 429 - лимит запросов бесплатной модели, отдельный тип ошибки
+            if error.response.status_code == 429:
+                llm_logger.log_error(request_context, "rate_limit", f"HTTP 429: {error_detail}")
+                return self._prepare_fallback_response("rate_limit")
             
             # Логгируем HTTP ошибку через детальный логгер
             llm_logger.log_error(
                 request_context, 
                 "http_error", 
-                f"HTTP {e.response.status_code}: {error_detail}"
+                f"HTTP {error.response.status_code}: {error_detail}"
             )
             
             # Возвращаем fallback сообщение
@@ -152,7 +787,7 @@ class LLMClient:
                 "Могу предложить связаться с нашим менеджером для консультации."
             )
             
-        except httpx.TimeoutException:
+        if isinstance(error, httpx.TimeoutException):
             # Логгируем таймаут через детальный логгер
             llm_logger.log_error(request_context, "timeout", "Превышено время ожидания ответа API")
             
@@ -160,19 +795,22 @@ class LLMClient:
                 "⏰ Извините, запрос занимает слишком много времени. "
                 "Попробуйте переформулировать вопрос или обратитесь к менеджеру."
             )
-            
-        except Exception as e:
-            # Логгируем неожиданную ошибку через детальный логгер
-            llm_logger.log_error(
-                request_context, 
-                "unexpected_error", 
-                f"{type(e).__name__}: {str(e)}"
-            )
-            
-            return (
-                "😔 Извините, произошла техническая ошибка. "
-                "Обратитесь к нашему менеджеру для получения помощи."
-            )
+        
+        if isinstance(error, httpx.TransportError):
+            llm_logger.log_error(request_context, "network", f"{type(error).__name__}: {str(error)}")
+            return self._prepare_fallback_response("network")
+        
+        # Логгируем неожиданную ошибку через детальный логгер
+        llm_logger.log_error(
+            request_context, 
+            "unexpected_error", 
+            f"{type(error).__name__}: {str(error)}"
+        )
+        
+        return (
+            "😔 Извините, произошла техническая ошибка. "
+            "Обратитесь к нашему менеджеру для получения помощи."
+        )
     
     def _prepare_fallback_response(self, error_type: str) -> str:
         """Подготавливает fallback ответ в зависимости от типа ошибки"""
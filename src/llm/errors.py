@@ -0,0 +1,21 @@
+"""
+Исключения LLM модуля.
+"""
+
+
+class LLMUnavailableError(Exception):
+    """
+    LLM сейчас не может принять запрос (лимиты, очередь, недоступность API)
+
+    Обработчик сообщений отвечает на такой запрос простым поиском без LLM,
+    не дожидаясь таймаута.
+    """
+
+    def __init__(self, reason: str, message: str):
+        """
+        Args:
+            reason: Короткий код причины (queue_full, concurrency, rate_limit, ...)
+            message: Описание для логов
+        """
+        super().__init__(message)
+        self.reason = reason
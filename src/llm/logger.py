@@ -3,14 +3,24 @@
 
 Реализует расширенное логгирование для мониторинга производительности
 и качества ответов OpenRouter API согласно принципам KISS.
+
+Статистика для /stats копится в поминутных корзинах (счетчики, суммы,
+ошибки по типам, HyperLogLog для уникальных пользователей): запись
+запроса обновляет одну корзину за O(1). Корзины старше предыдущего часа
+сворачиваются в часовые, поэтому статистика за любой период (1ч/24ч/7д)
+складывается максимум из ~120 минутных и 168 часовых корзин без
+хранения всех запросов.
 """
 
+import hashlib
 import time
 import json
+from collections import deque
 from datetime import datetime
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass, asdict
-from src.config.settings import logger
+from typing import Callable, Deque, Dict, List, Optional, Any
+from dataclasses import dataclass, asdict, field
+import numpy as np
+from src.config.settings import settings, logger
 
 
 @dataclass
@@ -30,6 +40,7 @@ class LLMRequestMetrics:
     prompt_tokens: int
     completion_tokens: int
     total_tokens: int
+    cached_tokens: int = 0  # Токены промпта из кэша префикса провайдера
     
     # Детали ошибки (если есть)
     error_type: Optional[str] = None
@@ -38,19 +49,173 @@ class LLMRequestMetrics:
     # Качество ответа
     response_length_chars: int = 0
     
+    # Потоковый ответ: время до первого токена
+    time_to_first_token_ms: Optional[float] = None
+    
+    # Исход запроса: success, error, rejected (отклонен до вызова API) или cache_hit (ответ из кэша)
+    outcome: str = "success"
+    
+    # Повторы и страховочные запросы к резервной модели
+    attempts: int = 1
+    hedged: bool = False
+    
+    # Разбивка токенов промпта: system, user, services, history, total, dropped
+    token_breakdown: Optional[Dict[str, int]] = None
+    
     def to_dict(self) -> Dict[str, Any]:
         """Преобразует метрики в словарь для логгирования"""
         return asdict(self)
 
 
+class HyperLogLog:
+    """
+    Оценка числа уникальных значений в фиксированной памяти
+
+    2^precision однобайтовых регистров (1 КБ при precision=10, погрешность
+    около 3%); на малых количествах используется линейный подсчет, который
+    почти точен. Скетчи корзин объединяются поэлементным максимумом.
+    """
+
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision: int = 10):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, value: str):
+        hashed = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+        index = hashed >> (64 - self.precision)
+        rest_bits = 64 - self.precision
+        rank = rest_bits - (hashed & ((1 << rest_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        m = len(self.registers)
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if zeros == m:
+            return 0
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / float(np.sum(np.exp2(-self.registers.astype(np.float64))))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+def _add_counts(target: Dict[str, int], source: Dict[str, int]):
+    for key, value in source.items():
+        target[key] = target.get(key, 0) + value
+
+
+@dataclass(slots=True)
+class _StatsBucket:
+    """Агрегаты запросов за минуту или час (minute - первая минута) или сумма корзин за период"""
+    minute: int = 0
+    total: int = 0
+    successful: int = 0
+    cache_hits: int = 0
+    rejected: int = 0  # Отклонены до вызова API: не ошибки и не входят в успешность
+    # Успешные запросы к API (без ответов из кэша): время, токены, кэш префикса
+    api_successful: int = 0
+    response_time_sum: float = 0.0
+    tokens_sum: int = 0
+    prompt_tokens_sum: int = 0
+    cached_tokens_sum: int = 0
+    prefix_cached: int = 0
+    prefix_cached_time_sum: float = 0.0
+    streamed: int = 0
+    first_token_sum: float = 0.0
+    # Все запросы
+    retried: int = 0
+    hedged: int = 0
+    truncated: int = 0
+    with_context: int = 0
+    with_history: int = 0
+    breakdowns: int = 0
+    breakdown_sums: Dict[str, int] = field(default_factory=dict)
+    errors: Dict[str, int] = field(default_factory=dict)
+    rejections: Dict[str, int] = field(default_factory=dict)
+    models: Dict[str, int] = field(default_factory=dict)
+    users: HyperLogLog = field(default_factory=HyperLogLog)
+
+    def add(self, m: LLMRequestMetrics):
+        """Учитывает один запрос"""
+        self.total += 1
+        self.users.add(m.user_id)
+        if m.success:
+            self.successful += 1
+            if m.outcome == "cache_hit":
+                self.cache_hits += 1
+            else:
+                self.api_successful += 1
+                self.response_time_sum += m.response_time_ms
+                self.tokens_sum += m.total_tokens
+                self.prompt_tokens_sum += m.prompt_tokens
+                self.cached_tokens_sum += m.cached_tokens
+                if m.cached_tokens:
+                    self.prefix_cached += 1
+                    self.prefix_cached_time_sum += m.response_time_ms
+                if m.time_to_first_token_ms is not None:
+                    self.streamed += 1
+                    self.first_token_sum += m.time_to_first_token_ms
+        elif m.outcome == "rejected":
+            self.rejected += 1
+            reason = (m.error_type or "").removeprefix("rejected_")
+            self.rejections[reason] = self.rejections.get(reason, 0) + 1
+        elif m.error_type:
+            self.errors[m.error_type] = self.errors.get(m.error_type, 0) + 1
+        if m.outcome == "success":
+            self.models[m.model] = self.models.get(m.model, 0) + 1
+
+        self.retried += m.attempts > 1
+        self.hedged += m.hedged
+        self.with_context += m.has_context
+        self.with_history += m.has_history
+        if m.token_breakdown:
+            self.breakdowns += 1
+            self.truncated += bool(m.token_breakdown.get("dropped"))
+            _add_counts(self.breakdown_sums, m.token_breakdown)
+
+    def merge(self, other: "_StatsBucket"):
+        """Добавляет агрегаты другой корзины"""
+        for name in _SUMMED_FIELDS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        _add_counts(self.breakdown_sums, other.breakdown_sums)
+        _add_counts(self.errors, other.errors)
+        _add_counts(self.rejections, other.rejections)
+        _add_counts(self.models, other.models)
+        self.users.merge(other.users)
+
+
+_SUMMED_FIELDS = tuple(
+    name for name in _StatsBucket.__dataclass_fields__
+    if name not in ("minute", "breakdown_sums", "errors", "rejections", "models", "users")
+)
+
+
+def _average(total: float, count: int) -> float:
+    return round(total / count, 1) if count else 0
+
+
 class LLMLogger:
     """Логгер для детального мониторинга LLM запросов"""
     
     def __init__(self):
         """Инициализация с настройками логгирования"""
         self.log_full_content = False  # Для production лучше False (privacy)
-        self.metrics_history: List[LLMRequestMetrics] = []
         self.max_history_size = 100  # Последние 100 запросов
+        self.metrics_history: Deque[LLMRequestMetrics] = deque(maxlen=self.max_history_size)
+        
+        # Агрегаты для статистики, старые первыми: минутные за текущий и предыдущий час,
+        # более ранние - часовые
+        self.retention_minutes = settings.llm_stats_retention_hours * 60
+        self._minutes: Deque[_StatsBucket] = deque()
+        self._hours: Deque[_StatsBucket] = deque()
+        
+        # Подписчики на итоги запросов (например, circuit breaker)
+        self._listeners: List[Callable[[LLMRequestMetrics], None]] = []
         
         logger.info("📊 LLM Logger инициализирован")
     
@@ -106,6 +271,18 @@ class LLMLogger:
         
         return request_context
     
+    def log_first_token(self, request_context: Dict[str, Any]):
+        """
+        Фиксирует время до первого токена потокового ответа
+        
+        Args:
+            request_context: Контекст запроса из start_request
+        """
+        first_token_ms = (time.time() - request_context["start_time"]) * 1000
+        request_context["first_token_ms"] = first_token_ms
+        
+        logger.info(f"⚡ LLM первый токен {request_context['user_id']}: {first_token_ms:.0f}мс")
+    
     def log_success(self, request_context: Dict[str, Any], 
                    response_data: Dict[str, Any], assistant_message: str):
         """
@@ -133,7 +310,12 @@ class LLMLogger:
             prompt_tokens=usage.get("prompt_tokens", 0),
             completion_tokens=usage.get("completion_tokens", 0),
             total_tokens=usage.get("total_tokens", 0),
-            response_length_chars=len(assistant_message)
+            cached_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0,
+            response_length_chars=len(assistant_message),
+            time_to_first_token_ms=request_context.get("first_token_ms"),
+            attempts=request_context.get("attempts", 1),
+            hedged=request_context.get("hedged", False),
+            token_breakdown=request_context.get("token_breakdown")
         )
         
         # Сохраняем в историю
@@ -160,19 +342,16 @@ class LLMLogger:
         if metrics.total_tokens > 3000:  # Много токенов
             logger.warning(f"🔥 Высокое потребление токенов: {metrics.total_tokens} для {metrics.user_id}")
     
-    def log_error(self, request_context: Dict[str, Any], 
-                 error_type: str, error_message: str):
+    def log_cache_hit(self, request_context: Dict[str, Any], assistant_message: str):
         """
-        Логгирует ошибку LLM запроса
+        Логгирует ответ из кэша ответов (запрос к API не выполнялся)
         
         Args:
             request_context: Контекст запроса из start_request
-            error_type: Тип ошибки (http_error, timeout, network, etc.)
-            error_message: Сообщение об ошибке
+            assistant_message: Закэшированный ответ
         """
         response_time_ms = (time.time() - request_context["start_time"]) * 1000
         
-        # Создаем метрики ошибки
         metrics = LLMRequestMetrics(
             timestamp=request_context["timestamp"],
             user_id=request_context["user_id"],
@@ -182,13 +361,53 @@ class LLMLogger:
             has_context=request_context["has_context"],
             has_history=request_context["has_history"],
             response_time_ms=response_time_ms,
+            success=True,
+            prompt_tokens=0,
+            completion_tokens=0,
+            total_tokens=0,
+            response_length_chars=len(assistant_message),
+            outcome="cache_hit"
+        )
+        
+        self._save_metrics(metrics)
+        
+        logger.info(f"💾 LLM ответ из кэша {metrics.user_id}: {metrics.response_length_chars}символов")
+    
+    def _failure_metrics(self, request_context: Dict[str, Any], error_type: str,
+                         error_message: str, outcome: str) -> LLMRequestMetrics:
+        """Метрики запроса, не получившего ответ"""
+        return LLMRequestMetrics(
+            timestamp=request_context["timestamp"],
+            user_id=request_context["user_id"],
+            model=request_context["model"],
+            request_size_chars=request_context["request_size_chars"],
+            messages_count=request_context["messages_count"],
+            has_context=request_context["has_context"],
+            has_history=request_context["has_history"],
+            response_time_ms=(time.time() - request_context["start_time"]) * 1000,
             success=False,
             prompt_tokens=0,
             completion_tokens=0,
             total_tokens=0,
             error_type=error_type,
-            error_message=error_message[:200]  # Обрезаем длинные ошибки
+            error_message=error_message[:200],  # Обрезаем длинные ошибки
+            outcome=outcome,
+            attempts=request_context.get("attempts", 1),
+            hedged=request_context.get("hedged", False),
+            token_breakdown=request_context.get("token_breakdown")
         )
+    
+    def log_error(self, request_context: Dict[str, Any], 
+                 error_type: str, error_message: str):
+        """
+        Логгирует ошибку LLM запроса
+        
+        Args:
+            request_context: Контекст запроса из start_request
+            error_type: Тип ошибки (http_error, timeout, network, etc.)
+            error_message: Сообщение об ошибке
+        """
+        metrics = self._failure_metrics(request_context, error_type, error_message, "error")
         
         # Сохраняем в историю
         self._save_metrics(metrics)
@@ -196,78 +415,129 @@ class LLMLogger:
         # Логгируем ошибку
         logger.error(
             f"❌ LLM ошибка {metrics.user_id}: {error_type} "
-            f"через {response_time_ms:.0f}мс - {error_message[:100]}"
+            f"через {metrics.response_time_ms:.0f}мс - {error_message[:100]}"
         )
     
+    def log_rejected(self, request_context: Dict[str, Any], reason: str, error_message: str):
+        """
+        Логгирует запрос, отклоненный до отправки в API (лимиты, разомкнутая цепь)
+        
+        Такой запрос не считается ошибкой: пользователь получает ответ поиском,
+        а в статистике отказы идут отдельно от ошибок API.
+        
+        Args:
+            request_context: Контекст запроса из start_request
+            reason: Причина отказа (circuit_open, queue_timeout и т.д.)
+            error_message: Описание отказа
+        """
+        metrics = self._failure_metrics(request_context, f"rejected_{reason}", error_message, "rejected")
+        self._save_metrics(metrics)
+        logger.warning(f"🚦 LLM запрос {metrics.user_id} отклонен: {reason}")
+    
+    def add_listener(self, listener: Callable[[LLMRequestMetrics], None]):
+        """Подписывает обработчик на метрики каждого завершенного запроса"""
+        self._listeners.append(listener)
+    
     def _save_metrics(self, metrics: LLMRequestMetrics):
-        """Сохраняет метрики в историю с ограничением размера"""
+        """Сохраняет метрики в историю и агрегаты, оповещает подписчиков"""
         self.metrics_history.append(metrics)
+        self._bucket(int(time.time() // 60)).add(metrics)
         
-        # Ограничиваем размер истории
-        if len(self.metrics_history) > self.max_history_size:
-            self.metrics_history = self.metrics_history[-self.max_history_size:]
+        for listener in self._listeners:
+            try:
+                listener(metrics)
+            except Exception as e:
+                logger.error(f"❌ Ошибка подписчика метрик LLM: {e}")
+    
+    def _bucket(self, minute: int) -> _StatsBucket:
+        """
+        Корзина текущей минуты
+        
+        Минутные корзины часов раньше предыдущего сворачиваются в часовые,
+        часовые старше срока хранения удаляются.
+        """
+        if self._minutes and self._minutes[-1].minute == minute:
+            return self._minutes[-1]
+        
+        current_hour = minute // 60
+        while self._minutes and self._minutes[0].minute // 60 < current_hour - 1:
+            old = self._minutes.popleft()
+            hour_start = old.minute // 60 * 60
+            if not self._hours or self._hours[-1].minute != hour_start:
+                self._hours.append(_StatsBucket(minute=hour_start))
+            self._hours[-1].merge(old)
+        while self._hours and self._hours[0].minute <= minute - self.retention_minutes:
+            self._hours.popleft()
+        
+        bucket = _StatsBucket(minute=minute)
+        self._minutes.append(bucket)
+        return bucket
     
     def get_statistics(self, hours: int = 24) -> Dict[str, Any]:
         """
         Получает статистику использования LLM за период
         
+        Последние 1-2 часа считаются с точностью до минуты, более ранние
+        часы входят в период, только если попадают в него целиком. Период
+        ограничен сроком хранения LLM_STATS_RETENTION_HOURS.
+        
         Args:
             hours: Период в часах для анализа
             
         Returns:
             Словарь со статистикой
         """
-        if not self.metrics_history:
+        if not self._minutes and not self._hours:
             return {"error": "Нет данных для анализа"}
         
-        # Фильтруем метрики по времени
-        cutoff_time = datetime.now().timestamp() - (hours * 3600)
-        recent_metrics = [
-            m for m in self.metrics_history 
-            if datetime.fromisoformat(m.timestamp).timestamp() > cutoff_time
-        ]
+        # Складываем корзины периода, начиная с самых свежих
+        first_minute = int((time.time() - hours * 3600) // 60)
+        window = _StatsBucket()
+        for buckets in (self._minutes, self._hours):
+            for bucket in reversed(buckets):
+                if bucket.minute < first_minute:
+                    break
+                window.merge(bucket)
         
-        if not recent_metrics:
+        if not window.total:
             return {"error": f"Нет данных за последние {hours} часов"}
         
-        # Вычисляем статистику
-        total_requests = len(recent_metrics)
-        successful_requests = sum(1 for m in recent_metrics if m.success)
-        failed_requests = total_requests - successful_requests
-        
-        success_rate = (successful_requests / total_requests) * 100 if total_requests > 0 else 0
-        
-        # Средние метрики для успешных запросов
-        successful_metrics = [m for m in recent_metrics if m.success]
-        if successful_metrics:
-            avg_response_time = sum(m.response_time_ms for m in successful_metrics) / len(successful_metrics)
-            avg_tokens = sum(m.total_tokens for m in successful_metrics) / len(successful_metrics)
-            total_tokens_used = sum(m.total_tokens for m in successful_metrics)
-        else:
-            avg_response_time = avg_tokens = total_tokens_used = 0
-        
-        # Подсчет ошибок по типам
-        error_types = {}
-        for m in recent_metrics:
-            if not m.success and m.error_type:
-                error_types[m.error_type] = error_types.get(m.error_type, 0) + 1
-        
-        # Уникальные пользователи
-        unique_users = len(set(m.user_id for m in recent_metrics))
-        
+        uncached = window.api_successful - window.prefix_cached
+        # Отказы лимитов - не ошибки: успешность считается по запросам, которые дошли до обработки
+        processed = window.total - window.rejected
         stats = {
             "period_hours": hours,
-            "total_requests": total_requests,
-            "successful_requests": successful_requests,
-            "failed_requests": failed_requests,
-            "success_rate_percent": round(success_rate, 1),
-            "unique_users": unique_users,
-            "avg_response_time_ms": round(avg_response_time, 1) if avg_response_time else 0,
-            "avg_tokens_per_request": round(avg_tokens, 1) if avg_tokens else 0,
-            "total_tokens_used": total_tokens_used,
-            "error_breakdown": error_types,
-            "requests_with_context": sum(1 for m in recent_metrics if m.has_context),
-            "requests_with_history": sum(1 for m in recent_metrics if m.has_history)
+            "total_requests": window.total,
+            "successful_requests": window.successful,
+            "failed_requests": processed - window.successful,
+            "rejected_requests": window.rejected,
+            "success_rate_percent": _average(window.successful * 100, processed),
+            "unique_users": window.users.count(),
+            # Средние по успешным запросам к API (ответы из кэша не искажают время и токены)
+            "avg_response_time_ms": _average(window.response_time_sum, window.api_successful),
+            "avg_tokens_per_request": _average(window.tokens_sum, window.api_successful),
+            "cache_hits": window.cache_hits,
+            "retried_requests": window.retried,
+            "hedged_requests": window.hedged,
+            "truncated_prompts": window.truncated,
+            "avg_prompt_tokens_by_part": {
+                part: _average(total, window.breakdowns) for part, total in window.breakdown_sums.items()
+            },
+            "requests_by_model": window.models,
+            "streamed_requests": window.streamed,
+            "avg_time_to_first_token_ms": _average(window.first_token_sum, window.streamed),
+            "total_tokens_used": window.tokens_sum,
+            # Кэш префикса промпта у провайдера: доля токенов и задержка с попаданием и без
+            "cached_prompt_tokens": window.cached_tokens_sum,
+            "cached_prompt_tokens_percent": _average(window.cached_tokens_sum * 100, window.prompt_tokens_sum),
+            "avg_response_time_prefix_cached_ms": _average(window.prefix_cached_time_sum, window.prefix_cached),
+            "avg_response_time_uncached_ms": _average(
+                window.response_time_sum - window.prefix_cached_time_sum, uncached
+            ),
+            "error_breakdown": window.errors,
+            "rejection_breakdown": window.rejections,
+            "requests_with_context": window.with_context,
+            "requests_with_history": window.with_history
         }
         
         logger.info(f"📊 LLM статистика за {hours}ч: {stats}")
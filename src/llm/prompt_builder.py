@@ -0,0 +1,218 @@
+"""
+Сборка промпта в бюджет токенов.
+
+Токены считаются локально токенизатором модели (пакет tokenizers,
+LLM_TOKENIZER), а если он недоступен - по оценке ~3 символа на токен.
+Части промпта укладываются в LLM_PROMPT_TOKEN_BUDGET по приоритету:
+системный промпт и вопрос пользователя целиком, затем услуги в порядке
+релевантности (не влезающая услуга обрезается до заголовка с ценой),
+затем история диалога от новых сообщений к старым.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Union
+from src.config.settings import logger
+
+# Служебные токены шаблона чата на одно сообщение (<|im_start|>role ... <|im_end|>)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Оценка для русского текста без токенизатора
+_CHARS_PER_TOKEN = 3
+_ELLIPSIS = "…"
+
+
+@dataclass
+class ContextBlock:
+    """Фрагмент контекста (услуга); header - часть, без которой фрагмент бесполезен"""
+    text: str
+    header: str = ""
+
+
+ServicesContext = Union[str, Sequence[ContextBlock]]
+
+
+def render_services(found_services: ServicesContext) -> str:
+    """Текст контекста услуг без учета бюджета (для логов и ключей кэша)"""
+    if isinstance(found_services, str):
+        return found_services
+    return "\n\n".join(block.text for block in found_services)
+
+
+class TokenCounter:
+    """Подсчет и обрезка по токенам: токенизатор модели или оценка по символам"""
+
+    def __init__(self, tokenizer_name: str = ""):
+        """
+        Args:
+            tokenizer_name: Путь к tokenizer.json или имя модели на Hugging Face Hub
+        """
+        self.tokenizer_name = tokenizer_name
+        self._tokenizer = None
+
+    @property
+    def exact(self) -> bool:
+        return self._tokenizer is not None
+
+    def load(self):
+        """Загружает токенизатор (может скачивать файл - вызывается при старте вне event loop)"""
+        if not self.tokenizer_name or self._tokenizer is not None:
+            return
+        try:
+            from pathlib import Path
+            from tokenizers import Tokenizer
+
+            if Path(self.tokenizer_name).is_file():
+                self._tokenizer = Tokenizer.from_file(self.tokenizer_name)
+            else:
+                self._tokenizer = Tokenizer.from_pretrained(self.tokenizer_name)
+            logger.info(f"🔤 Токенизатор {self.tokenizer_name} загружен")
+        except Exception as e:
+            logger.warning(
+                f"⚠️ Токенизатор {self.tokenizer_name} не загружен ({e}): бюджет промпта считается "
+                f"приблизительно (~{_CHARS_PER_TOKEN} символа на токен). Укажите в LLM_TOKENIZER путь "
+                f"к tokenizer.json или пустое значение, чтобы явно использовать оценку"
+            )
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._tokenizer is not None:
+            return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+        return -(-len(text) // _CHARS_PER_TOKEN)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Обрезает текст до max_tokens токенов (включая токен многоточия)"""
+        if self.count(text) <= max_tokens:
+            return text
+        if max_tokens < 2:
+            return ""
+        if self._tokenizer is not None:
+            encoding = self._tokenizer.encode(text, add_special_tokens=False)
+            end = encoding.offsets[max_tokens - 2][1]
+            return text[:end].rstrip() + _ELLIPSIS
+        return text[:max_tokens * _CHARS_PER_TOKEN - 1].rstrip() + _ELLIPSIS
+
+
+@dataclass
+class BuiltPrompt:
+    """Результат сборки: части промпта и разбивка токенов по ним"""
+    system: str
+    services: str
+    history: List[Dict]
+    token_breakdown: Dict[str, int] = field(default_factory=dict)
+
+
+class PromptBuilder:
+    """Укладывает системный промпт, услуги и историю в бюджет токенов"""
+
+    def __init__(self, counter: TokenCounter, token_budget: int):
+        """
+        Args:
+            counter: Счетчик токенов
+            token_budget: Бюджет токенов на весь промпт (без ответа модели)
+        """
+        self.counter = counter
+        self.token_budget = token_budget
+
+    def _message_tokens(self, content: str) -> int:
+        return self.counter.count(content) + MESSAGE_OVERHEAD_TOKENS
+
+    def build(
+        self,
+        system_prompt: str,
+        user_message: str,
+        found_services: ServicesContext = "",
+        conversation_history: Optional[List[Dict]] = None,
+        services_title: str = ""
+    ) -> BuiltPrompt:
+        """
+        Собирает части промпта в бюджет
+
+        Args:
+            system_prompt: Системный промпт (всегда целиком)
+            user_message: Вопрос пользователя (всегда целиком)
+            found_services: Услуги по убыванию релевантности (строка - один фрагмент)
+            conversation_history: История диалога, старые сообщения первыми
+            services_title: Заголовок блока услуг (входит в бюджет услуг)
+
+        Returns:
+            BuiltPrompt с разбивкой токенов: system, user, services, history,
+            total и dropped (сколько токенов не вошло)
+        """
+        system_tokens = self._message_tokens(system_prompt)
+        user_tokens = self._message_tokens(user_message)
+        remaining = self.token_budget - system_tokens - user_tokens
+        dropped = 0
+
+        if remaining < 0:
+            logger.warning(
+                f"⚠️ Системный промпт и вопрос ({system_tokens + user_tokens} ток.) "
+                f"не помещаются в бюджет {self.token_budget}"
+            )
+
+        # Услуги: по релевантности, целиком или до заголовка
+        blocks = [ContextBlock(found_services)] if isinstance(found_services, str) else list(found_services)
+        blocks = [block for block in blocks if block.text.strip()]
+        services_parts: List[str] = []
+        services_tokens = 0
+        if blocks:
+            separator_tokens = self.counter.count("\n\n")
+            title_tokens = self.counter.count(services_title)
+            remaining -= title_tokens
+            for block in blocks:
+                block_tokens = self.counter.count(block.text) + separator_tokens
+                if block_tokens <= remaining:
+                    services_parts.append(block.text)
+                elif self.counter.count(block.header) + separator_tokens <= remaining:
+                    truncated = self.counter.truncate(block.text, remaining - separator_tokens)
+                    services_parts.append(truncated)
+                    block_tokens_used = self.counter.count(truncated) + separator_tokens
+                    dropped += block_tokens - block_tokens_used
+                    block_tokens = block_tokens_used
+                else:
+                    dropped += block_tokens
+                    continue
+                remaining -= block_tokens
+                services_tokens += block_tokens
+
+            if services_parts:
+                services_tokens += title_tokens
+            else:
+                remaining += title_tokens
+
+        # История: от новых сообщений к старым, самое старое из поместившихся может быть обрезано
+        history = conversation_history or []
+        kept_history: List[Dict] = []
+        history_tokens = 0
+        for index in range(len(history) - 1, -1, -1):
+            message = history[index]
+            message_tokens = self._message_tokens(message.get("content", ""))
+            if message_tokens <= remaining:
+                kept_history.append(message)
+                history_tokens += message_tokens
+                remaining -= message_tokens
+                continue
+
+            # Это и все более старые сообщения не помещаются целиком
+            dropped += sum(self._message_tokens(m.get("content", "")) for m in history[:index + 1])
+            available = remaining - MESSAGE_OVERHEAD_TOKENS
+            if available > 0:
+                content = self.counter.truncate(message.get("content", ""), available)
+                truncated_tokens = self._message_tokens(content)
+                kept_history.append({"role": message["role"], "content": content})
+                history_tokens += truncated_tokens
+                dropped -= truncated_tokens
+            break
+        kept_history.reverse()
+
+        breakdown = {
+            "system": system_tokens,
+            "user": user_tokens,
+            "services": services_tokens,
+            "history": history_tokens,
+            "total": system_tokens + user_tokens + services_tokens + history_tokens,
+            "dropped": dropped
+        }
+        if dropped:
+            logger.info(f"✂️ Промпт урезан до бюджета {self.token_budget} ток.: не вошло {dropped} ток.")
+
+        return BuiltPrompt(system_prompt, "\n\n".join(services_parts), kept_history, breakdown)
@@ -0,0 +1,147 @@
+"""
+Кэш ответов LLM на повторяющиеся первые вопросы.
+
+Ключ: нормализованный вопрос + id найденных услуг + хэш системного промпта +
+версия каталога услуг (после горячей перезагрузки цены и описания могли
+измениться, поэтому ответы по старому каталогу больше не выдаются).
+Опционально вопрос может совпасть не дословно, а по косинусной близости
+эмбеддингов (порог LLM_RESPONSE_CACHE_SIMILARITY). Кэш применяется только
+без истории диалога: с историей ответ зависит от всего разговора.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from src.config.settings import logger
+from src.knowledge.cache import normalize_query
+
+CacheKey = Tuple[str, Tuple[str, ...], str, int]
+
+
+class ResponseCache:
+    """LRU-кэш ответов LLM с TTL и поиском похожих вопросов"""
+
+    def __init__(self, max_size: int, ttl_seconds: float, similarity_threshold: float = 0.0):
+        """
+        Args:
+            max_size: Максимальное количество ответов (0 - кэш выключен)
+            ttl_seconds: Время жизни ответа в секундах
+            similarity_threshold: Порог косинусной близости вопросов (0 - только точное совпадение)
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.misses = 0
+
+        # ключ → (истекает, ответ, эмбеддинг вопроса)
+        self._entries: "OrderedDict[CacheKey, Tuple[float, str, Optional[np.ndarray]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def _make_key(self, user_message: str, service_ids: Sequence[str], prompt_hash: str,
+                  catalogue_version: int) -> CacheKey:
+        return (normalize_query(user_message), tuple(service_ids), prompt_hash, catalogue_version)
+
+    def get(self, user_message: str, service_ids: Sequence[str], prompt_hash: str, catalogue_version: int,
+            query_embedding: Optional[np.ndarray] = None) -> Optional[str]:
+        """
+        Ищет ответ: сначала дословно, затем (если задан порог и эмбеддинг) по близости
+
+        Returns:
+            Закэшированный ответ или None
+        """
+        if not self.enabled:
+            return None
+
+        key = self._make_key(user_message, service_ids, prompt_hash, catalogue_version)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            if query_embedding is not None and self.similarity_threshold > 0:
+                similar_key = self._find_similar(key, query_embedding, now)
+                if similar_key is not None:
+                    self._entries.move_to_end(similar_key)
+                    self.hits += 1
+                    logger.info(f"🧠 Похожий вопрос в кэше ответов: '{similar_key[0]}'")
+                    return self._entries[similar_key][1]
+
+            self.misses += 1
+            return None
+
+    def _find_similar(self, key: CacheKey, query_embedding: np.ndarray, now: float) -> Optional[CacheKey]:
+        """Ближайший по эмбеддингу вопрос с теми же услугами, промптом и версией каталога"""
+        best_key, best_similarity = None, self.similarity_threshold
+        for candidate_key, (expires_at, _, embedding) in self._entries.items():
+            if embedding is None or expires_at < now or candidate_key[1:] != key[1:]:
+                continue
+            similarity = float(np.dot(query_embedding, embedding))
+            if similarity >= best_similarity:
+                best_key, best_similarity = candidate_key, similarity
+        return best_key
+
+    def set(self, user_message: str, service_ids: Sequence[str], prompt_hash: str, catalogue_version: int,
+            response: str, query_embedding: Optional[np.ndarray] = None):
+        """Сохраняет ответ, вытесняя самые давно использованные записи"""
+        if not self.enabled:
+            return
+
+        key = self._make_key(user_message, service_ids, prompt_hash, catalogue_version)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, response, query_embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Статистика эффективности кэша ответов"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate_percent": round(self.hits / total * 100, 1) if total else 0.0
+        }
+
+
+def prior_history(conversation_history: Optional[List[Dict]], user_message: str) -> List[Dict]:
+    """
+    История без текущего вопроса и команд бота
+
+    Обработчик сохраняет вопрос в историю до вызова LLM, поэтому последний
+    элемент истории может совпадать с текущим сообщением пользователя.
+    Команды (/start, /stats) и их шаблонные ответы пишутся в историю
+    обработчиками команд, а не LLM, поэтому первый вопрос после /start
+    остается первым и обслуживается кэшем.
+    """
+    history = list(conversation_history or [])
+    if history and history[-1].get("role") == "user" and history[-1].get("content") == user_message:
+        history.pop()
+
+    prior = []
+    command_reply = False
+    for message in history:
+        if message.get("role") == "user" and message.get("content", "").startswith("/"):
+            command_reply = True
+            continue
+        if command_reply and message.get("role") == "assistant":
+            command_reply = False
+            continue
+        command_reply = False
+        prior.append(message)
+    return prior
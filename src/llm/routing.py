@@ -0,0 +1,157 @@
+"""
+Выбор модели OpenRouter и политика повторов.
+
+Модели перечисляются в LLM_MODELS в порядке предпочтения. Для каждой
+собирается статистика последних запросов (задержки, ошибки, Retry-After),
+по которой роутер решает, к какой модели идти следующей и когда
+отправлять страхующий (hedged) запрос.
+"""
+
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+import httpx
+
+# Сколько последних запросов модели учитывать в статистике
+_WINDOW = 50
+# Ошибки старше этого срока не учитываются: деградировавшая модель со временем возвращается в ротацию
+_ERROR_TTL_SECONDS = 60.0
+# Доля ошибок, после которой модель уходит в конец очереди
+_DEGRADED_ERROR_RATE = 0.5
+
+
+def is_retryable(error: Exception) -> bool:
+    """Временная ли ошибка: 429, 5xx, таймаут или сетевая ошибка"""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Значение заголовка Retry-After (в секундах) из ответа с ошибкой"""
+    if not isinstance(error, httpx.HTTPStatusError):
+        return None
+    value = error.response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None  # Формат HTTP-date не используется OpenRouter
+
+
+class ModelStats:
+    """Скользящая статистика одной модели"""
+
+    def __init__(self):
+        self.latencies_ms: Deque[float] = deque(maxlen=_WINDOW)
+        self.outcomes: Deque[Tuple[float, bool]] = deque(maxlen=_WINDOW)
+        self.unavailable_until = 0.0
+
+    @property
+    def error_rate(self) -> float:
+        cutoff = time.monotonic() - _ERROR_TTL_SECONDS
+        recent = [ok for at, ok in self.outcomes if at >= cutoff]
+        if not recent:
+            return 0.0
+        return 1 - sum(recent) / len(recent)
+
+    def p95_ms(self) -> Optional[float]:
+        if not self.latencies_ms:
+            return None
+        ordered = sorted(self.latencies_ms)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def to_dict(self) -> Dict:
+        p95 = self.p95_ms()
+        return {
+            "requests": len(self.outcomes),
+            "error_rate_percent": round(self.error_rate * 100, 1),
+            "p95_ms": round(p95, 1) if p95 is not None else None,
+            "cooldown_seconds": round(max(0.0, self.unavailable_until - time.monotonic()), 1)
+        }
+
+
+class ModelRouter:
+    """Порядок обхода моделей с учетом ошибок, задержек и Retry-After"""
+
+    def __init__(self, models: List[str], hedge_min_samples: int = 20):
+        """
+        Args:
+            models: Модели в порядке предпочтения
+            hedge_min_samples: Сколько ответов модели нужно для оценки p95
+        """
+        self.models = models
+        self.hedge_min_samples = hedge_min_samples
+        self.stats: Dict[str, ModelStats] = {model: ModelStats() for model in models}
+
+    def ordered_models(self) -> List[str]:
+        """
+        Модели в порядке обращения
+
+        Сначала здоровые в порядке предпочтения, затем деградировавшие
+        (много ошибок) и в конце - ожидающие окончания Retry-After.
+        """
+        now = time.monotonic()
+
+        def rank(item):
+            index, model = item
+            stats = self.stats[model]
+            cooling = stats.unavailable_until > now
+            degraded = stats.error_rate >= _DEGRADED_ERROR_RATE
+            return (cooling, degraded, stats.error_rate if degraded else 0.0, index)
+
+        return [model for _, model in sorted(enumerate(self.models), key=rank)]
+
+    def record_success(self, model: str, latency_ms: float):
+        stats = self.stats[model]
+        stats.latencies_ms.append(latency_ms)
+        stats.outcomes.append((time.monotonic(), True))
+
+    def record_error(self, model: str, retry_after: Optional[float] = None):
+        stats = self.stats[model]
+        stats.outcomes.append((time.monotonic(), False))
+        if retry_after:
+            stats.unavailable_until = max(stats.unavailable_until, time.monotonic() + retry_after)
+
+    def cooldown_left(self, model: str) -> float:
+        """Сколько секунд модель еще просила не обращаться к ней (Retry-After)"""
+        return max(0.0, self.stats[model].unavailable_until - time.monotonic())
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """Через сколько секунд отправлять страхующий запрос (p95 модели) или None"""
+        stats = self.stats[model]
+        if len(stats.latencies_ms) < self.hedge_min_samples:
+            return None
+        return stats.p95_ms() / 1000
+
+    def get_stats(self) -> Dict[str, Dict]:
+        return {model: stats.to_dict() for model, stats in self.stats.items()}
+
+
+class RetryPolicy:
+    """Экспоненциальная задержка с полным джиттером и учетом Retry-After"""
+
+    def __init__(self, max_retries: int, base_delay: float, max_delay: float):
+        """
+        Args:
+            max_retries: Сколько повторов после первой попытки
+            base_delay: Базовая задержка, сек
+            max_delay: Максимальная задержка (и максимальный Retry-After, который ждем), сек
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, retry: int, retry_after: Optional[float] = None) -> Optional[float]:
+        """
+        Пауза перед повтором с номером retry (с 0)
+
+        Returns:
+            Задержка в секундах или None, если сервер просит ждать дольше max_delay
+        """
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_delay else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
@@ -1,13 +1,34 @@
 import asyncio
+import resource
+import time
 from aiogram import Bot, Dispatcher
 from src.config.settings import settings, logger
 from src.bot.handlers import register_handlers
+from src.bot.states import dialog_manager
+from src.bot.summarizer import conversation_summarizer
+from src.knowledge.search import warm_up_knowledge_searcher
+from src.llm.client import llm_client
+
+
+def _peak_rss_mb() -> float:
+    """Пиковый RSS процесса в МБ (ru_maxrss в Linux указан в КБ)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
 
 
 async def main():
     """Главная функция запуска Help Bot AI"""
     
     logger.info("🚀 Запуск Help Bot AI")
+    startup_started = time.perf_counter()
+    
+    # Прогрев: модель и ChromaDB загружаются один раз до начала polling
+    await warm_up_knowledge_searcher()
+    
+    # Пул соединений к OpenRouter живет все время работы бота
+    await llm_client.start()
+    
+    # Сессии диалогов: восстановление после перезапуска и фоновые задачи
+    await dialog_manager.start()
     
     # Создание экземпляра бота
     bot = Bot(token=settings.telegram_bot_token)
@@ -18,7 +39,10 @@ async def main():
     # Регистрация обработчиков сообщений
     register_handlers(dp)
     
-    logger.info("✅ Бот запущен и готов к работе")
+    logger.info(
+        f"✅ Бот запущен и готов к работе "
+        f"(старт: {time.perf_counter() - startup_started:.1f}с, RSS: {_peak_rss_mb():.0f}МБ)"
+    )
     
     try:
         # Запуск polling (опрос серверов Telegram)
@@ -28,6 +52,9 @@ async def main():
         raise
     finally:
         logger.info("🛑 Бот остановлен")
+        await conversation_summarizer.stop()
+        await dialog_manager.stop()
+        await llm_client.close()
         await bot.session.close()
 
 
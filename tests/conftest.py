@@ -0,0 +1,8 @@
+import os
+
+# Настройки приложения валидируются при импорте src, для тестов хватит заглушек
+for _name in ("TELEGRAM_BOT_TOKEN", "OPENROUTER_API_KEY", "ONEC_API_URL",
+              "ONEC_CLIENT_ID", "ONEC_CLIENT_SECRET"):
+    os.environ.setdefault(_name, "test")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("SESSION_PERSISTENCE_DIR", "")
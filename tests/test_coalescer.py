@@ -0,0 +1,95 @@
+# Тесты объединения сообщений пользователя и отмены устаревших ответов
+import asyncio
+import pytest
+from src.bot.coalescer import RequestCoalescer, history_before
+
+
+@pytest.mark.asyncio
+async def test_stale_answer_is_cancelled_and_questions_merged():
+    coalescer = RequestCoalescer(window_ms=0)
+    answered = []
+
+    async def process(batch):
+        await asyncio.sleep(0.05)  # Генерация ответа
+        answered.append(list(batch))
+
+    first = asyncio.create_task(coalescer.submit("1", "m1", process))
+    await asyncio.sleep(0.01)
+    await asyncio.gather(first, coalescer.submit("1", "m2", process))
+
+    assert answered == [["m1", "m2"]]
+
+
+@pytest.mark.asyncio
+async def test_delivered_answer_is_not_answered_again():
+    coalescer = RequestCoalescer(window_ms=0)
+    delivered = []
+
+    async def send(batch):
+        await asyncio.sleep(0.05)  # Отправка в Telegram
+        delivered.append(list(batch))
+
+    async def process(batch):
+        await asyncio.sleep(0.02)  # Генерация ответа
+        coalescer.mark_answered("1", batch)
+        await asyncio.shield(send(batch))
+
+    first = asyncio.create_task(coalescer.submit("1", "m1", process))
+    await asyncio.sleep(0.04)  # Новое сообщение приходит во время отправки первого ответа
+    await asyncio.gather(first, coalescer.submit("1", "m2", process))
+    await asyncio.sleep(0.1)
+
+    assert sorted(delivered) == [["m1"], ["m2"]]
+
+
+@pytest.mark.asyncio
+async def test_first_message_is_not_delayed():
+    coalescer = RequestCoalescer(window_ms=1000)
+    answered = []
+
+    async def process(batch):
+        answered.append(list(batch))
+
+    await asyncio.wait_for(coalescer.submit("1", "m1", process), timeout=0.5)
+    assert answered == [["m1"]]
+
+
+@pytest.mark.asyncio
+async def test_messages_during_processing_wait_for_window():
+    coalescer = RequestCoalescer(window_ms=50)
+    answered = []
+
+    async def process(batch):
+        await asyncio.sleep(0.05)  # Генерация ответа
+        answered.append(list(batch))
+
+    first = asyncio.create_task(coalescer.submit("1", "m1", process))
+    await asyncio.sleep(0.01)
+    second = asyncio.create_task(coalescer.submit("1", "m2", process))
+    await asyncio.sleep(0.02)  # Третье сообщение приходит в окне объединения второго
+    await asyncio.gather(first, second, coalescer.submit("1", "m3", process))
+
+    assert answered == [["m1", "m2", "m3"]]
+
+
+def test_history_before_strips_current_questions():
+    history = [
+        {"role": "user", "content": "Есть курсы для детей?"},
+        {"role": "assistant", "content": "Да, с 10 лет."},
+        {"role": "user", "content": "А сколько стоит?"},
+        {"role": "user", "content": "И где проходят?"},
+    ]
+    assert history_before(history, ["А сколько стоит?", "И где проходят?"]) == history[:2]
+
+
+def test_history_before_with_answer_saved_after_new_question():
+    # Новый вопрос записан в историю, пока отправлялся ответ на предыдущий
+    history = [
+        {"role": "user", "content": "Есть курсы для детей?"},
+        {"role": "user", "content": "А сколько стоит?"},
+        {"role": "assistant", "content": "Да, с 10 лет."},
+    ]
+    assert history_before(history, ["А сколько стоит?"]) == [
+        {"role": "user", "content": "Есть курсы для детей?"},
+        {"role": "assistant", "content": "Да, с 10 лет."},
+    ]
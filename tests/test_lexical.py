@@ -0,0 +1,71 @@
+# Тесты лексического поиска BM25
+import json
+import pytest
+from src.knowledge.catalogue import ServiceCatalogue
+from src.knowledge.lexical import BM25Index, stem
+
+DOCUMENTS = {
+    "kids_fpv": "Курс FPV для ребенка от 10 лет: первые полеты на симуляторе",
+    "programming": "Программирование дронов на Python для подростков",
+    "show": "Шоу дронов для корпоративного праздника",
+}
+
+
+def test_noun_forms_share_stem():
+    assert {stem(word) for word in ("ребенок", "ребенка", "ребенку", "ребенком")} == {"ребенк"}
+    assert stem("курсы") == stem("курсов") == stem("курс")
+
+
+def test_distinct_words_do_not_collide():
+    # Основа не обрезается до фиксированной длины
+    assert stem("программирование") != stem("программа")
+    assert stem("детский") != stem("дети")
+
+
+def test_query_in_other_form_finds_document():
+    index = BM25Index()
+    index.build(DOCUMENTS)
+    assert index.is_known("ребенок")
+    assert index.search("ребенок", 3)[0][0] == "kids_fpv"
+
+
+def test_normalized_relevance_is_below_one_for_partial_match():
+    index = BM25Index()
+    index.build(DOCUMENTS)
+    hits = index.search("шоу ребенок", 3, normalize=True)
+    # Каждый документ совпадает только с одним словом запроса
+    assert len(hits) == 2
+    assert all(0 < relevance < 0.7 for _, relevance in hits)
+    assert [doc_id for doc_id, _ in hits] == [doc_id for doc_id, _ in index.search("шоу ребенок", 3)]
+
+
+def test_exact_full_match_scores_higher_than_partial():
+    index = BM25Index()
+    index.build(DOCUMENTS)
+    full = index.search("шоу дронов", 1, normalize=True)[0]
+    partial = index.search("шоу ребенок", 1, normalize=True)[0]
+    assert full[0] == "show"
+    assert partial[1] < full[1] <= 1.0
+
+
+def test_keyword_fast_path_reports_bm25_relevance(tmp_path):
+    search = pytest.importorskip("src.knowledge.search")  # Нужен sentence-transformers
+    services = [
+        {"id": service_id, "name": text, "category": "Курсы", "courseCode": service_id.upper()}
+        for service_id, text in DOCUMENTS.items()
+    ]
+    services_file = tmp_path / "services.json"
+    services_file.write_text(json.dumps({"services": services}), encoding="utf-8")
+
+    # Поисковик без модели и векторной БД: быстрый путь их не использует
+    searcher = search.KnowledgeSearcher.__new__(search.KnowledgeSearcher)
+    searcher.catalogue = ServiceCatalogue(str(services_file), check_interval=3600)
+    searcher.lexical_index = BM25Index()
+    searcher._build_lexical_index()
+
+    found = searcher._search_lexical("ребенок", 3)
+    assert [service["id"] for service in found] == ["kids_fpv"]
+    assert 0 < found[0]["relevance_score"] < 100
+
+    # Дословный код курса - единственный случай со 100%
+    assert searcher._search_lexical("KIDS_FPV", 3)[0]["relevance_score"] == 100.0
@@ -0,0 +1,27 @@
+# Тесты агрегатов статистики LLM
+import time
+from src.llm.logger import LLMLogger
+
+
+def _context(user_id: str) -> dict:
+    now = time.time()
+    return {
+        "timestamp": now, "start_time": now, "user_id": user_id, "model": "test/model",
+        "request_size_chars": 100, "messages_count": 2, "has_context": True, "has_history": False
+    }
+
+
+def test_rejections_are_not_failures():
+    llm_logger = LLMLogger()
+    llm_logger.log_success(_context("1"), {"usage": {"total_tokens": 10}}, "Ответ")
+    llm_logger.log_error(_context("2"), "timeout", "Нет ответа")
+    llm_logger.log_rejected(_context("3"), "queue_timeout", "Очередь переполнена")
+    llm_logger.log_rejected(_context("4"), "queue_timeout", "Очередь переполнена")
+
+    stats = llm_logger.get_statistics(hours=1)
+    assert stats["total_requests"] == 4
+    assert stats["failed_requests"] == 1
+    assert stats["rejected_requests"] == 2
+    assert stats["success_rate_percent"] == 50.0
+    assert stats["error_breakdown"] == {"timeout": 1}
+    assert stats["rejection_breakdown"] == {"queue_timeout": 2}
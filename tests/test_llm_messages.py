@@ -0,0 +1,34 @@
+# Тесты раскладки промпта по сообщениям API
+from src.config.settings import settings
+from src.llm.client import LLMClient
+from src.llm.prompt_builder import ContextBlock
+
+SUMMARY = {"role": "system", "content": "Краткое содержание предыдущего диалога:\nКлиент ищет курс для ребенка 12 лет."}
+HISTORY = [
+    SUMMARY,
+    {"role": "user", "content": "А есть что-то попроще?"},
+    {"role": "assistant", "content": "Да, базовый курс FPV."},
+]
+SERVICES = [ContextBlock("Услуга: FPV\nЦена: 10 000 ₽\n", "Услуга: FPV\n")]
+
+
+def test_split_layout_keeps_single_leading_system_message(monkeypatch):
+    monkeypatch.setattr(settings, "llm_message_layout", "split")
+    client = LLMClient()
+    messages, _ = client._build_messages("Сколько стоит?", SERVICES, HISTORY)
+
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "user", "user"]
+    assert messages[0]["content"] == client.system_prompt
+    context = messages[-2]["content"]
+    assert context.startswith(SUMMARY["content"]) and "Цена: 10 000 ₽" in context
+    assert messages[-1] == {"role": "user", "content": "Сколько стоит?"}
+
+
+def test_inline_layout_folds_summary_into_system_prompt(monkeypatch):
+    monkeypatch.setattr(settings, "llm_message_layout", "inline")
+    client = LLMClient()
+    messages, _ = client._build_messages("Сколько стоит?", SERVICES, HISTORY)
+
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "user"]
+    assert SUMMARY["content"] in messages[0]["content"]
+    assert "Цена: 10 000 ₽" in messages[0]["content"]
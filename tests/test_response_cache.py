@@ -0,0 +1,68 @@
+# Тесты кэша ответов LLM на первые вопросы
+import json
+import pytest
+from src.knowledge.catalogue import ServiceCatalogue
+from src.llm.client import LLMClient
+from src.llm.response_cache import ResponseCache, prior_history
+
+WELCOME = "🎯 Привет! Я ваш персональный консультант Академии дронов."
+
+
+def test_prior_history_skips_current_question():
+    history = [{"role": "user", "content": "Сколько стоит курс?"}]
+    assert prior_history(history, "Сколько стоит курс?") == []
+
+
+def test_prior_history_skips_command_exchanges():
+    history = [
+        {"role": "user", "content": "/start"},
+        {"role": "assistant", "content": WELCOME},
+        {"role": "user", "content": "Сколько стоит курс?"},
+    ]
+    assert prior_history(history, "Сколько стоит курс?") == []
+
+
+def test_prior_history_keeps_real_dialog():
+    history = [
+        {"role": "user", "content": "/start"},
+        {"role": "assistant", "content": WELCOME},
+        {"role": "user", "content": "Есть курсы для детей?"},
+        {"role": "assistant", "content": "Да, с 10 лет."},
+        {"role": "user", "content": "Сколько стоит курс?"},
+    ]
+    assert [m["content"] for m in prior_history(history, "Сколько стоит курс?")] == [
+        "Есть курсы для детей?", "Да, с 10 лет."
+    ]
+
+
+@pytest.mark.asyncio
+async def test_cached_answer_after_start():
+    client = LLMClient()
+    question = "Сколько стоит курс?"
+    client.response_cache.set(question, ["fpv_basic"], client.system_prompt_hash, 0, "Курс стоит 10 000 ₽.")
+
+    history = [
+        {"role": "user", "content": "/start"},
+        {"role": "assistant", "content": WELCOME},
+        {"role": "user", "content": question},
+    ]
+    answer = await client.generate_response(
+        question, "", history, user_id="42", service_ids=["fpv_basic"]
+    )
+    assert answer == "Курс стоит 10 000 ₽."
+
+
+def test_catalogue_reload_misses_cached_answer(tmp_path):
+    services_file = tmp_path / "services.json"
+    service = {"id": "fpv_basic", "name": "FPV", "category": "Курсы", "details": {"Цена": "10 000 ₽"}}
+    services_file.write_text(json.dumps({"services": [service]}), encoding="utf-8")
+    catalogue = ServiceCatalogue(str(services_file), check_interval=0)
+    cache = ResponseCache(max_size=8, ttl_seconds=60)
+    question = "Сколько стоит курс?"
+    cache.set(question, ["fpv_basic"], "prompt", catalogue.version, "Курс стоит 10 000 ₽.")
+    assert cache.get(question, ["fpv_basic"], "prompt", catalogue.version) == "Курс стоит 10 000 ₽."
+
+    # Цена изменилась в файле, каталог перезагружен без рестарта
+    services_file.write_text(json.dumps({"services": [{**service, "details": {"Цена": "12 000 ₽"}}]}), encoding="utf-8")
+    catalogue.reload()
+    assert cache.get(question, ["fpv_basic"], "prompt", catalogue.version) is None
@@ -0,0 +1,47 @@
+# Тесты микробатчинга поисковых запросов
+import asyncio
+import pytest
+from src.knowledge.batching import SearchBatcher
+
+
+class FakeSearcher:
+    """Поисковик, запоминающий пакеты search_many"""
+
+    def __init__(self):
+        self.batches = []
+
+    def search_many(self, queries, limit):
+        self.batches.append(list(queries))
+        return [[{"query": query, "limit": limit}] for query in queries]
+
+    async def _run_in_pool(self, func, *args):
+        return func(*args)
+
+
+def test_concurrent_searches_share_one_batch():
+    searcher = FakeSearcher()
+    batcher = SearchBatcher(searcher, window_ms=10, max_batch_size=8)
+
+    async def main():
+        return await asyncio.gather(batcher.search("дрон", 3), batcher.search("курс", 3))
+
+    results = asyncio.run(main())
+    assert searcher.batches == [["дрон", "курс"]]
+    assert [found[0]["query"] for found in results] == ["дрон", "курс"]
+
+
+def test_batcher_works_across_event_loops():
+    searcher = FakeSearcher()
+    batcher = SearchBatcher(searcher, window_ms=50, max_batch_size=8)
+
+    # Первый loop завершается раньше, чем сработал таймер отправки его батча
+    async def abandoned():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(batcher.search("первый", 3), timeout=0.001)
+
+    asyncio.run(abandoned())
+
+    # Глобальный поисковик переживает loop: второй loop получает свою очередь и таймер
+    found = asyncio.run(asyncio.wait_for(batcher.search("второй", 3), timeout=1))
+    assert found[0]["query"] == "второй"
+    assert searcher.batches == [["второй"]]
@@ -0,0 +1,29 @@
+# Тесты снимка и журнала сессий в памяти
+import pytest
+from src.bot.session_persistence import SessionPersistence
+from src.bot.session_store import InMemorySessionStore
+
+
+def make_persistence(directory) -> SessionPersistence:
+    store = InMemorySessionStore()
+    persistence = SessionPersistence(store, str(directory), snapshot_interval=3600, flush_interval=3600)
+    persistence.restore()
+    return persistence
+
+
+@pytest.mark.asyncio
+async def test_restore_replays_last_activity_from_messages(tmp_path):
+    persistence = make_persistence(tmp_path)
+    store = persistence.store
+    for user_id in ("1", "2"):
+        store.save_fields(user_id, {"state": "consultation", "created_at": 100.0, "last_activity": 100.0})
+    await persistence.snapshot()
+
+    # После снимка пишет только первый пользователь: его сессия становится самой свежей
+    store.touch("1", 250.0)
+    store.append_message("1", "user", "Сколько стоит курс?", 250.0)
+    await persistence.flush()
+
+    rows = make_persistence(tmp_path).store.snapshot_rows()
+    # Строки идут в порядке активности: user_id, ..., last_activity (7-е поле)
+    assert [(row[0], row[6]) for row in rows] == [("2", 100.0), ("1", 250.0)]
@@ -0,0 +1,98 @@
+# Тесты хранилищ сессий диалогов
+import json
+import pytest
+from src.bot.session_store import RedisSessionStore
+from src.bot.states import MAX_MESSAGES, DialogStateManager
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def make_redis_manager(server) -> DialogStateManager:
+    """Менеджер сессий поверх Redis; общий server - как несколько процессов бота"""
+    return DialogStateManager(store=RedisSessionStore(fakeredis.FakeRedis(server=server, decode_responses=True)))
+
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def redis_manager(redis_server):
+    return make_redis_manager(redis_server)
+
+
+def test_session_fields_roundtrip(redis_manager):
+    redis_manager.set_state("42", "payment_request")
+    redis_manager.set_selected_course("42", {"id": "fpv_basic", "name": "FPV"})
+    redis_manager.set_contact_info("42", name="Иван", phone="+79990000000")
+
+    session = redis_manager.get_session("42")
+    assert session["state"] == "payment_request"
+    assert session["selected_course"] == {"id": "fpv_basic", "name": "FPV"}
+    assert redis_manager.get_contact_info("42") == {"name": "Иван", "phone": "+79990000000"}
+
+
+def test_history_keeps_last_messages(redis_manager):
+    for i in range(MAX_MESSAGES + 5):
+        redis_manager.add_message("42", "user" if i % 2 == 0 else "assistant", f"сообщение {i}")
+
+    history = redis_manager.get_conversation_history("42", limit=MAX_MESSAGES + 5)
+    assert len(history) == MAX_MESSAGES
+    assert history[-1] == {"role": "user", "content": f"сообщение {MAX_MESSAGES + 4}"}
+    assert redis_manager.get_conversation_history("42", limit=2)[0]["content"] == f"сообщение {MAX_MESSAGES + 3}"
+
+
+def test_sessions_shared_between_processes(redis_server):
+    first, second = make_redis_manager(redis_server), make_redis_manager(redis_server)
+    first.add_message("42", "user", "Есть курсы для детей?")
+    first.set_state("42", "manager_request")
+
+    assert second.get_state("42") == "manager_request"
+    assert second.get_conversation_history("42") == [{"role": "user", "content": "Есть курсы для детей?"}]
+
+
+def test_clear_session_and_stats(redis_manager):
+    redis_manager.get_session("1")
+    redis_manager.set_state("2", "payment_request")
+    assert redis_manager.get_session_stats()["total_sessions"] == 2
+
+    redis_manager.clear_session("2")
+    stats = redis_manager.get_session_stats()
+    assert stats["total_sessions"] == 1
+    assert stats["states_distribution"] == {"consultation": 1}
+
+
+def test_find_session_missing_user_leaves_no_stub(redis_manager):
+    assert redis_manager.find_session("42") is None
+    assert redis_manager.store.client.exists(redis_manager.store._fields_key("42")) == 0
+    assert redis_manager.get_state("42") == "consultation"
+
+
+def test_partial_hash_is_treated_as_missing(redis_manager):
+    # Заготовка, оставшаяся после истечения ключа между чтением и записью
+    redis_manager.store.client.hset(redis_manager.store._fields_key("42"), "last_activity", json.dumps(1.0))
+    assert redis_manager.find_session("42") is None
+    assert redis_manager.get_state("42") == "consultation"
+    assert redis_manager.get_session("42")["summary"] == ""
+
+
+def test_set_summary_skips_missing_session(redis_manager):
+    redis_manager.set_summary("42", "сводка", 2)
+    assert redis_manager.find_session("42") is None
+
+
+def test_stats_follow_state_index(redis_server):
+    store = RedisSessionStore(fakeredis.FakeRedis(server=redis_server, decode_responses=True), idle_ttl=3600)
+    manager = DialogStateManager(store=store)
+    manager.get_session("1")
+    manager.set_state("2", "payment_request")
+    manager.set_state("2", "manager_request")
+    # Хэш без state (заготовка) в статистику не попадает
+    store.client.hset(store._fields_key("3"), "last_activity", json.dumps(1.0))
+    assert store.stats()["states"] == {"consultation": 1, "manager_request": 1}
+
+    manager.clear_session("1")
+    # Сессия, истекшая в Redis, выпадает из индекса по last_activity
+    store.client.zadd(store._state_index_key("manager_request"), {"2": 1.0})
+    assert store.stats()["states"] == {}